@@ -1,8 +1,107 @@
-from typing import Dict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Text, Tuple
 import mlflow
+import numpy as np
 from tensorflow.keras.callbacks import Callback
+from tensorflow.keras.models import Model
+
+from collegium.foundation.mosaic import tile_mosaic
+from collegium.foundation.video import FrameEncoder
 
 
 class MlflowCallback(Callback):
     def on_epoch_end(self, epoch: int, logs: Dict[str, float]):
         mlflow.log_metrics(metrics=logs, step=epoch)
+
+
+class SampleGridCallback(Callback):
+    """
+    Samples a generator on a fixed latent batch every N training steps,
+    so the progress of a GAN can be watched on the same latent points.
+
+    The samples are predicted in a single predict_on_batch call.
+    Tiling them into a mosaic and writing it to the encoder and MLflow
+    happens on a background thread, which keeps the training step short.
+    The thread lives for one fit: it starts on train begin, and on train end
+    it is shut down once the pending mosaics are written.
+    """
+
+    def __init__(
+        self,
+        generator: Model,
+        latent: np.ndarray,
+        every_n_steps: int = 100,
+        encoder: Optional[FrameEncoder] = None,
+        mlflow_artifact_dir: Optional[Text] = None,
+        value_range: Tuple[float, float] = (0, 1),
+        ncols: Optional[int] = None,
+        max_pending: int = 2,
+    ):
+        """
+        :param generator: the model that maps the latent batch to images
+        :param latent: the fixed latent batch, such as np.random.default_rng(0).normal(size=(25, 100))
+        :param encoder: receives each mosaic as a frame, such as open_encoder("samples.gif")
+        :param mlflow_artifact_dir: logs each mosaic as an MLflow image artifact in this folder
+        :param value_range: the range of the generator's output, such as (-1, 1) for tanh
+        :param ncols: the number of samples in a row of the mosaic, defaults to a square grid
+        :param max_pending: the number of mosaics waiting to be written before the training waits
+        """
+        super().__init__()
+        self.generator = generator
+        self.latent = latent
+        self.every_n_steps = every_n_steps
+        self.encoder = encoder
+        self.mlflow_artifact_dir = mlflow_artifact_dir
+        self.value_range = value_range
+        self.ncols = ncols
+        self.max_pending = max_pending
+
+        self.step = 0
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.pending: List[Future] = []
+
+    def to_mosaic(self, samples: np.ndarray) -> np.ndarray:
+        low, high = self.value_range
+        pixels = np.clip((samples - low) / (high - low) * 255, 0, 255).astype(np.uint8)
+
+        mosaic = tile_mosaic(pixels, self.ncols)
+        if mosaic.ndim == 2 or mosaic.shape[-1] == 1:
+            mosaic = np.repeat(mosaic.reshape(*mosaic.shape[:2], 1), 3, axis=-1)
+        return mosaic
+
+    def write_mosaic(self, step: int, samples: np.ndarray) -> np.ndarray:
+        mosaic = self.to_mosaic(samples)
+
+        if self.encoder is not None:
+            self.encoder.write(mosaic)
+        if self.mlflow_artifact_dir is not None:
+            mlflow.log_image(mosaic, artifact_file=f"{self.mlflow_artifact_dir}/step_{step:07d}.png")
+        return mosaic
+
+    def wait(self, max_pending: int = 0):
+        """
+        Waits until at most max_pending mosaics are still being written,
+        and raises the errors of the written ones.
+        """
+        while len(self.pending) > max_pending:
+            self.pending.pop(0).result()
+
+    def on_train_begin(self, logs: Optional[Dict[str, float]] = None):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def on_train_batch_end(self, batch: int, logs: Optional[Dict[str, float]] = None):
+        self.step += 1
+        if self.step % self.every_n_steps != 0:
+            return
+
+        samples = np.asarray(self.generator.predict_on_batch(self.latent))
+        self.wait(self.max_pending - 1)
+        self.pending.append(self.executor.submit(self.write_mosaic, self.step, samples))
+
+    def on_train_end(self, logs: Optional[Dict[str, float]] = None):
+        try:
+            self.wait()
+        finally:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+            self.pending = []
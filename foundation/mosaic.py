@@ -0,0 +1,147 @@
+import math
+from typing import Optional, Sequence, Text
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+def rescale_sigmoid(x: np.ndarray, axis: Sequence[int]) -> np.ndarray:
+    """
+    Rescales the array to std = 1 over the given axes,
+    and then applies sigmoid to fit the values into (0, 1) range.
+
+    All the channels are rescaled in a single vectorized pass.
+    Slices with zero std are left unscaled.
+    """
+    x = np.asarray(x, dtype=np.float32)
+    std = x.std(axis=tuple(axis), keepdims=True)
+    std[std == 0] = 1
+    return 1 / (1 + np.exp(-x / std))
+
+
+def default_pad_value(tiles: np.ndarray):
+    """
+    Picks a padding value that renders as background:
+    NaN for single-channel floats (drawn as transparent by a colormap),
+    white for everything else.
+    """
+    if np.issubdtype(tiles.dtype, np.integer):
+        return np.iinfo(tiles.dtype).max
+    if tiles.ndim == 3:
+        return np.nan
+    return 1.0
+
+
+def tile_mosaic(
+    tiles: np.ndarray,
+    ncols: Optional[int] = None,
+    padding: int = 1,
+    pad_value=None,
+) -> np.ndarray:
+    """
+    Tiles a batch of images into a single image.
+
+    :param tiles: the array of shape (tile, height, width) or (tile, height, width, channels)
+    :param ncols: the number of tiles in a row, defaults to a square grid
+    :param padding: the number of pixels between the tiles and around the border
+    :param pad_value: the value of the padding pixels, see default_pad_value
+    :return: the array of shape (rows * (height + padding) + padding, cols * (width + padding) + padding, ...)
+    """
+    tiles = np.asarray(tiles)
+    if tiles.dtype == np.float16:
+        tiles = tiles.astype(np.float32)
+
+    n, height, width = tiles.shape[:3]
+    channels = tiles.shape[3:]
+
+    if ncols is None:
+        ncols = math.ceil(math.sqrt(n))
+    nrows = math.ceil(n / ncols)
+
+    if pad_value is None:
+        pad_value = default_pad_value(tiles)
+
+    # Each cell carries its top and left padding,
+    # the bottom and right border is added at the end.
+    cells = np.full(
+        (nrows * ncols, height + padding, width + padding, *channels),
+        pad_value,
+        dtype=tiles.dtype,
+    )
+    cells[:n, padding:, padding:] = tiles
+
+    cells = cells.reshape(nrows, ncols, height + padding, width + padding, *channels)
+    cells = cells.swapaxes(1, 2)
+    mosaic = cells.reshape(nrows * (height + padding), ncols * (width + padding), *channels)
+
+    border = [(0, padding), (0, padding)] + [(0, 0)] * len(channels)
+    return np.pad(mosaic, border, constant_values=pad_value)
+
+
+def plot_mosaic(
+    tiles: np.ndarray,
+    labels: Optional[Sequence[Text]] = None,
+    ncols: Optional[int] = None,
+    padding: int = 1,
+    side_inches: float = 2,
+    max_inches: float = 24,
+    **imshow_kwargs,
+) -> None:
+    """
+    Plots a batch of images as a grid with a single imshow.
+
+    The figure is sized at side_inches per tile,
+    but never wider or taller than max_inches.
+
+    :param tiles: see tile_mosaic
+    :param labels: optional list of labels for each tile
+    :param imshow_kwargs: passed to plt.imshow, such as cmap, vmin and vmax
+    """
+    tiles = np.asarray(tiles)
+    n, height, width = tiles.shape[:3]
+
+    if ncols is None:
+        ncols = math.ceil(math.sqrt(n))
+    nrows = math.ceil(n / ncols)
+
+    mosaic = tile_mosaic(tiles, ncols, padding)
+
+    scale = min(1, max_inches / (side_inches * max(ncols, nrows)))
+    plt.figure(figsize=[side_inches * ncols * scale, side_inches * nrows * scale])
+    plt.imshow(mosaic, interpolation="nearest", **imshow_kwargs)
+    plt.xticks([])
+    plt.yticks([])
+
+    if labels is not None:
+        for idx, label in enumerate(labels[:n]):
+            row, col = divmod(idx, ncols)
+            plt.text(
+                col * (width + padding) + padding,
+                row * (height + padding) + padding,
+                str(label),
+                fontsize=8,
+                verticalalignment="top",
+                bbox=dict(facecolor="white", alpha=0.7, linewidth=0, pad=1),
+            )
+
+    plt.tight_layout()
+
+
+def save_mosaic(
+    tiles: np.ndarray,
+    path: Text,
+    ncols: Optional[int] = None,
+    padding: int = 1,
+    **imsave_kwargs,
+) -> np.ndarray:
+    """
+    Writes a batch of images as a single grid image, without building a figure.
+
+    :param tiles: see tile_mosaic
+    :param path: the output path, the format is inferred from the extension
+    :param imsave_kwargs: passed to plt.imsave, such as cmap, vmin and vmax
+    :return: the mosaic array
+    """
+    mosaic = tile_mosaic(tiles, ncols, padding)
+    plt.imsave(path, mosaic, **imsave_kwargs)
+    return mosaic
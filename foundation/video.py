@@ -0,0 +1,229 @@
+import abc
+import os
+import queue
+import re
+import subprocess
+import threading
+from typing import Iterable, List, Optional, Text
+
+import numpy as np
+from PIL import Image
+
+
+class FrameEncoder(abc.ABC):
+    """
+    Encodes RGB frames into an animation file one frame at a time.
+
+    Frames are arrays of shape (height, width, 3),
+    either uint8 in [0, 255] or floats in [0, 1].
+    """
+
+    def __init__(self, path: Text, fps: float = 10):
+        self.path = path
+        self.fps = fps
+        self.frame_count = 0
+
+    @abc.abstractmethod
+    def write(self, frame: np.ndarray) -> None:
+        pass
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "FrameEncoder":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def to_uint8(frame: np.ndarray) -> np.ndarray:
+    """
+    Converts a frame of floats in [0, 1] or integers in [0, 255] to uint8.
+    """
+    frame = np.asarray(frame)
+    if frame.dtype == np.uint8:
+        return frame
+    if np.issubdtype(frame.dtype, np.floating):
+        frame = frame * 255
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+class PillowEncoder(FrameEncoder):
+    """
+    Encodes GIF or WebP animations with Pillow.
+
+    GIF frames are quantized to a palette as they arrive,
+    so only one byte per pixel is kept until the file is written on close.
+    """
+
+    def __init__(self, path: Text, fps: float = 10, loop: int = 0):
+        super().__init__(path, fps)
+        self.loop = loop
+        self.palette = path.lower().endswith(".gif")
+        self.frames: List[Image.Image] = []
+
+    def write(self, frame: np.ndarray) -> None:
+        image = Image.fromarray(to_uint8(frame)).convert("RGB")
+        if self.palette:
+            image = image.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+        self.frames.append(image)
+        self.frame_count += 1
+
+    def close(self) -> None:
+        if len(self.frames) == 0:
+            return
+
+        first, *rest = self.frames
+        first.save(
+            self.path,
+            save_all=True,
+            append_images=rest,
+            duration=round(1000 / self.fps),
+            loop=self.loop,
+        )
+        self.frames = []
+
+
+class FfmpegEncoder(FrameEncoder):
+    """
+    Encodes MP4 video by piping raw frames into an ffmpeg process.
+
+    The ffmpeg process is started on the first frame,
+    when the frame size becomes known.
+    """
+
+    def __init__(self, path: Text, fps: float = 10, codec: Text = "libx264"):
+        super().__init__(path, fps)
+        self.codec = codec
+        self.process: Optional[subprocess.Popen] = None
+
+    def _start(self, height: int, width: int):
+        self.process = subprocess.Popen(
+            [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-f", "rawvideo", "-pix_fmt", "rgb24",
+                "-s", f"{width}x{height}", "-r", str(self.fps),
+                "-i", "-",
+                # yuv420p requires even frame sizes.
+                "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                "-vcodec", self.codec, "-pix_fmt", "yuv420p",
+                self.path,
+            ],
+            stdin=subprocess.PIPE,
+        )
+
+    def write(self, frame: np.ndarray) -> None:
+        frame = to_uint8(frame)
+        if self.process is None:
+            self._start(frame.shape[0], frame.shape[1])
+        self.process.stdin.write(np.ascontiguousarray(frame[:, :, :3]).tobytes())
+        self.frame_count += 1
+
+    def close(self) -> None:
+        if self.process is None:
+            return
+
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to encode {self.path}")
+        self.process = None
+
+
+def open_encoder(path: Text, fps: float = 10) -> FrameEncoder:
+    """
+    Opens an encoder for the file's extension: .gif, .webp or .mp4.
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension in (".gif", ".webp"):
+        return PillowEncoder(path, fps)
+    if extension == ".mp4":
+        return FfmpegEncoder(path, fps)
+
+    raise ValueError(f"Unsupported animation format {extension}, expected .gif, .webp or .mp4")
+
+
+class BackgroundEncoder(FrameEncoder):
+    """
+    Wraps an encoder to encode the frames on a background thread.
+
+    write() only copies the frame into a bounded queue, so the training loop
+    is not blocked by the encoding, unless the queue is full.
+    Errors of the encoder are raised on the next write() or on close().
+    """
+
+    def __init__(self, encoder: FrameEncoder, max_queue: int = 8):
+        super().__init__(encoder.path, encoder.fps)
+        self.encoder = encoder
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            # After an error, the frames are drained without encoding, so write() never blocks forever.
+            if self.error is not None:
+                continue
+            try:
+                self.encoder.write(frame)
+            except BaseException as e:
+                self.error = e
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise RuntimeError(f"Failed to encode {self.path}") from self.error
+
+    def write(self, frame: np.ndarray) -> None:
+        self._raise_error()
+        # Copies the frame, since the caller may reuse its buffer.
+        self.queue.put(np.array(frame))
+        self.frame_count += 1
+
+    def write_all(self, frames: Iterable[np.ndarray]) -> None:
+        for frame in frames:
+            self.write(frame)
+
+    def close(self) -> None:
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+            if self.error is None:
+                try:
+                    self.encoder.close()
+                except BaseException as e:
+                    self.error = e
+        self._raise_error()
+
+
+def open_writer(path: Text, fps: float = 10, max_queue: int = 8) -> BackgroundEncoder:
+    """
+    Opens an encoder for the file's extension that encodes on a background thread.
+    """
+    return BackgroundEncoder(open_encoder(path, fps), max_queue)
+
+
+def make_run_folder(prefix: Text, parent: Text = ".") -> Text:
+    """
+    Creates the next numbered folder {prefix}{id} in the parent folder, such as gan_run3.
+
+    The folder is created with os.makedirs, which fails if it already exists,
+    so concurrent runs never share a folder.
+    """
+    os.makedirs(parent, exist_ok=True)
+    pattern = re.compile(re.escape(prefix) + r"(\d+)$")
+    ids = [int(m.group(1)) for m in map(pattern.match, os.listdir(parent)) if m is not None]
+    next_id = max(ids, default=-1) + 1
+
+    while True:
+        folder = os.path.join(parent, f"{prefix}{next_id}")
+        try:
+            os.makedirs(folder)
+            return folder
+        except FileExistsError:
+            next_id += 1
@@ -0,0 +1,223 @@
+import os
+import time
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+
+from collegium.m02_cnn.utils.clip_embeddings import normalize, top_k
+
+
+def spherical_kmeans(
+    x: np.ndarray,
+    n_clusters: int,
+    n_iter: int = 20,
+    seed: Optional[int] = None,
+    chunk_size: int = 65536,
+) -> np.ndarray:
+    """
+    Clusters unit vectors by cosine similarity with Lloyd's algorithm,
+    keeping the centroids on the unit sphere.
+
+    :return: the centroids of shape (n_clusters, dim)
+    """
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), n_clusters, replace=False)].astype(np.float32)
+
+    for _ in range(n_iter):
+        labels = assign(x, centroids, chunk_size)
+        members = sparse.csr_matrix((np.ones(len(x)), (labels, np.arange(len(x)))), shape=(n_clusters, len(x)))
+        sums = np.asarray(members @ x, dtype=np.float32)
+
+        # Empty clusters restart from random points.
+        empty = np.bincount(labels, minlength=n_clusters) == 0
+        sums[empty] = x[rng.choice(len(x), empty.sum())]
+        centroids = normalize(sums)
+
+    return centroids
+
+
+def assign(x: np.ndarray, centroids: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+    """
+    Returns the most similar centroid of each vector, in chunks to bound the memory.
+    """
+    labels = np.zeros(len(x), dtype=np.int64)
+    for start in range(0, len(x), chunk_size):
+        chunk = np.asarray(x[start:start + chunk_size], dtype=np.float32)
+        labels[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+class IVFIndex:
+    """
+    Inverted file index for approximate inner-product search over normalized embeddings,
+    such as the CLIP embeddings of EmbeddingStore.
+
+    The vectors are clustered around centroids, and stored grouped by cluster.
+    A query only scores the vectors of its nprobe most similar clusters,
+    so its cost is about nprobe / n_lists of exact search.
+
+    Queries are batched by cluster: the queries that probe a cluster are scored
+    against its vectors in one matrix multiply, and the top k are merged across clusters.
+    """
+
+    def __init__(self, centroids: np.ndarray, vectors: np.ndarray, ids: np.ndarray, offsets: np.ndarray):
+        """
+        :param centroids: the array of shape (n_lists, dim)
+        :param vectors: the vectors of shape (n, dim), grouped by list
+        :param ids: the original row of each vector
+        :param offsets: the first row of each list in vectors, followed by n
+        """
+        self.centroids = centroids
+        self.vectors = vectors
+        self.ids = ids
+        self.offsets = offsets
+
+    @classmethod
+    def build(
+        cls,
+        x: np.ndarray,
+        n_lists: Optional[int] = None,
+        n_train: Optional[int] = None,
+        n_iter: int = 20,
+        seed: Optional[int] = None,
+        dtype=np.float16,
+    ) -> "IVFIndex":
+        """
+        :param x: the normalized vectors of shape (n, dim)
+        :param n_lists: the number of clusters, defaults to about 4 * sqrt(n),
+            at most the number of sampled vectors
+        :param n_train: the number of vectors sampled to fit the centroids, defaults to 256 per list
+        :param dtype: the dtype the vectors are stored in
+        """
+        default_lists = n_lists is None
+        if default_lists:
+            n_lists = max(1, int(4 * np.sqrt(len(x))))
+        if n_train is None:
+            n_train = 256 * n_lists
+
+        n_sample = min(n_train, len(x))
+        if n_lists > n_sample:
+            if not default_lists:
+                raise ValueError(f"n_lists={n_lists} is more than the {n_sample} vectors to cluster")
+            n_lists = n_sample
+
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(x[np.sort(rng.choice(len(x), n_sample, replace=False))], dtype=np.float32)
+        centroids = spherical_kmeans(sample, n_lists, n_iter, seed)
+
+        labels = assign(x, centroids)
+        ids = np.argsort(labels, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=n_lists))])
+
+        return cls(centroids, np.asarray(x[ids], dtype=dtype), ids, offsets)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def save(self, workdir: str):
+        os.makedirs(workdir, exist_ok=True)
+        for name in ["centroids", "vectors", "ids", "offsets"]:
+            np.save(f"{workdir}/{name}.npy", getattr(self, name))
+
+    @classmethod
+    def load(cls, workdir: str, mmap_mode: Optional[str] = "r") -> "IVFIndex":
+        """
+        Loads an index, with the vectors memory-mapped by default.
+        """
+        return cls(
+            np.load(f"{workdir}/centroids.npy"),
+            np.load(f"{workdir}/vectors.npy", mmap_mode=mmap_mode),
+            np.load(f"{workdir}/ids.npy"),
+            np.load(f"{workdir}/offsets.npy"),
+        )
+
+    def search(self, queries: np.ndarray, k: int = 10, nprobe: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the approximate k most similar vectors of each query.
+
+        :param queries: the normalized queries of shape (queries, dim)
+        :param nprobe: the number of lists scored per query
+        :return: the original rows and the scores, both of shape (queries, k),
+            padded with -1 and -inf when fewer than k vectors are found
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        n_queries = len(queries)
+        nprobe = min(nprobe, len(self.centroids))
+
+        probes, _ = top_k(queries @ self.centroids.T, nprobe)
+
+        best_rows = np.full((n_queries, k), -1)
+        best_scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+
+        # Groups the (query, list) pairs by list.
+        pair_lists = probes.ravel()
+        pair_queries = np.repeat(np.arange(n_queries), nprobe)
+        order = np.argsort(pair_lists, kind="stable")
+        pair_lists, pair_queries = pair_lists[order], pair_queries[order]
+        bounds = np.flatnonzero(np.diff(pair_lists)) + 1
+
+        for group in np.split(np.arange(len(pair_lists)), bounds):
+            list_id = pair_lists[group[0]]
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            if start == end:
+                continue
+
+            query_ids = pair_queries[group]
+            scores = queries[query_ids] @ np.asarray(self.vectors[start:end], dtype=np.float32).T
+            rows, scores = top_k(scores, k)
+
+            merged_rows = np.concatenate([best_rows[query_ids], rows + start], axis=1)
+            merged_scores = np.concatenate([best_scores[query_ids], scores], axis=1)
+            idxs, best_scores[query_ids] = top_k(merged_scores, k)
+            best_rows[query_ids] = np.take_along_axis(merged_rows, idxs, axis=1)
+
+        return np.where(best_rows >= 0, self.ids[best_rows], -1), best_scores
+
+
+def exact_search(x: np.ndarray, queries: np.ndarray, k: int = 10, chunk_size: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the exact k most similar vectors of each query, in chunks of queries.
+    """
+    x = np.asarray(x, dtype=np.float32)
+    results = [
+        top_k(np.asarray(queries[start:start + chunk_size], dtype=np.float32) @ x.T, k)
+        for start in range(0, len(queries), chunk_size)
+    ]
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+
+def recall_at_k(expected: np.ndarray, actual: np.ndarray) -> float:
+    """
+    The mean fraction of the exact top k that the approximate top k finds.
+    """
+    hits = [len(np.intersect1d(e, a)) for e, a in zip(expected, actual)]
+    return float(np.mean(hits) / expected.shape[1])
+
+
+def benchmark(
+    index: IVFIndex,
+    x: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+    nprobes: Sequence[int] = (1, 2, 4, 8, 16, 32),
+) -> pd.DataFrame:
+    """
+    Measures the recall and the latency of the index for several nprobe, against exact search.
+
+    :param x: the vectors the index was built from, in their original order
+    :return: the frame with recall and ms_per_query for each nprobe, and for "exact"
+    """
+    start = time.perf_counter()
+    expected, _ = exact_search(x, queries, k)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    records = [("exact", 1.0, exact_ms)]
+    for nprobe in nprobes:
+        start = time.perf_counter()
+        actual, _ = index.search(queries, k, nprobe)
+        ms = (time.perf_counter() - start) * 1000 / len(queries)
+        records.append((nprobe, recall_at_k(expected, actual), ms))
+
+    return pd.DataFrame(records, columns=["nprobe", "recall", "ms_per_query"]).set_index("nprobe")
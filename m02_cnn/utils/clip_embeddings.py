@@ -0,0 +1,217 @@
+import hashlib
+import itertools
+import os
+from typing import Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+
+def image_hash(image: np.ndarray) -> str:
+    """
+    Hashes the pixels and the shape of an image, so the same image gets the same key in any dataset.
+    """
+    image = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(str(image.shape).encode(), digest_size=16)
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def normalize(x: np.ndarray) -> np.ndarray:
+    """
+    Scales each row to unit length, so that dot products are cosine similarities.
+    """
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the k highest scores of each row with argpartition, then sorts only those k.
+
+    :param scores: the array of shape (queries, items)
+    :return: the indices and the scores, both of shape (queries, k), from the highest score
+    """
+    k = min(k, scores.shape[1])
+    idxs = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, idxs, axis=1)
+
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(idxs, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+class ClipEncoder:
+    """
+    Encodes images and captions with a Hugging Face CLIP model, such as:
+
+        model = TFCLIPModel.from_pretrained("openai/clip-vit-large-patch14")
+        processor = CLIPProcessor.from_pretrained("openai/clip-vit-large-patch14")
+        encoder = ClipEncoder(model, processor)
+
+    Any object with the same encode_images and encode_texts methods can be used instead.
+    """
+
+    def __init__(self, model, processor):
+        self.model = model
+        self.processor = processor
+
+    @property
+    def logit_scale(self) -> float:
+        return float(np.exp(self.model.logit_scale.numpy()))
+
+    def encode_images(self, images: np.ndarray) -> np.ndarray:
+        """
+        :param images: the batch of shape (batch, height, width, 3)
+        :return: the embeddings of shape (batch, dim)
+        """
+        # reorder dimensions: BHWC -> B[CHW]
+        inputs = self.processor(images=list(np.moveaxis(images, 3, 1)), return_tensors="tf")
+        return self.model.get_image_features(**inputs).numpy()
+
+    def encode_texts(self, captions: Sequence[str]) -> np.ndarray:
+        inputs = self.processor(text=list(captions), return_tensors="tf", padding=True)
+        return self.model.get_text_features(**inputs).numpy()
+
+
+class EmbeddingStore:
+    """
+    Persists the normalized image embeddings of a CLIP encoder as a float16 memmap,
+    with one row per image keyed by the hash of its pixels.
+
+    Images are encoded once, in batches. Later calls only encode the images not yet in the store,
+    and caption queries over all the images are a single matrix multiply.
+    """
+
+    def __init__(self, workdir: str):
+        self.workdir = workdir
+        self.embeddings_path = f"{workdir}/embeddings.npy"
+        self.hashes_path = f"{workdir}/hashes.npy"
+
+        if os.path.exists(self.embeddings_path):
+            self.embeddings = np.load(self.embeddings_path, mmap_mode="r")  # type: Optional[np.ndarray]
+            self.hashes = pd.Index(np.load(self.hashes_path))
+        else:
+            self.embeddings = None
+            self.hashes = pd.Index([], dtype=object)
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def rows(self, hashes: Sequence[str]) -> np.ndarray:
+        """
+        Maps image hashes to the rows of the store, -1 for the images not in the store.
+        """
+        return self.hashes.get_indexer(list(hashes))
+
+    def add(self, images: Iterable[np.ndarray], encoder, batch_size: int = 64) -> np.ndarray:
+        """
+        Encodes the images that are not yet in the store, in batches, and appends them.
+
+        The images are hashed and encoded one batch at a time as they stream in,
+        so only one batch of images is in memory at once.
+
+        :param images: the images of shape (height, width, 3), such as from pnp_dataset.load_images
+        :param encoder: a ClipEncoder, or any object with encode_images
+        :return: the row of each image in the store
+        """
+        images = iter(images)
+        hashes = []
+        new_hashes = set()
+        new_embeddings = []
+        new_order = []
+
+        while True:
+            batch = list(itertools.islice(images, batch_size))
+            if not batch:
+                break
+
+            batch_hashes = [image_hash(image) for image in batch]
+            hashes.extend(batch_hashes)
+
+            # The first image of each hash that is not in the store yet.
+            known = self.rows(batch_hashes) >= 0
+            new = []
+            for i, image_key in enumerate(batch_hashes):
+                if not known[i] and image_key not in new_hashes:
+                    new_hashes.add(image_key)
+                    new_order.append(image_key)
+                    new.append(i)
+
+            if new:
+                new_embeddings.append(normalize(encoder.encode_images(np.stack([batch[i] for i in new]))))
+
+        if new_embeddings:
+            self._append(np.concatenate(new_embeddings), new_order)
+
+        return self.rows(hashes)
+
+    def _append(self, embeddings: np.ndarray, hashes: Sequence[str]):
+        os.makedirs(self.workdir, exist_ok=True)
+        n_old = len(self.hashes)
+
+        tmp_path = f"{self.workdir}/embeddings.tmp.npy"
+        merged = open_memmap(
+            tmp_path, mode="w+", dtype=np.float16, shape=(n_old + len(embeddings), embeddings.shape[1])
+        )
+        if n_old > 0:
+            merged[:n_old] = self.embeddings[:n_old]
+        merged[n_old:] = embeddings
+        merged.flush()
+        del merged
+
+        # The hashes replace the old ones after the embeddings, so that a crash in between
+        # leaves more embeddings than hashes, whose extra rows are never looked up.
+        all_hashes = np.concatenate([self.hashes.to_numpy(dtype=str), np.asarray(hashes, dtype=str)])
+        hashes_tmp_path = f"{self.workdir}/hashes.tmp.npy"
+        np.save(hashes_tmp_path, all_hashes)
+        os.replace(tmp_path, self.embeddings_path)
+        os.replace(hashes_tmp_path, self.hashes_path)
+
+        self.embeddings = np.load(self.embeddings_path, mmap_mode="r")
+        self.hashes = pd.Index(all_hashes)
+
+    def similarity(self, text_embeddings: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Computes the cosine similarity of the images and the captions.
+
+        :param text_embeddings: the array of shape (captions, dim), such as from encoder.encode_texts
+        :param rows: the rows of the images, defaults to all the images of the store
+        :return: the array of shape (images, captions)
+        """
+        images = self.embeddings if rows is None else self.embeddings[rows]
+        return np.asarray(images, dtype=np.float32) @ normalize(text_embeddings).T
+
+    def search(
+        self,
+        text_embeddings: np.ndarray,
+        k: int = 5,
+        rows: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the k images most similar to each caption.
+
+        :return: the rows and the similarities, both of shape (captions, k)
+        """
+        scores = self.similarity(text_embeddings, rows).T
+        idxs, top_scores = top_k(scores, k)
+        if rows is not None:
+            idxs = np.asarray(rows)[idxs]
+        return idxs, top_scores
+
+    def classify(
+        self,
+        text_embeddings: np.ndarray,
+        rows: Optional[np.ndarray] = None,
+        logit_scale: float = 100.0,
+    ) -> np.ndarray:
+        """
+        Zero-shot classifies the images into the captions, like logits_per_image of CLIP.
+
+        :param logit_scale: the temperature of the model, see ClipEncoder.logit_scale
+        :return: the probabilities of shape (images, captions)
+        """
+        logits = logit_scale * self.similarity(text_embeddings, rows)
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        return probs / probs.sum(axis=1, keepdims=True)
@@ -0,0 +1,155 @@
+from typing import Callable, Iterator, Optional, Sequence, Text
+
+import numpy as np
+import tensorflow as tf
+
+from collegium.foundation.video import FrameEncoder
+
+
+class DeepDream:
+    """
+    Gradient ascent on the input image that maximizes the activations of chosen layers.
+
+    Each step splits the image into tiles after a random shift,
+    and computes the gradient of all the tiles as one batch in a tf.function.
+    The image is dreamed at several octaves (scales), from the smallest to the largest.
+
+    The image stays in the pixel range [0, 255],
+    and the preprocess function maps it to the model's input range.
+
+    Adapted from:
+    https://www.tensorflow.org/tutorials/generative/deepdream
+    """
+
+    def __init__(
+        self,
+        model: tf.keras.Model,
+        layer_names: Sequence[Text],
+        preprocess: Callable[[tf.Tensor], tf.Tensor] = tf.keras.applications.vgg16.preprocess_input,
+        tile_size: int = 224,
+    ):
+        """
+        :param model: a convolutional model, such as VGG16(include_top=False)
+        :param layer_names: the layers whose mean activations are maximized
+        :param preprocess: maps pixels in [0, 255] to the model's input
+        :param tile_size: the side of the square tiles
+        """
+        outputs = [model.get_layer(name).output for name in layer_names]
+        self.feature_model = tf.keras.Model(inputs=model.inputs, outputs=outputs)
+        self.preprocess = preprocess
+        self.tile_size = tile_size
+
+        self._step = tf.function(
+            self._gradient_step,
+            input_signature=[
+                tf.TensorSpec((None, None, 3), tf.float32),
+                tf.TensorSpec((2,), tf.int32),
+                tf.TensorSpec((), tf.float32),
+            ],
+        )
+
+    def _tile_loss(self, tiles: tf.Tensor) -> tf.Tensor:
+        activations = self.feature_model(self.preprocess(tiles), training=False)
+        if not isinstance(activations, (list, tuple)):
+            activations = [activations]
+
+        return tf.add_n([tf.reduce_mean(a, axis=[1, 2, 3]) for a in activations])
+
+    def _gradient_step(self, image: tf.Tensor, shift: tf.Tensor, step_size: tf.Tensor) -> tf.Tensor:
+        # The random shift hides the seams between tiles.
+        shifted = tf.roll(image, shift=shift, axis=[0, 1])
+
+        height, width = tf.shape(shifted)[0], tf.shape(shifted)[1]
+        ts = self.tile_size
+        pad_h = (ts - height % ts) % ts
+        pad_w = (ts - width % ts) % ts
+        padded = tf.pad(shifted, [[0, pad_h], [0, pad_w], [0, 0]])
+
+        # (rows, tile, cols, tile, 3) -> (rows * cols, tile, tile, 3)
+        rows, cols = (height + pad_h) // ts, (width + pad_w) // ts
+        tiles = tf.reshape(padded, [rows, ts, cols, ts, 3])
+        tiles = tf.reshape(tf.transpose(tiles, [0, 2, 1, 3, 4]), [rows * cols, ts, ts, 3])
+
+        with tf.GradientTape() as tape:
+            tape.watch(tiles)
+            loss = tf.reduce_sum(self._tile_loss(tiles))
+        gradients = tape.gradient(loss, tiles)
+
+        gradients = tf.reshape(gradients, [rows, cols, ts, ts, 3])
+        gradients = tf.reshape(tf.transpose(gradients, [0, 2, 1, 3, 4]), [rows * ts, cols * ts, 3])
+        gradients = gradients[:height, :width]
+        gradients = tf.roll(gradients, shift=-shift, axis=[0, 1])
+
+        gradients /= tf.math.reduce_std(gradients) + 1e-8
+        return tf.clip_by_value(image + step_size * gradients, 0, 255)
+
+    def dream(
+        self,
+        image: np.ndarray,
+        steps_per_octave: int = 10,
+        step_size: float = 2.0,
+        octaves: Sequence[int] = (-2, -1, 0),
+        octave_scale: float = 1.3,
+        seed: Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        Dreams a single image.
+
+        :param image: the array of shape (height, width, 3) with pixels in [0, 255]
+        :param step_size: the step in pixel values per gradient step
+        :param octaves: the powers of octave_scale to resize the image to, in order
+        :return: the dreamed image as uint8
+        """
+        rng = np.random.default_rng(seed)
+        original = tf.cast(image, tf.float32)
+        base_shape = tf.cast(tf.shape(original)[:2], tf.float32)
+        dreamed = original
+
+        for octave in octaves:
+            shape = tf.cast(base_shape * (octave_scale ** octave), tf.int32)
+            dreamed = tf.image.resize(dreamed, shape)
+
+            for _ in range(steps_per_octave):
+                shift = rng.integers(-self.tile_size, self.tile_size, size=2, dtype=np.int32)
+                dreamed = self._step(dreamed, tf.constant(shift), tf.constant(step_size, tf.float32))
+
+        dreamed = tf.image.resize(dreamed, tf.shape(original)[:2])
+        return tf.cast(tf.clip_by_value(dreamed, 0, 255), tf.uint8).numpy()
+
+    def dream_zoom(
+        self,
+        image: np.ndarray,
+        n_frames: int,
+        zoom: float = 1.05,
+        encoder: Optional[FrameEncoder] = None,
+        seed: Optional[int] = None,
+        **dream_kwargs,
+    ) -> Iterator[np.ndarray]:
+        """
+        Dreams a zooming animation, where each frame is the previous frame
+        zoomed into its center and dreamed again.
+
+        The frames are yielded as they are produced,
+        and written to the encoder when one is given, such as open_encoder("dream.gif").
+
+        :param seed: derives a different seed for each frame,
+            so that the tile shifts and their seams differ from frame to frame
+        :param dream_kwargs: passed to dream
+        """
+        frame = np.asarray(image).astype(np.float32)
+        height, width = frame.shape[:2]
+
+        for index in range(n_frames):
+            frame_seed = None
+            if seed is not None:
+                frame_seed = int(np.random.default_rng([seed, index]).integers(2 ** 32))
+
+            frame = self.dream(frame, seed=frame_seed, **dream_kwargs)
+            if encoder is not None:
+                encoder.write(frame)
+            yield frame
+
+            crop_h, crop_w = round(height / zoom), round(width / zoom)
+            top, left = (height - crop_h) // 2, (width - crop_w) // 2
+            cropped = frame[top:top + crop_h, left:left + crop_w].astype(np.float32)
+            frame = tf.image.resize(cropped, (height, width)).numpy()
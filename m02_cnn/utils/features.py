@@ -0,0 +1,136 @@
+import os
+from typing import Callable, Dict, Optional, Sequence, Text
+
+import numpy as np
+import tensorflow as tf
+
+
+def top_class_score(y_hat: tf.Tensor) -> tf.Tensor:
+    """
+    The default gradient target: the score of the top class of each image.
+    """
+    return tf.reduce_max(y_hat, axis=-1)
+
+
+class FeatureExtractor:
+    """
+    Extracts activations of several layers of a model in a single forward pass,
+    and optionally the gradients of a target score with respect to
+    those activations and to the input image.
+
+    The results are streamed batch by batch into .npy memmaps in a workdir,
+    one file per layer, which can be re-opened with load_features for plotting,
+    for example with plot_activation_volume or plot_gradient.
+    """
+
+    def __init__(
+        self,
+        model: tf.keras.Model,
+        layer_names: Sequence[Text],
+        gradients: bool = False,
+        target: Callable[[tf.Tensor], tf.Tensor] = top_class_score,
+    ):
+        """
+        :param model: the model to inspect, such as a Keras Applications backbone
+        :param layer_names: the names of the layers whose outputs are extracted
+        :param gradients: whether to compute the gradients of the target
+        :param target: maps the model output to one score per image
+        """
+        self.layer_names = list(layer_names)
+        self.gradients = gradients
+        self.target = target
+
+        layer_outputs = [model.get_layer(name).output for name in self.layer_names]
+        self.extractor = tf.keras.Model(
+            inputs=model.inputs, outputs=layer_outputs + [model.outputs[0]]
+        )
+
+        input_shape = model.inputs[0].shape
+        self._extract_batch = tf.function(
+            self._extract,
+            input_signature=[tf.TensorSpec(input_shape, model.inputs[0].dtype)],
+        )
+
+    def _extract(self, x: tf.Tensor) -> Dict[Text, tf.Tensor]:
+        with tf.GradientTape() as tape:
+            tape.watch(x)
+            outputs = self.extractor(x, training=False)
+            activations, y_hat = outputs[:-1], outputs[-1]
+            score = tf.reduce_sum(self.target(y_hat))
+
+        features = dict(zip(self.layer_names, activations))
+
+        if self.gradients:
+            grads = tape.gradient(score, list(activations) + [x])
+            for name, grad in zip(self.layer_names, grads[:-1]):
+                features[f"{name}_grad"] = grad
+            features["input_grad"] = grads[-1]
+
+        return features
+
+    def output_shapes(self) -> Dict[Text, tuple]:
+        """
+        Returns the shape of each extracted array for a single image.
+        """
+        shapes = {
+            name: tuple(output.shape[1:])
+            for name, output in zip(self.layer_names, self.extractor.outputs)
+        }
+        if self.gradients:
+            for name in self.layer_names:
+                shapes[f"{name}_grad"] = shapes[name]
+            shapes["input_grad"] = tuple(self.extractor.inputs[0].shape[1:])
+        return shapes
+
+    def run(
+        self,
+        images: np.ndarray,
+        workdir: Text,
+        batch_size: int = 32,
+        dtype: Text = "float16",
+    ) -> Dict[Text, np.memmap]:
+        """
+        Runs the images through the model in batches,
+        writing each batch of features into the memmaps.
+
+        :param images: the array of shape (image, height, width, channels), may itself be a memmap
+        :param workdir: the folder for the .npy files, created if missing
+        :param dtype: the dtype of the stored features
+        :return: the memmaps by feature name
+        """
+        os.makedirs(workdir, exist_ok=True)
+        n = len(images)
+
+        features = {
+            name: np.lib.format.open_memmap(
+                os.path.join(workdir, f"{name}.npy"),
+                mode="w+",
+                dtype=dtype,
+                shape=(n, *shape),
+            )
+            for name, shape in self.output_shapes().items()
+        }
+
+        for start in range(0, n, batch_size):
+            end = min(start + batch_size, n)
+            batch = tf.convert_to_tensor(images[start:end], dtype=self.extractor.inputs[0].dtype)
+
+            for name, values in self._extract_batch(batch).items():
+                features[name][start:end] = values.numpy()
+
+        for memmap in features.values():
+            memmap.flush()
+
+        return features
+
+
+def load_features(workdir: Text, names: Optional[Sequence[Text]] = None) -> Dict[Text, np.memmap]:
+    """
+    Opens the features written by FeatureExtractor.run as read-only memmaps.
+
+    :param names: the feature names to open, defaults to all .npy files in the workdir
+    """
+    if names is None:
+        names = sorted(f[:-len(".npy")] for f in os.listdir(workdir) if f.endswith(".npy"))
+
+    return {name: np.load(os.path.join(workdir, f"{name}.npy"), mmap_mode="r") for name in names}
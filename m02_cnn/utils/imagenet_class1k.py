@@ -1,6 +1,4 @@
-import pandas as pd
-class_mapping = pd.DataFrame([
-{0: 'tench, Tinca tinca',
+class_names = {0: 'tench, Tinca tinca',
  1: 'goldfish, Carassius auratus',
  2: 'great white shark, white shark, man-eater, man-eating shark, Carcharodon carcharias',
  3: 'tiger shark, Galeocerdo cuvieri',
@@ -1000,4 +998,14 @@ class_mapping = pd.DataFrame([
  997: 'bolete',
  998: 'ear, spike, capitulum',
  999: 'toilet tissue, toilet paper, bathroom tissue'}
- ]).transpose()
\ No newline at end of file
+
+
+def __getattr__(name):
+    # The DataFrame is built on first access rather than at import time.
+    if name == "class_mapping":
+        import pandas as pd
+
+        global class_mapping
+        class_mapping = pd.DataFrame([class_names]).transpose()
+        return class_mapping
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,123 @@
+import os
+import re
+from typing import Callable, Dict, Sequence, Text
+
+import numpy as np
+from cachetools import LRUCache, cached
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class LabelMap:
+    """
+    Maps class ids to class names and back for whole batches at once.
+
+    The names are kept as a NumPy string array,
+    ids are looked up through a dense id -> position table,
+    and names through a sorted copy of the names with searchsorted.
+
+    Names are not unique in every dataset, for example ImageNet has two classes named "crane",
+    the bird 134 and the machine 517. A name shared by several classes refers to the first one
+    in the order of the map, see to_ids.
+    """
+
+    def __init__(self, ids: Sequence[int], names: Sequence[Text]):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.names = np.asarray(names, dtype=np.str_)
+
+        if self.ids.shape != self.names.shape:
+            raise ValueError("ids and names must have the same length")
+
+        self._position_by_id = np.full(self.ids.max() + 1, -1, dtype=np.int64)
+        self._position_by_id[self.ids] = np.arange(len(self.ids))
+
+        self._name_order = np.argsort(self.names, kind="stable")
+        self._sorted_names = self.names[self._name_order]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def to_positions(self, ids) -> np.ndarray:
+        """
+        Converts an array of class ids of any shape into their positions in the map.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        in_range = (ids >= 0) & (ids < len(self._position_by_id))
+        positions = np.where(in_range, self._position_by_id[np.where(in_range, ids, 0)], -1)
+
+        if (positions < 0).any():
+            raise KeyError(f"Unknown class ids: {np.unique(ids[positions < 0]).tolist()}")
+
+        return positions
+
+    def to_names(self, ids) -> np.ndarray:
+        """
+        Converts an array of class ids of any shape into an array of names.
+        """
+        return self.names[self.to_positions(ids)]
+
+    def to_ids(self, names) -> np.ndarray:
+        """
+        Converts an array of class names of any shape into an array of ids.
+
+        A name shared by several classes maps to the id of the first of them,
+        since the stable sort keeps them in the order of the map and searchsorted finds the leftmost.
+        """
+        names = np.asarray(names, dtype=np.str_)
+        found = np.searchsorted(self._sorted_names, names)
+        found = np.minimum(found, len(self._sorted_names) - 1)
+
+        missing = self._sorted_names[found] != names
+        if missing.any():
+            raise KeyError(f"Unknown class names: {np.unique(names[missing]).tolist()}")
+
+        return self.ids[self._name_order[found]]
+
+    def to_frame(self):
+        """
+        Returns the map as a DataFrame indexed by id with a label column.
+        """
+        import pandas as pd
+
+        return pd.DataFrame({"label": self.names}, index=pd.Index(self.ids, name="id"))
+
+
+def load_imagenet() -> LabelMap:
+    from collegium.m02_cnn.utils.imagenet_class1k import class_names
+
+    return LabelMap(list(class_names.keys()), list(class_names.values()))
+
+
+def load_mscoco() -> LabelMap:
+    # The label map is a flat list of items,
+    # so a regular expression is enough to read it without protobuf.
+    with open(os.path.join(UTILS_DIR, "mscoco_label_map.pbtxt")) as f:
+        items = re.findall(r'id:\s*(\d+)\s*display_name:\s*"([^"]*)"', f.read())
+
+    return LabelMap([int(i) for i, _ in items], [name for _, name in items])
+
+
+def load_pascalvoc() -> LabelMap:
+    from collegium.m02_cnn.utils.pascalvoc import class_ids
+
+    return LabelMap(range(len(class_ids)), class_ids)
+
+
+LABEL_MAP_LOADERS: Dict[Text, Callable[[], LabelMap]] = {
+    "imagenet": load_imagenet,
+    "mscoco": load_mscoco,
+    "pascalvoc": load_pascalvoc,
+}
+
+
+@cached(cache=LRUCache(maxsize=len(LABEL_MAP_LOADERS)))
+def load_label_map(name: Text) -> LabelMap:
+    """
+    Loads one of the known label maps once per process.
+
+    :param name: one of "imagenet", "mscoco" or "pascalvoc"
+    """
+    if name not in LABEL_MAP_LOADERS:
+        raise KeyError(f"Unknown label map {name}, expected one of {list(LABEL_MAP_LOADERS)}")
+
+    return LABEL_MAP_LOADERS[name]()
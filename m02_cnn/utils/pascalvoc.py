@@ -1,4 +1,3 @@
-import pandas as pd
 class_ids = [
     "Aeroplane",
     "Bicycle",
@@ -24,5 +23,7 @@ class_ids = [
 ]
 
 def load_class_map():
-    class_map = pd.DataFrame({'label': class_ids})
+    from collegium.m02_cnn.utils.label_maps import load_label_map
+
+    class_map = load_label_map("pascalvoc").to_frame().reset_index(drop=True)
     return class_map
\ No newline at end of file
@@ -1,16 +1,18 @@
 import math
+import os
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from typing import List, Text, Dict, Mapping, Tuple, Iterable, Sequence
+from typing import List, Optional, Text, Dict, Mapping, Tuple, Iterable, Sequence
 
-import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
 import requests
-import tensorflow as tf
 from PIL import ImageDraw, ImageFont, Image
 from PIL.ImageFont import FreeTypeFont
 from cachetools import LRUCache, cached
 
+from collegium.foundation.mosaic import plot_mosaic, rescale_sigmoid
+
 try:
     get_ipython().run_line_magic('config', 'InlineBackend.figure_format = "retina"')
 except:
@@ -29,37 +31,31 @@ def plot_conv_kernel(w: np.ndarray, labels: List[Text] = None, side_inches: int
     Before plotting, this function rescales the kernel
     by making its std = 1, so that pixel values are significantly different.
     Finally, it applies sigmoid activation to fit the weights into (0, 1) range.
+    All output channels are rescaled at once and drawn as a single mosaic.
     
     :param side_inches:
     :param w: the kernel to plot
     :param labels: optional list of labels for each output channel
     """
+    w = np.asarray(w)
 
     if len(w.shape) == 3:
         w = np.expand_dims(w, -1)
     elif len(w.shape) != 4:
         raise Exception("Kernel must be either 3- or 4-dimensional array")
 
-    cols = math.ceil(math.sqrt(w.shape[3]))
-    rows = math.ceil(w.shape[3] / cols)
-
     if labels is None:
         labels = range(w.shape[3])
 
-    plt.figure(figsize=[side_inches * cols, side_inches * rows])
-    for i in range(w.shape[3]):
-        wt = w[:, :, :, i]
-
-        # Rescaling so that sigmoid is saturated.
-        wt = wt / tf.math.reduce_std(wt)
-        wt = sigmoid(wt)
+    # Rescaling so that sigmoid is saturated.
+    wt = rescale_sigmoid(w, axis=(0, 1, 2))
 
-        plt.subplot(rows, cols, i + 1)
-        plt.imshow(wt, vmin=0, vmax=1)
-        plt.title(labels[i])
-        plt.xticks([])
-        plt.yticks([])
+    # (output channels, height, width, input channels)
+    wt = wt.transpose(3, 0, 1, 2)
+    if wt.shape[-1] == 1:
+        wt = wt[..., 0]
 
+    plot_mosaic(wt, labels=list(labels), side_inches=side_inches, vmin=0, vmax=1)
     plt.show()
 
 
@@ -106,15 +102,19 @@ def plot_activation_volume(av: np.ndarray, side=3):
     channels = np.linspace(0, activation_depth - 1, nrows * ncols)
     channels = channels.round().astype(int)
 
-    plt.figure(figsize=[4 * ncols, 4 * nrows])
-
-    for idx, channel in enumerate(channels):
-        current_av = av[:, :, channel]
-
-        plt.subplot(nrows, ncols, idx + 1)
-        plt.title(f"channel = {channel}")
-        plot_activation_map(current_av)
-
+    # (channels, height, width)
+    current_av = np.asarray(av)[:, :, channels].transpose(2, 0, 1)
+    current_av = rescale_sigmoid(current_av, axis=(1, 2))
+
+    plot_mosaic(
+        current_av,
+        labels=[f"channel = {channel}" for channel in channels],
+        ncols=ncols,
+        side_inches=4,
+        vmin=0,
+        vmax=1,
+        cmap=plt.get_cmap("RdYlGn"),
+    )
     plt.show()
 
 
@@ -221,6 +221,26 @@ def plot_images_grid(images: Mapping[Text, np.ndarray]) -> None:
         plot_image(images[name])
 
 
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Roboto-Regular.ttf")
+
+
+@cached(cache=LRUCache(maxsize=8))
+def load_font(size: int) -> FreeTypeFont:
+    """
+    Loads the label font of the given size, once per size.
+    """
+    return ImageFont.truetype(FONT_PATH, size=size)
+
+
+@cached(cache=LRUCache(maxsize=1))
+def load_box_colors() -> List[Tuple[int, int, int]]:
+    """
+    Returns the tab20 colors as RGB tuples in [0, 255].
+    """
+    rgb = (plt.get_cmap("tab20")(np.arange(20))[:, :3] * 255).astype(int)
+    return [tuple(int(c) for c in color) for color in rgb]
+
+
 def draw_bounding_box_on_image(
     image: Image.Image,
     ymin: int,
@@ -231,14 +251,19 @@ def draw_bounding_box_on_image(
     font: FreeTypeFont,
     thickness: int = 4,
     display_str_list: List[Text] = [],
+    draw: Optional[ImageDraw.ImageDraw] = None,
 ):
     """
     Adds a bounding box to an image.
     
+    The coordinates are relative to the image size.
+    Pass an existing ImageDraw to reuse it across many boxes.
+    
     Adapted from:
     https://colab.research.google.com/github/tensorflow/hub/blob/master/examples/colab/object_detection.ipynb
     """
-    draw = ImageDraw.Draw(image)  # type: ImageDraw.ImageDraw
+    if draw is None:
+        draw = ImageDraw.Draw(image)  # type: ImageDraw.ImageDraw
     im_width, im_height = image.size
     (left, right, top, bottom) = (
         xmin * im_width,
@@ -252,10 +277,13 @@ def draw_bounding_box_on_image(
         fill=color,
     )
 
+    # The bounding box of each string is measured once.
+    display_str_boxes = [font.getbbox(ds) for ds in display_str_list]
+
     # If the total height of the display strings added to the top of the bounding
     # box exceeds the top of the image, stack the strings below the bounding box
     # instead of above.
-    display_str_heights = [abs(font.getbbox(ds)[1] - font.getbbox(ds)[3]) for ds in display_str_list]
+    display_str_heights = [abs(b[1] - b[3]) for b in display_str_boxes]
     # Each display_str has a top and bottom margin of 0.05x.
     total_display_str_height = (1 + 2 * 0.05) * sum(display_str_heights)
 
@@ -264,8 +292,9 @@ def draw_bounding_box_on_image(
     else:
         text_bottom = bottom + total_display_str_height
     # Reverse list and print from bottom to top.
-    for display_str in display_str_list[::-1]:
-        _, _, text_width, text_height = font.getbbox(display_str)
+    for display_str, (_, _, text_width, text_height) in zip(
+        display_str_list[::-1], display_str_boxes[::-1]
+    ):
         margin = np.ceil(0.05 * text_height)
         draw.rectangle(
             [
@@ -284,8 +313,8 @@ def draw_bounding_box_on_image(
 
 
 def draw_boxes(
-    image: np.ndarray,  # = [image, height, width, [r, g, b]]
-    boxes: np.ndarray,  # = [image, [ymin, xmin, ymax, xmax]]
+    image: np.ndarray,  # = [height, width, [r, g, b]]
+    boxes: np.ndarray,  # = [box, [xmin, ymin, width, height]]
     class_names: Sequence[Text],
     scores: Sequence[float],
     min_score: float = 0.1,
@@ -294,33 +323,78 @@ def draw_boxes(
     """
     Overlay labeled boxes on an image with formatted scores and label names.
     
+    The boxes are in pixels. The boxes below min_score are filtered out
+    before drawing, and the font and colors are loaded once per process.
+    
     Adapted from:
     https://colab.research.google.com/github/tensorflow/hub/blob/master/examples/colab/object_detection.ipynb
     """
-    cmap = mpl.cm.get_cmap("tab20")
-    colors = [tuple((np.array(cmap(i))[:3] * 255).astype(int)) for i in range(20)]
-
-    font = ImageFont.truetype("./utils/Roboto-Regular.ttf", size=font_size)
+    colors = load_box_colors()
+    font = load_font(font_size)
     image_pil = Image.fromarray(np.uint8(image)).convert("RGB")
-
-    for i in range(boxes.shape[0]):
-        if scores[i] < min_score:
-            continue
-
-        xmin, ymin, width, height = tuple(boxes[i])
-        display_str = "{}: {}%".format(class_names[i], int(100 * scores[i]))
-
-        color = colors[hash(class_names[i]) % len(colors)]
+    draw = ImageDraw.Draw(image_pil)
+
+    scores = np.asarray(scores, dtype=float).reshape(-1)
+    keep = np.flatnonzero(scores >= min_score)
+    if len(keep) == 0:
+        return np.array(image_pil)
+
+    # Converts all the kept boxes into relative corners at once.
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)[keep]
+    im_width, im_height = image_pil.size
+    xmin = boxes[:, 0] / im_width
+    ymin = boxes[:, 1] / im_height
+    xmax = (boxes[:, 0] + boxes[:, 2]) / im_width
+    ymax = (boxes[:, 1] + boxes[:, 3]) / im_height
+    percents = (100 * scores[keep]).astype(int)
+
+    for j, i in enumerate(keep):
+        class_name = class_names[i]
+        display_str = "{}: {}%".format(class_name, percents[j])
+        color = colors[hash(class_name) % len(colors)]
 
         draw_bounding_box_on_image(
             image_pil,
-            ymin / image_pil.size[1],
-            xmin / image_pil.size[0],
-            (ymin + height) / image_pil.size[1],
-            (xmin + width) / image_pil.size[0],
+            ymin[j],
+            xmin[j],
+            ymax[j],
+            xmax[j],
             color,
             font,
             display_str_list=[display_str],
+            draw=draw,
         )
 
     return np.array(image_pil)
+
+
+def draw_boxes_batch(
+    images: np.ndarray,  # = [image, height, width, [r, g, b]]
+    boxes: Sequence[np.ndarray],  # = [image, box, [xmin, ymin, width, height]]
+    class_names: Sequence[Sequence[Text]],
+    scores: Sequence[Sequence[float]],
+    min_score: float = 0.1,
+    font_size: int = 20,
+    max_workers: int = None,
+) -> np.ndarray:
+    """
+    Overlays labeled boxes on a batch of images, such as frames of a video.
+    
+    Each image has its own boxes, class names and scores,
+    so the number of boxes may differ between images.
+    The images are drawn in parallel on a thread pool.
+    
+    :param max_workers: the size of the thread pool, defaults to the CPU count
+    :return: the array of images with the boxes drawn
+    """
+    # Loads the shared resources before the threads start.
+    load_box_colors()
+    load_font(font_size)
+
+    def draw_one(i: int) -> np.ndarray:
+        return draw_boxes(
+            images[i], boxes[i], class_names[i], scores[i], min_score, font_size
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return np.stack(list(executor.map(draw_one, range(len(images)))))
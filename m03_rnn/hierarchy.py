@@ -0,0 +1,143 @@
+from typing import List, Optional, Sequence, Text
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+
+from collegium.m03_rnn.utils import panel_sample_order
+
+# The 12 aggregation levels of the M5 competition, from the total to the bottom series.
+M5_LEVELS = [
+    [],
+    ["state_id"],
+    ["store_id"],
+    ["cat_id"],
+    ["dept_id"],
+    ["state_id", "cat_id"],
+    ["state_id", "dept_id"],
+    ["store_id", "cat_id"],
+    ["store_id", "dept_id"],
+    ["item_id"],
+    ["item_id", "state_id"],
+    ["item_id", "store_id"],
+]
+
+
+class Hierarchy:
+    """
+    Aggregates bottom-level series to all the levels of a hierarchy
+    with one sparse summing matrix, such as the 12 levels of M5.
+
+    The summing matrix has one row per aggregated series and one column per bottom series,
+    so aggregating is a single sparse matmul of shape (series, bottom) x (bottom, time).
+    """
+
+    def __init__(self, ids: pd.DataFrame, levels: Sequence[Sequence[Text]] = M5_LEVELS):
+        """
+        :param ids: one row per bottom series, in the order of the bottom arrays,
+            with the columns used by the levels, such as item_id and store_id
+        :param levels: the id columns that define each level, [] for the total
+        """
+        self.levels = [list(level) for level in levels]
+
+        matrices = []
+        level_of_series = []
+        keys = []
+
+        for level_id, level in enumerate(self.levels):
+            if len(level) == 0:
+                codes = np.zeros(len(ids), dtype=np.int64)
+                labels = ["Total"]
+            else:
+                codes, uniques = pd.MultiIndex.from_frame(ids[level].astype(str)).factorize()
+                labels = ["_".join(u) for u in uniques]
+
+            matrices.append(sparse.csr_matrix(
+                (np.ones(len(ids)), (codes, np.arange(len(ids)))),
+                shape=(len(labels), len(ids)),
+            ))
+            level_of_series.append(np.full(len(labels), level_id))
+            keys.extend(labels)
+
+        self.summing = sparse.vstack(matrices, format="csr")
+        self.level_of_series = np.concatenate(level_of_series)
+        self.index = pd.MultiIndex.from_arrays(
+            [self.level_of_series + 1, keys], names=["level", "series"]
+        )
+
+    @classmethod
+    def from_panel(cls, panel: pd.DataFrame, levels: Sequence[Sequence[Text]] = M5_LEVELS) -> "Hierarchy":
+        """
+        Takes the ids of each bottom series from a long (sample, time) panel, such as from ingest_m5,
+        in the sample order of panel_to_ndarray.
+        """
+        columns = sorted({column for level in levels for column in level})
+        order = panel_sample_order(panel)
+        if order is not None:
+            panel = panel.iloc[order]
+
+        first_rows = ~panel.index.get_level_values(0).duplicated()
+        return cls(panel.loc[first_rows, columns].reset_index(drop=True), levels)
+
+    def aggregate(self, bottom: np.ndarray) -> np.ndarray:
+        """
+        Sums the bottom series of shape (bottom, time) into all the series of shape (series, time).
+        """
+        return np.asarray(self.summing @ bottom)
+
+    def rmsse(self, train: np.ndarray, actual: np.ndarray, forecast: np.ndarray) -> np.ndarray:
+        """
+        Computes the root mean squared scaled error of every aggregated series.
+
+        The scale is the mean squared error of the naive one-step forecast on the training history,
+        counted from the first non-zero value of each series, as in M5.
+
+        :param train: the bottom training history of shape (bottom, time)
+        :param actual: the bottom actuals of shape (bottom, horizon)
+        :param forecast: the bottom forecasts of shape (bottom, horizon)
+        :return: the array of shape (series,)
+        """
+        train = self.aggregate(train)
+        error = self.aggregate(actual) - self.aggregate(forecast)
+
+        started = np.maximum.accumulate(train != 0, axis=1)[:, :-1]
+        naive = np.diff(train, axis=1) ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scale = (naive * started).sum(axis=1) / started.sum(axis=1)
+            return np.sqrt((error ** 2).mean(axis=1) / scale)
+
+    def weights(self, bottom_weights: np.ndarray) -> np.ndarray:
+        """
+        Aggregates the bottom weights, such as dollar sales over the last 28 days,
+        and normalizes them to sum to 1 within each level.
+        """
+        weights = self.summing @ np.asarray(bottom_weights, dtype=np.float64)
+        level_totals = np.bincount(self.level_of_series, weights)
+        return weights / level_totals[self.level_of_series]
+
+    def wrmsse(
+        self,
+        train: np.ndarray,
+        actual: np.ndarray,
+        forecast: np.ndarray,
+        bottom_weights: Optional[np.ndarray] = None,
+    ) -> pd.Series:
+        """
+        Computes the weighted RMSSE of each level, and their mean as "overall".
+
+        :param bottom_weights: the weight of each bottom series, usually its dollar sales
+            over the last 28 days of training. Defaults to its unit sales over that period.
+        :return: the series indexed by level number, plus "overall"
+        """
+        if bottom_weights is None:
+            bottom_weights = train[:, -28:].sum(axis=1)
+
+        weighted = self.weights(bottom_weights) * self.rmsse(train, actual, forecast)
+        by_level = np.bincount(self.level_of_series, np.where(np.isfinite(weighted), weighted, 0))
+
+        scores = pd.Series(by_level, index=pd.RangeIndex(1, len(self.levels) + 1, name="level"))
+        scores["overall"] = by_level.mean()
+        return scores
+
+    def level_names(self) -> List[Text]:
+        return ["Total" if len(level) == 0 else " x ".join(level) for level in self.levels]
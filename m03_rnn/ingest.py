@@ -0,0 +1,134 @@
+import glob
+import logging
+import os
+from typing import Sequence, Text
+
+import numpy as np
+import pandas as pd
+
+from collegium.m03_rnn.utils import Segment
+
+M5_ID_COLUMNS = ["id", "item_id", "dept_id", "cat_id", "store_id", "state_id"]
+
+
+def prepare_dataset_dir(workdir: Text, segment_name: Text, frame_name: Text) -> Text:
+    """
+    Creates the folder that Segment.from_pq_workdir reads as one Parquet dataset,
+    and removes the parts of a previous ingestion.
+    """
+    dataset_dir = f"{workdir}/{segment_name}_{frame_name}.parquet"
+    os.makedirs(dataset_dir, exist_ok=True)
+
+    for part in glob.glob(f"{dataset_dir}/part-*.parquet"):
+        os.remove(part)
+
+    return dataset_dir
+
+
+def read_categories(csv_path: Text, columns: Sequence[Text]) -> dict:
+    """
+    Reads only the id columns to fix the categories,
+    so that all the chunks share the same dictionary.
+    """
+    ids = pd.read_csv(csv_path, usecols=list(columns), dtype=str)
+    return {column: pd.Index(ids[column].unique()) for column in columns}
+
+
+def to_int16(values: np.ndarray) -> np.ndarray:
+    """
+    Casts to int16, raising ValueError instead of wrapping the values out of its range.
+    """
+    info = np.iinfo(np.int16)
+    if values.size > 0 and (values.min() < info.min or values.max() > info.max):
+        raise ValueError(f"Values in [{values.min()}, {values.max()}] do not fit in int16")
+    return values.astype(np.int16)
+
+
+def ingest_m5(
+    dataset_dir: Text,
+    workdir: Text,
+    segment_name: Text = "m5",
+    sales_file: Text = "sales_train_evaluation.csv",
+    chunksize: int = 1000,
+) -> Segment:
+    """
+    Converts the wide M5 sales CSV into a long (sample, time) panel in Parquet.
+
+    The CSV is read in chunks of series, each chunk is written as one part of the dataset.
+    The sales are stored as int16, the ids as categoricals,
+    and the day columns are mapped to dates from calendar.csv once.
+
+    :param dataset_dir: the folder with the M5 CSV files
+    :param workdir: the folder of the output panel
+    :return: the segment with a lazily read frame "y", indexed by (sample, time)
+    """
+    sales_path = f"{dataset_dir}/{sales_file}"
+
+    calendar = pd.read_csv(f"{dataset_dir}/calendar.csv", usecols=["d", "date"])
+    date_by_day = pd.Series(pd.to_datetime(calendar["date"]).values, index=calendar["d"])
+
+    categories = read_categories(sales_path, M5_ID_COLUMNS)
+    output_dir = prepare_dataset_dir(workdir, segment_name, "y")
+
+    chunks = pd.read_csv(sales_path, chunksize=chunksize, dtype={c: str for c in M5_ID_COLUMNS})
+    for part, chunk in enumerate(chunks):
+        day_columns = chunk.columns[len(M5_ID_COLUMNS):]
+        dates = date_by_day.loc[day_columns].to_numpy()
+
+        n_series, n_days = len(chunk), len(day_columns)
+        sales = to_int16(chunk[day_columns].to_numpy()).ravel()
+
+        ids = {
+            column: pd.Categorical(
+                np.repeat(chunk[column].to_numpy(), n_days), categories=categories[column]
+            )
+            for column in M5_ID_COLUMNS
+        }
+
+        index = pd.MultiIndex.from_arrays(
+            [ids.pop("id"), np.tile(dates, n_series)], names=["sample", "time"]
+        )
+        frame = pd.DataFrame({"sales": sales, **ids}, index=index)
+        frame.to_parquet(f"{output_dir}/part-{part:05d}.parquet")
+
+        logging.info(f"Ingested M5 {part=} {n_series=}")
+
+    return Segment.from_pq_workdir(workdir, segment_name, ["y"])
+
+
+def ingest_m4(
+    csv_path: Text,
+    workdir: Text,
+    segment_name: Text,
+    chunksize: int = 1000,
+) -> Segment:
+    """
+    Converts a wide M4 CSV, such as Daily-train.csv, into a long (sample, time) panel in Parquet.
+
+    Each row of the CSV is one series of variable length padded with empty values,
+    which are dropped. The time is the step within the series.
+
+    :param csv_path: the path of the M4 CSV file
+    :param workdir: the folder of the output panel
+    :return: the segment with a lazily read frame "y", indexed by (sample, time)
+    """
+    categories = read_categories(csv_path, ["V1"])["V1"]
+    output_dir = prepare_dataset_dir(workdir, segment_name, "y")
+
+    for part, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunksize, dtype={"V1": str})):
+        values = chunk.iloc[:, 1:].to_numpy(dtype=np.float32)
+        present = ~np.isnan(values)
+
+        # Steps of the present values within each series.
+        rows, steps = np.nonzero(present)
+        samples = pd.Categorical(chunk["V1"].to_numpy()[rows], categories=categories)
+
+        index = pd.MultiIndex.from_arrays(
+            [samples, steps.astype(np.int16)], names=["sample", "time"]
+        )
+        frame = pd.DataFrame({"value": values[present]}, index=index)
+        frame.to_parquet(f"{output_dir}/part-{part:05d}.parquet")
+
+        logging.info(f"Ingested M4 {part=} n_series={len(chunk)}")
+
+    return Segment.from_pq_workdir(workdir, segment_name, ["y"])
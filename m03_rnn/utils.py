@@ -1,23 +1,129 @@
-from typing import Text, Dict, Sequence, Mapping, Union
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Text, Dict, List, Sequence, Mapping, Tuple, Union
 
+import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+from matplotlib.ticker import MaxNLocator
 import numpy as np
 import pandas as pd
 import sklearn.metrics as metrics
-from statsmodels.regression.linear_model import OLS
-from tensorflow import Tensor
-# noinspection PyPep8Naming
-from tensorflow.python.keras import backend as K
-
-
-def r2_score(y_true: Tensor, y_hat: Tensor) -> Tensor:
-    ss_res = K.sum(K.square(y_true - y_hat))
-    ss_tot = K.sum(K.square(y_true - K.mean(y_true)))
-    return 1 - ss_res / (ss_tot + K.epsilon())
-
-
-def mean_error(y_true: Tensor, y_hat: Tensor) -> Tensor:
-    return K.mean(y_hat) - K.mean(y_true)
+import keras
+from keras import ops
+
+
+def r2_score(y_true, y_hat):
+    """
+    The R2 of a single batch. Keras averages it across batches,
+    which is not the R2 of the epoch, see R2Score instead.
+    """
+    ss_res = ops.sum(ops.square(y_true - y_hat))
+    ss_tot = ops.sum(ops.square(y_true - ops.mean(y_true)))
+    return 1 - ss_res / (ss_tot + keras.config.epsilon())
+
+
+def mean_error(y_true, y_hat):
+    """
+    The mean error of a single batch, see MeanError for the streaming version.
+    """
+    return ops.mean(y_hat) - ops.mean(y_true)
+
+
+def broadcast_weights(sample_weight, y_true):
+    """
+    Broadcasts the sample weights, such as one per sample of shape (batch,),
+    to the shape of the targets, as float64 ones when there are none.
+    """
+    if sample_weight is None:
+        return ops.ones_like(y_true)
+
+    weights = ops.cast(sample_weight, "float64")
+    for _ in range(len(y_true.shape) - len(weights.shape)):
+        weights = ops.expand_dims(weights, -1)
+    return ops.broadcast_to(weights, ops.shape(y_true))
+
+
+class R2Score(keras.metrics.Metric):
+    """
+    The exact R2 of all the batches seen since the last reset.
+
+    Accumulates the weight, mean and centred sum of squares of the targets,
+    merged batch by batch with the parallel variance algorithm of Chan et al.,
+    and the sum of squared residuals, so the R2 of the epoch is exact
+    rather than the average R2 of the batches.
+    The centred sums avoid the cancellation of sum(y^2) - sum(y)^2 / n
+    for targets with a large mean and a small variance.
+    With sample weights, each sum is weighted, like sklearn's r2_score.
+    """
+
+    def __init__(self, name: Text = "r2_score", **kwargs):
+        super().__init__(name=name, **kwargs)
+        # The weight, mean, centred sum of squares and sum of squared residuals.
+        self.sums = self.add_weight(
+            name="sums", shape=(4,), initializer="zeros", dtype="float64"
+        )
+
+    def update_state(self, y_true, y_hat, sample_weight=None):
+        y_true = ops.cast(y_true, "float64")
+        y_hat = ops.cast(ops.reshape(y_hat, ops.shape(y_true)), "float64")
+        weights = broadcast_weights(sample_weight, y_true)
+
+        batch_weight = ops.sum(weights)
+        batch_mean = ops.sum(weights * y_true) / ops.maximum(batch_weight, keras.config.epsilon())
+        batch_m2 = ops.sum(weights * ops.square(y_true - batch_mean))
+
+        weight, mean, m2, ss_res = ops.unstack(self.sums)
+        total_weight = weight + batch_weight
+        delta = batch_mean - mean
+        ratio = batch_weight / ops.maximum(total_weight, keras.config.epsilon())
+
+        self.sums.assign(ops.stack([
+            total_weight,
+            mean + delta * ratio,
+            m2 + batch_m2 + ops.square(delta) * weight * ratio,
+            ss_res + ops.sum(weights * ops.square(y_true - y_hat)),
+        ]))
+
+    def result(self):
+        _, _, ss_tot, ss_res = ops.unstack(self.sums)
+        return ops.cast(1 - ss_res / (ss_tot + keras.config.epsilon()), self.dtype)
+
+    def reset_state(self):
+        self.sums.assign(ops.zeros((4,), dtype="float64"))
+
+
+class MeanError(keras.metrics.Metric):
+    """
+    The exact mean error of all the batches seen since the last reset,
+    weighted by the sample weights when given.
+    """
+
+    def __init__(self, name: Text = "mean_error", **kwargs):
+        super().__init__(name=name, **kwargs)
+        self.sums = self.add_weight(
+            name="sums", shape=(2,), initializer="zeros", dtype="float64"
+        )
+
+    def update_state(self, y_true, y_hat, sample_weight=None):
+        y_true = ops.cast(y_true, "float64")
+        y_hat = ops.cast(ops.reshape(y_hat, ops.shape(y_true)), "float64")
+        weights = broadcast_weights(sample_weight, y_true)
+
+        self.sums.assign_add(ops.stack([
+            ops.sum(weights),
+            ops.sum(weights * (y_hat - y_true)),
+        ]))
+
+    def result(self):
+        count, error = ops.unstack(self.sums)
+        return ops.cast(error / ops.maximum(count, keras.config.epsilon()), self.dtype)
+
+    def reset_state(self):
+        self.sums.assign(ops.zeros((2,), dtype="float64"))
 
 
 def nd_target_like_panel(
@@ -33,49 +139,268 @@ def nd_target_like_panel(
     return target_panel
 
 
-def plot_random_forecasts(past: pd.Series, future: pd.Series, forecast: pd.Series):
-    cols = 3
-    rows = 3
-
-    samples = np.random.choice(past.index.levels[0], cols * rows, replace=False)
-
-    plt.figure(figsize=[8 * cols, 8 * rows])
-    for idx in range(cols * rows):
-        sample = samples[idx]
-        ax = plt.subplot(rows, cols, idx + 1)
-        plt.title(sample)
-        past.loc[sample].plot(ax=ax, color="blue", label="past")
-        future.loc[sample].plot(ax=ax, color="green", label="future")
-        forecast.loc[sample].plot(ax=ax, color="red", label="forecast")
-        plt.legend()
-    plt.tight_layout()
+class SeriesSlicer:
+    """
+    Slices the series of many samples out of a (sample, time) panel.
+
+    The panel is sorted by sample once, and each sample
+    is then a contiguous slice found with one index lookup.
+    Times are converted to matplotlib's numeric dates when they are timestamps.
+    """
+
+    def __init__(self, panel: Union[pd.Series, pd.DataFrame]):
+        if isinstance(panel, pd.DataFrame):
+            panel = panel.iloc[:, 0]
+
+        codes = panel_sample_codes(panel)
+        times = panel.index.get_level_values(1)
+        values = panel.to_numpy(dtype=np.float64)
+
+        order = panel_sample_order(panel)
+        if order is not None:
+            codes, times, values = codes[order], times[order], values[order]
+
+        self.is_date = isinstance(times, pd.DatetimeIndex)
+        if self.is_date:
+            times = mdates.date2num(times)
+
+        self.labels = panel_sample_labels(panel)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(self.labels)))])
+        self.xy = np.stack([np.asarray(times, dtype=np.float64), values], axis=1)
+
+    def __getitem__(self, samples: Sequence) -> List[np.ndarray]:
+        """
+        Returns one (time, value) array of shape (steps, 2) per sample.
+        """
+        positions = self.labels.get_indexer(samples)
+        if (positions < 0).any():
+            raise KeyError(f"Unknown samples: {list(np.asarray(samples)[positions < 0])}")
+
+        return [self.xy[self.offsets[p]:self.offsets[p + 1]] for p in positions]
+
+
+class ForecastGrid:
+    """
+    A grid of panels, one per sample, with one LineCollection per panel for all the series.
+
+    The figure is built once and redrawn for each page of samples,
+    which makes paging through thousands of samples cheap.
+    """
+
+    def __init__(
+        self,
+        slicers: Sequence[SeriesSlicer],
+        cols: int = 3,
+        rows: int = 3,
+        side_inches: float = 8,
+        colors: Sequence[Text] = ("blue", "green", "red"),
+        labels: Sequence[Text] = ("past", "future", "forecast"),
+    ):
+        """
+        :param slicers: one slicer per series, such as past, future and forecast
+        """
+        self.slicers = slicers
+        self.fig, axes = plt.subplots(
+            rows, cols, figsize=[side_inches * cols, side_inches * rows], squeeze=False
+        )
+        self.axes = axes.ravel()
+        self.collections = []
+
+        for ax in self.axes:
+            collection = LineCollection([], colors=colors[:len(slicers)])
+            ax.add_collection(collection)
+            self.collections.append(collection)
+            # Few ticks per panel keep the redraw of each page cheap.
+            if slicers[0].is_date:
+                locator = mdates.AutoDateLocator(minticks=2, maxticks=5)
+                ax.xaxis.set_major_locator(locator)
+                ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+            else:
+                ax.xaxis.set_major_locator(MaxNLocator(4))
+            ax.yaxis.set_major_locator(MaxNLocator(4))
+
+        self.axes[0].legend(
+            handles=[Line2D([], [], color=c, label=l) for c, l in zip(colors, labels)]
+        )
+
+    def draw(self, samples: Sequence) -> plt.Figure:
+        """
+        Draws the samples into the panels, hiding the panels left empty.
+        """
+        segments_by_slicer = [slicer[samples] for slicer in self.slicers]
+
+        for idx, (ax, collection) in enumerate(zip(self.axes, self.collections)):
+            ax.set_visible(idx < len(samples))
+            if idx >= len(samples):
+                continue
+
+            segments = [segments[idx] for segments in segments_by_slicer]
+            collection.set_segments(segments)
+
+            points = np.concatenate(segments)
+            (x_min, y_min), (x_max, y_max) = points.min(axis=0), points.max(axis=0)
+            margin = 0.05 * (y_max - y_min) or 1
+            ax.set_xlim(x_min, x_max if x_max > x_min else x_min + 1)
+            ax.set_ylim(y_min - margin, y_max + margin)
+            ax.set_title(samples[idx])
+
+        return self.fig
+
+
+def plot_random_forecasts(
+    past: pd.Series,
+    future: pd.Series,
+    forecast: Union[pd.Series, pd.DataFrame],
+    cols: int = 3,
+    rows: int = 3,
+    seed: int = None,
+):
+    samples = np.random.default_rng(seed).choice(
+        past.index.get_level_values(0).unique(), cols * rows, replace=False
+    )
+    slicers = [SeriesSlicer(series) for series in (past, future, forecast)]
+    grid = ForecastGrid(slicers, cols=cols, rows=rows)
+    grid.draw(samples).tight_layout()
+
+
+def page_forecasts(
+    past: pd.Series,
+    future: pd.Series,
+    forecast: Union[pd.Series, pd.DataFrame],
+    path: Text,
+    samples: Sequence = None,
+    cols: int = 4,
+    rows: int = 4,
+    side_inches: float = 3,
+    dpi: int = 72,
+) -> int:
+    """
+    Renders the forecasts of many samples, one grid of cols x rows panels per page.
+
+    A .pdf path produces a multi-page PDF.
+    Any other image path, such as .png, produces a single sprite image
+    with all the pages stacked vertically.
+
+    :param samples: the samples to render, defaults to all the samples of the forecast
+    :return: the number of pages
+    """
+    slicers = [SeriesSlicer(series) for series in (past, future, forecast)]
+    if samples is None:
+        samples = slicers[2].labels[np.diff(slicers[2].offsets) > 0]
+
+    per_page = cols * rows
+    pages = [samples[start:start + per_page] for start in range(0, len(samples), per_page)]
+
+    grid = ForecastGrid(slicers, cols=cols, rows=rows, side_inches=side_inches)
+    grid.draw(pages[0]).tight_layout()
+
+    if path.lower().endswith(".pdf"):
+        with PdfPages(path) as pdf:
+            for page in pages:
+                pdf.savefig(grid.draw(page))
+    else:
+        grid.fig.set_dpi(dpi)
+        sprite = []
+        for page in pages:
+            grid.draw(page).canvas.draw()
+            sprite.append(np.array(grid.fig.canvas.buffer_rgba())[:, :, :3])
+        plt.imsave(path, np.concatenate(sprite, axis=0))
+
+    plt.close(grid.fig)
+    return len(pages)
 
 
 class Segment:
     def __init__(self, segment_name: Text):
         self.segment_name = segment_name
         self.frames = {}  # type: Dict[Text, pd.DataFrame]
+        # Frames that are read on first access.
+        self.sources = {}  # type: Dict[Text, Callable[[], pd.DataFrame]]
+        # Threads accessing the same frame read it once, and different frames concurrently:
+        # the lock only guards the dictionaries, and the frames being read are futures.
+        self._lock = threading.Lock()
+        self._reading = {}  # type: Dict[Text, Future]
 
     def __getitem__(self, item: Text) -> pd.DataFrame:
-        return self.frames[item]
+        with self._lock:
+            if item in self.frames:
+                return self.frames[item]
+
+            reading = self._reading.get(item)
+            if reading is None:
+                # Raises KeyError for unknown frames.
+                source = self.sources.pop(item)
+                reading = self._reading[item] = Future()
+            else:
+                source = None
+
+        if source is None:
+            return reading.result()
+
+        try:
+            frame = source()
+        except BaseException as e:
+            with self._lock:
+                self.sources[item] = source
+                del self._reading[item]
+            reading.set_exception(e)
+            raise
+
+        with self._lock:
+            self.frames[item] = frame
+            del self._reading[item]
+        reading.set_result(frame)
+        return frame
 
     def __setitem__(self, key: Text, value: pd.DataFrame):
-        self.frames[key] = value
+        with self._lock:
+            self.sources.pop(key, None)
+            self.frames[key] = value
+
+    def frame_names(self) -> List[Text]:
+        return list(self.frames.keys()) + list(self.sources.keys())
+
+    def load(self) -> "Segment":
+        """
+        Reads all the frames that have not been accessed yet.
+        """
+        for name in list(self.sources.keys()):
+            self[name]
+        return self
 
     def to_pq_workdir(self, workdir: Text):
-        for name, frame in self.frames.items():
+        for name in self.frame_names():
             filename = f"{self.segment_name}_{name}.parquet"
-            self.frames[name].to_parquet(f"{workdir}/{filename}")
+            self[name].to_parquet(f"{workdir}/{filename}")
 
     @classmethod
     def from_pq_workdir(
-        cls, workdir: Text, segment_name: Text, frame_names: Sequence[Text]
+        cls,
+        workdir: Text,
+        segment_name: Text,
+        frame_names: Sequence[Text],
+        columns: Sequence[Text] = None,
+        filters: List[Tuple] = None,
+        lazy: bool = True,
     ) -> "Segment":
+        """
+        Opens the segment's frames from Parquet files in the workdir.
+
+        :param columns: when set, only these columns are read (the index is always read)
+        :param filters: pyarrow filters that skip row groups and rows,
+            such as [("sample", "in", ["Albuquerque/1112/1"])]
+        :param lazy: whether to read each frame on its first access
+        """
         segment = cls(segment_name)
 
         for frame_name in frame_names:
             filename = f"{segment_name}_{frame_name}.parquet"
-            segment.frames[frame_name] = pd.read_parquet(f"{workdir}/{filename}")
+            segment.sources[frame_name] = partial(
+                pd.read_parquet, f"{workdir}/{filename}", columns=columns, filters=filters
+            )
+
+        if not lazy:
+            segment.load()
 
         return segment
 
@@ -84,21 +409,21 @@ class FeatureSegment(Segment):
     @classmethod
     def from_pq_workdir(cls, workdir: Text, segment_name: Text, **kwargs) -> "Segment":
         frame_names = ["x"]
-        return Segment.from_pq_workdir(workdir, segment_name, frame_names)
+        return Segment.from_pq_workdir(workdir, segment_name, frame_names, **kwargs)
 
 
 class TargetSegment(Segment):
     @classmethod
     def from_pq_workdir(cls, workdir: Text, segment_name: Text, **kwargs) -> "Segment":
         frame_names = ["y"]
-        return Segment.from_pq_workdir(workdir, segment_name, frame_names)
+        return Segment.from_pq_workdir(workdir, segment_name, frame_names, **kwargs)
 
 
 class RegressionSegment(Segment):
     @classmethod
     def from_pq_workdir(cls, workdir: Text, segment_name: Text, **kwargs) -> "Segment":
         frame_names = ["x", "y"]
-        return Segment.from_pq_workdir(workdir, segment_name, frame_names)
+        return Segment.from_pq_workdir(workdir, segment_name, frame_names, **kwargs)
 
 
 class SegmentDataset:
@@ -111,96 +436,259 @@ class SegmentDataset:
     def __setitem__(self, key: Text, value: Segment):
         self.segments[key] = value
 
+    def load(self, max_workers: int = None) -> "SegmentDataset":
+        """
+        Reads all the pending frames of all the segments concurrently.
+        """
+        pending = [
+            (segment, name, source)
+            for segment in self.segments.values()
+            for name, source in segment.sources.items()
+        ]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            frames = list(executor.map(lambda p: p[2](), pending))
+
+        for (segment, name, _), frame in zip(pending, frames):
+            segment[name] = frame
+
+        return self
+
     def to_pq_workdir(self, workdir: Text):
         for segment in self.segments.values():
             segment.to_pq_workdir(workdir)
 
     @classmethod
     def from_pq_workdir(
-        cls, workdir: Text, segment_names: Sequence[Text], frame_names: Sequence[Text]
+        cls,
+        workdir: Text,
+        segment_names: Sequence[Text],
+        frame_names: Sequence[Text],
+        columns: Sequence[Text] = None,
+        filters: List[Tuple] = None,
+        lazy: bool = True,
+        max_workers: int = None,
     ) -> "SegmentDataset":
+        """
+        Opens the segments from Parquet files in the workdir, see Segment.from_pq_workdir.
+
+        :param lazy: whether to read each frame on its first access,
+            otherwise all the frames are read concurrently on max_workers threads
+        """
         dataset = cls()
 
         for name in segment_names:
-            dataset[name] = Segment.from_pq_workdir(workdir, name, frame_names)
+            dataset[name] = Segment.from_pq_workdir(
+                workdir, name, frame_names, columns=columns, filters=filters
+            )
+
+        if not lazy:
+            dataset.load(max_workers)
 
         return dataset
 
 
-def forecast_mean(dataset: SegmentDataset, prediction_window: int) -> SegmentDataset:
-    mean_target_hat = SegmentDataset()
-    for name, segment in dataset.segments.items():
-        segment_features = segment["x"]["temperature"]
-        segment_target_hat = pd.DataFrame({'temperature': predict_mean(segment_features, prediction_window)})
-        segment_target_hat.index = segment["y"].index
+def panel_lags(panel: pd.DataFrame, column: Text = "temperature") -> np.ndarray:
+    """
+    Converts one column of a (sample, time) panel with the same length for every sample
+    into a dense array of shape (samples, time), see panel_to_ndarray.
+    """
+    sequence_length = len(panel) // len(panel_sample_labels(panel))
+    return panel_to_ndarray(panel[[column]], sequence_length)[..., 0]
 
-        mean_target_hat[name] = TargetSegment(name)
-        mean_target_hat[name]["y"] = segment_target_hat
 
-    return mean_target_hat
+def to_target_panel(values: np.ndarray, target: pd.DataFrame, column: Text = "temperature") -> pd.DataFrame:
+    """
+    Puts forecasts of shape (samples, time), in the sample order of panel_to_ndarray,
+    back into the row order of the target panel.
+    """
+    values = values.ravel()
+    order = panel_sample_order(target)
+    if order is not None:
+        ordered = np.empty_like(values)
+        ordered[order] = values
+        values = ordered
 
+    return pd.DataFrame({column: values}, index=target.index)
 
-def forecast_constant(
-    dataset: SegmentDataset, prediction_window: int
-) -> SegmentDataset:
-    const_target_hat = SegmentDataset()
-    for name, segment in dataset.segments.items():
-        segment_features = segment["x"]["temperature"]
-        segment_target_hat = pd.DataFrame({'temperature': predict_constant(segment_features)})
-        segment_target_hat.index = segment["y"].index
 
-        const_target_hat[name] = TargetSegment(name)
-        const_target_hat[name]["y"] = segment_target_hat
+def mean_forecast(lags: np.ndarray, prediction_window: int) -> np.ndarray:
+    """
+    Forecasts the mean of the lags of each sample, for lags of shape (samples, time).
+    """
+    return np.repeat(lags.mean(axis=1, keepdims=True), prediction_window, axis=1)
 
-    return const_target_hat
+
+def constant_forecast(lags: np.ndarray, prediction_window: int) -> np.ndarray:
+    """
+    Forecasts that the last prediction_window lags of each sample repeat.
+    """
+    return lags[:, -prediction_window:]
 
 
 def predict_mean(lags: pd.Series, prediction_window: int) -> pd.Series:
-    means = lags.groupby("sample").mean().values.reshape(-1, 1)
-    means = np.repeat(means, prediction_window, -1).ravel()
-    return pd.Series(means, index=lags.index, name=lags.name).reset_index(
-        level=1, drop=True
-    )
+    """
+    Forecasts the mean of the lags of each sample, indexed by sample,
+    with the samples in the order of the lags.
+    """
+    means = lags.groupby(level=0, sort=False).mean()
+    index = means.index.repeat(prediction_window)
+    return pd.Series(np.repeat(means.to_numpy(), prediction_window), index=index, name=lags.name)
 
 
 def predict_constant(lags: pd.Series) -> pd.Series:
     return lags.reset_index(level=1, drop=True)
 
 
-def forecast_regression(
-    dataset: SegmentDataset, prediction_window: int
+def forecast_segments(
+    dataset: SegmentDataset, predict: Callable[[Segment], np.ndarray]
 ) -> SegmentDataset:
-    reg_features = to_regression_shape(dataset["train"]["x"], prediction_window)
+    """
+    Builds the target segments of the forecasts of each segment.
 
-    reg_features["const"] = 1
+    :param predict: forecasts a segment as an array of shape (samples, time),
+        in the sample order of panel_to_ndarray
+    """
+    target_hat = SegmentDataset()
+    for name, segment in dataset.segments.items():
+        target_hat[name] = TargetSegment(name)
+        target_hat[name]["y"] = to_target_panel(predict(segment), segment["y"])
+
+    return target_hat
 
-    reg_target = to_regression_shape(
-        dataset["train"]["y"][["temperature"]], prediction_window
-    )
 
-    reg_target_hat = SegmentDataset()
+def forecast_mean(dataset: SegmentDataset, prediction_window: int) -> SegmentDataset:
+    return forecast_segments(
+        dataset, lambda segment: mean_forecast(panel_lags(segment["x"]), prediction_window)
+    )
 
-    models = [
-        OLS(reg_target[target_name], reg_features).fit()
-        for target_name in reg_target.columns
-    ]
 
-    for name, segment in dataset.segments.items():
-        segment_features = segment["x"]
-        segment_features = to_regression_shape(segment_features, prediction_window)
-        segment_features["const"] = 1
+def forecast_constant(
+    dataset: SegmentDataset, prediction_window: int
+) -> SegmentDataset:
+    return forecast_segments(
+        dataset, lambda segment: constant_forecast(panel_lags(segment["x"]), prediction_window)
+    )
 
-        segment_target_hat_horizons = [result.predict(segment_features) for result in models]
 
-        segment_target_hat = pd.concat(segment_target_hat_horizons, axis=1)  # type: pd.DataFrame
-        segment_target_hat.columns = reg_target.columns
-        segment_target_hat = to_panel_shape(segment_target_hat)
-        segment_target_hat.index = segment["y"].index
+def regression_design(panel: pd.DataFrame, sequence_length: int) -> np.ndarray:
+    """
+    Builds the regression design matrix of shape (samples, time * features + 1),
+    with one row per sample and a constant in the last column.
+    """
+    return ndarray_design(panel_to_ndarray(panel, sequence_length))
+
+
+def ndarray_design(nd: np.ndarray) -> np.ndarray:
+    """
+    Builds the regression design of the samples of an array of shape (samples, time, features),
+    such as a slice of the samples of panel_to_ndarray.
+    """
+    design = np.empty((nd.shape[0], nd.shape[1] * nd.shape[2] + 1), dtype=np.float64)
+    design[:, :-1] = nd.reshape(nd.shape[0], -1)
+    design[:, -1] = 1
+    return design
+
+
+class LeastSquares:
+    """
+    Fits all forecast horizons at once as a multi-output linear regression.
+
+    The normal equations X'X and X'Y can be accumulated batch by batch
+    for designs that do not fit in memory, see update and solve.
+    The constant (last column of the design) is never penalized by the ridge term.
+    """
+
+    def __init__(self, ridge: float = 0.0):
+        self.ridge = ridge
+        self.coef = None  # type: np.ndarray
+        self.xtx = None  # type: np.ndarray
+        self.xty = None  # type: np.ndarray
+
+    def fit(self, x: np.ndarray, y: np.ndarray) -> "LeastSquares":
+        """
+        :param x: the design of shape (samples, features), see regression_design
+        :param y: the targets of shape (samples, horizons)
+        """
+        if self.ridge == 0:
+            # A single least squares solve for all the horizons.
+            self.coef = np.linalg.lstsq(x, y, rcond=None)[0]
+            return self
+
+        self.xtx, self.xty = None, None
+        self.update(x, y)
+        return self.solve()
+
+    def update(self, x: np.ndarray, y: np.ndarray) -> "LeastSquares":
+        """
+        Adds a batch of samples to the normal equations.
+        """
+        if self.xtx is None:
+            self.xtx = np.zeros((x.shape[1], x.shape[1]))
+            self.xty = np.zeros((x.shape[1], y.shape[1]))
+
+        self.xtx += x.T @ x
+        self.xty += x.T @ y
+        return self
+
+    def solve(self) -> "LeastSquares":
+        """
+        Solves the accumulated normal equations.
+        """
+        penalty = np.full(self.xtx.shape[0], self.ridge)
+        penalty[-1] = 0
+        gram = self.xtx + np.diag(penalty)
+
+        # The pseudo-inverse matches lstsq when the design is rank-deficient.
+        self.coef = np.linalg.pinv(gram, hermitian=True) @ self.xty
+        return self
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        return x @ self.coef
+
+
+def fit_regression(
+    train: Segment,
+    prediction_window: int,
+    ridge: float = 0.0,
+    batch_size: int = None,
+) -> LeastSquares:
+    """
+    Fits one linear regression of all horizons on the lags of all features of the train segment.
+
+    :param ridge: the L2 penalty on the coefficients
+    :param batch_size: when set, the normal equations are accumulated
+        over batches of this many samples instead of solving on the full design,
+        and only the design of one batch is built at a time
+    """
+    reg_target = panel_to_ndarray(train["y"][["temperature"]], prediction_window)[..., 0]
+
+    model = LeastSquares(ridge)
+    if batch_size is None:
+        return model.fit(regression_design(train["x"], prediction_window), reg_target)
+
+    # A view of the panel when it is sorted by sample, see panel_to_ndarray.
+    lags = panel_to_ndarray(train["x"], prediction_window)
+    for start in range(0, len(lags), batch_size):
+        end = start + batch_size
+        model.update(ndarray_design(lags[start:end]), reg_target[start:end])
+    return model.solve()
 
-        reg_target_hat[name] = TargetSegment(name)
-        reg_target_hat[name]["y"] = segment_target_hat
 
-    return reg_target_hat
+def forecast_regression(
+    dataset: SegmentDataset,
+    prediction_window: int,
+    ridge: float = 0.0,
+    batch_size: int = None,
+) -> SegmentDataset:
+    """
+    Forecasts all horizons with one linear regression on the lags of all features,
+    fitted on the train segment, see fit_regression.
+    """
+    model = fit_regression(dataset["train"], prediction_window, ridge, batch_size)
+    return forecast_segments(
+        dataset, lambda segment: model.predict(regression_design(segment["x"], prediction_window))
+    )
 
 
 def compare_datasets(
@@ -236,44 +724,305 @@ def evaluate_forecast(y: pd.Series, y_hat: pd.Series, name: Text) -> pd.DataFram
     )
 
 
-def evaluate_forecasts(future: pd.Series, forecasts: pd.Series) -> pd.DataFrame:
-    metrics_by_sample = pd.concat(
-        [
-            evaluate_forecast(future.loc[sample], forecasts.loc[sample], sample)
-            for sample in forecasts.index.levels[0]
-        ]
-    )
-    return metrics_by_sample
+class ForecastMetrics:
+    """
+    Accumulates forecast errors of many samples at once,
+    and computes ME, MSE, MAE and R2 of each sample, plus sMAPE and MASE as used in M4.
+
+    The sums are grouped by sample with np.bincount,
+    so the panel can be fed in any number of chunks in any order.
+    MASE is reported once the in-sample history is added with update_past.
+    """
+
+    # Per-sample sums of: count, y, y_hat, (y - mean y)^2, (y - y_hat)^2, |y - y_hat|, sMAPE terms.
+    # The squares of y are centred on the sample's mean, since y^2 - (sum y)^2 / n
+    # cancels catastrophically for series with a large mean and a small variance.
+    n_sums = 7
+
+    def __init__(self, seasonality: int = 1):
+        """
+        :param seasonality: the lag of the seasonal naive forecast that scales MASE
+        """
+        self.seasonality = seasonality
+        self.samples = pd.Index([])
+        self.sums = np.zeros((0, self.n_sums))
+        self.scale_sums = np.zeros((0, 2))
+
+    def _positions(self, labels: pd.Index) -> np.ndarray:
+        codes, uniques = pd.factorize(labels)
+
+        positions = self.samples.get_indexer(uniques)
+        new = positions < 0
+        if new.any():
+            positions[new] = np.arange(new.sum()) + len(self.samples)
+            self.samples = self.samples.append(uniques[new])
+            self.sums = np.vstack([self.sums, np.zeros((new.sum(), self.n_sums))])
+            self.scale_sums = np.vstack([self.scale_sums, np.zeros((new.sum(), 2))])
+
+        return positions[codes]
+
+    def update(self, future: pd.Series, forecasts: pd.Series) -> "ForecastMetrics":
+        """
+        Adds a chunk of actuals and forecasts indexed by (sample, time).
+        """
+        if not future.index.equals(forecasts.index):
+            future = future.reindex(forecasts.index)
+
+        positions = self._positions(forecasts.index.get_level_values(0))
+        y = future.to_numpy(dtype=np.float64)
+        y_hat = forecasts.to_numpy(dtype=np.float64)
+        error = y - y_hat
+
+        denominator = np.abs(y) + np.abs(y_hat)
+        smape_terms = np.divide(
+            np.abs(error), denominator, out=np.zeros_like(error), where=denominator != 0
+        )
+
+        n_samples = len(self.samples)
+        chunk_count = np.bincount(positions, minlength=n_samples).astype(np.float64)
+        chunk_sum = np.bincount(positions, y, minlength=n_samples)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            chunk_mean = np.where(chunk_count > 0, chunk_sum / chunk_count, 0)
+        chunk_m2 = np.bincount(positions, (y - chunk_mean[positions]) ** 2, minlength=n_samples)
+        self._merge_m2(chunk_count, chunk_sum, chunk_m2)
+
+        terms = {2: y_hat, 4: error ** 2, 5: np.abs(error), 6: smape_terms}
+        for column, weights in terms.items():
+            self.sums[:, column] += np.bincount(positions, weights, minlength=n_samples)
+
+        return self
+
+    def _merge_m2(self, chunk_count: np.ndarray, chunk_sum: np.ndarray, chunk_m2: np.ndarray):
+        """
+        Merges the centred sums of squares of a chunk into the totals of each sample,
+        with the parallel variance algorithm of Chan et al.
+        """
+        count, total = self.sums[:, 0], self.sums[:, 1]
+        merged_count = count + chunk_count
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            delta = np.where(chunk_count > 0, chunk_sum / chunk_count, 0) - np.where(count > 0, total / count, 0)
+            correction = np.where(merged_count > 0, delta ** 2 * count * chunk_count / merged_count, 0)
+
+        self.sums[:, 3] += chunk_m2 + correction
+        self.sums[:, 0] = merged_count
+        self.sums[:, 1] += chunk_sum
+
+    def update_past(self, past: pd.Series) -> "ForecastMetrics":
+        """
+        Adds the in-sample history, sorted by time within each sample, that scales MASE.
+        """
+        positions = self._positions(past.index.get_level_values(0))
+        values = past.to_numpy(dtype=np.float64)
+
+        m = self.seasonality
+        same_sample = positions[m:] == positions[:-m]
+        naive_errors = np.abs(values[m:] - values[:-m])[same_sample]
+        naive_positions = positions[m:][same_sample]
+
+        self.scale_sums[:, 0] += np.bincount(naive_positions, naive_errors, minlength=len(self.samples))
+        self.scale_sums[:, 1] += np.bincount(naive_positions, minlength=len(self.samples))
+        return self
+
+    def result(self) -> pd.DataFrame:
+        count, y, y_hat, ss_tot, sq_error, abs_error, smape_terms = self.sums.T
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # A spread within the rounding error of the squares is a constant target.
+            y2 = ss_tot + y ** 2 / count
+            constant = ss_tot <= np.finfo(np.float64).eps * y2
+            # Same as sklearn: constant targets score 1 when predicted exactly, else 0.
+            r2 = np.where(~constant, 1 - sq_error / ss_tot, np.where(sq_error == 0, 1.0, 0.0))
+
+            metrics = {
+                "ME": (y - y_hat) / count,
+                "MSE": sq_error / count,
+                "MAE": abs_error / count,
+                "R2": r2,
+                "sMAPE": 200 * smape_terms / count,
+            }
+
+            if self.scale_sums[:, 1].any():
+                scale = self.scale_sums[:, 0] / self.scale_sums[:, 1]
+                metrics["MASE"] = (abs_error / count) / scale
+
+        metrics = pd.DataFrame(metrics, index=self.samples)[count > 0]
+        return metrics.sort_index()
+
+
+def evaluate_forecasts(
+    future: pd.Series,
+    forecasts: pd.Series,
+    past: pd.Series = None,
+    seasonality: int = 1,
+) -> pd.DataFrame:
+    """
+    Computes the metrics of each sample's forecast, see ForecastMetrics.
 
+    :param past: the in-sample history, required for MASE
+    :param seasonality: the seasonal lag that scales MASE, such as 7 for daily series
+    """
+    metrics_by_sample = ForecastMetrics(seasonality).update(future, forecasts)
+
+    if past is not None:
+        metrics_by_sample.update_past(past)
+
+    return metrics_by_sample.result()
+
+
+def panel_to_ndarray(panel: pd.DataFrame, sequence_length: int) -> np.ndarray:
+    """
+    Converts a (sample, time) panel into a dense array of shape (samples, time, features).
+
+    The rows of each sample must be in time order.
+    When the panel is already sorted by sample and has a single dtype,
+    the result is a view of the panel's values without a copy.
+    """
+    values = panel.to_numpy()
+    if values.ndim == 1:
+        values = values.reshape(-1, 1)
+
+    order = panel_sample_order(panel)
+    if order is not None:
+        values = values[order]
+
+    return values.reshape(-1, sequence_length, values.shape[-1])
+
+
+def panel_sample_codes(panel: Union[pd.DataFrame, pd.Series]) -> np.ndarray:
+    """
+    Returns the integer codes of the sample level, ordered like the sample labels.
+    """
+    index = panel.index
+    if index.levels[0].is_monotonic_increasing:
+        return index.codes[0]
+    return pd.factorize(index.get_level_values(0), sort=True)[0]
+
+
+def panel_sample_labels(panel: Union[pd.DataFrame, pd.Series]) -> pd.Index:
+    """
+    Returns the sample labels that the codes of panel_sample_codes refer to.
+    """
+    index = panel.index
+    if index.levels[0].is_monotonic_increasing:
+        return index.levels[0]
+    return pd.Index(np.sort(index.get_level_values(0).unique()))
+
+
+def panel_sample_order(panel: Union[pd.DataFrame, pd.Series]) -> Union[np.ndarray, None]:
+    """
+    Returns the row order that sorts the panel by sample, keeping the time order,
+    or None when the panel is already sorted.
+    """
+    codes = panel_sample_codes(panel)
+    if (np.diff(codes) >= 0).all():
+        return None
+    return np.argsort(codes, kind="stable")
+
+
+def panel_samples(panel: Union[pd.DataFrame, pd.Series], sequence_length: int) -> pd.Index:
+    """
+    Returns the sample labels in the order of panel_to_ndarray.
+    """
+    rows = np.arange(0, len(panel), sequence_length)
+    order = panel_sample_order(panel)
+    if order is not None:
+        rows = order[rows]
+
+    return panel.index.get_level_values(0)[rows]
 
-def to_regression_shape(panel: pd.DataFrame, sequence_length: int):
-    # timer is a repetitive 0, 1, ..., S array
-    # that counts the time step within each sequence
-    timer = np.arange(0, sequence_length).reshape(-1, sequence_length)
-    timer = np.repeat(timer, panel.shape[0] / sequence_length, 0).ravel()
 
-    tf = panel.reset_index("time")
-    tf["time"] = timer
-    tf = tf.set_index("time", append=True).unstack("time")
+def to_regression_shape(panel: pd.DataFrame, sequence_length: int):
+    # Each row becomes one sample,
+    # and each column is a (feature, time step) pair.
+    nd = panel_to_ndarray(panel, sequence_length)
+    n_samples, _, n_features = nd.shape
 
-    return tf
+    columns = pd.MultiIndex.from_product(
+        [panel.columns, np.arange(sequence_length)], names=[panel.columns.name, "time"]
+    )
+    return pd.DataFrame(
+        nd.transpose(0, 2, 1).reshape(n_samples, n_features * sequence_length),
+        index=panel_samples(panel, sequence_length),
+        columns=columns,
+    )
 
 
 def to_panel_shape(reg: pd.DataFrame) -> Union[pd.DataFrame, pd.Series]:
-    return reg.stack("time")
+    times = reg.columns.get_level_values("time").unique()
+
+    if reg.columns.nlevels == 1:
+        values = reg.to_numpy()
+        index = pd.MultiIndex.from_product([reg.index, times])
+        return pd.Series(values.ravel(), index=index)
+
+    features = reg.columns.droplevel("time").unique()
+    expected = pd.MultiIndex.from_product([features, times], names=reg.columns.names)
+    if not reg.columns.equals(expected):
+        reg = reg.reindex(columns=expected)
+
+    # (samples, features, time) -> (samples * time, features)
+    values = reg.to_numpy().reshape(len(reg), len(features), len(times))
+    values = values.transpose(0, 2, 1).reshape(-1, len(features))
+
+    index = pd.MultiIndex.from_product([reg.index, times])
+    return pd.DataFrame(values, index=index, columns=features)
+
+
+def score_forecasts(y: np.ndarray, y_hat: np.ndarray) -> np.ndarray:
+    """
+    Scores several forecasts of the same targets in one vectorized pass.
+
+    :param y: the targets of any shape
+    :param y_hat: the forecasts of shape (models, *y.shape)
+    :return: the array of shape (models, 4) with ME, MSE, MAE and R2 of each model
+    """
+    y = y.reshape(1, -1)
+    y_hat = y_hat.reshape(y_hat.shape[0], -1)
+    error = y - y_hat
+
+    mse = (error ** 2).mean(axis=1)
+    ss_tot = ((y - y.mean()) ** 2).mean()
+    r2 = 1 - mse / ss_tot if ss_tot > 0 else np.where(mse == 0, 1.0, 0.0)
+
+    return np.stack([error.mean(axis=1), mse, np.abs(error).mean(axis=1), r2], axis=1)
+
+
+def baseline_metrics(panel_dataset: SegmentDataset, max_workers: int = None) -> pd.DataFrame:
+    """
+    Scores the mean, constant and regression baselines on every segment.
+
+    Each segment is converted into dense (samples, time) arrays once,
+    all the baselines are forecast as arrays and scored together,
+    and the segments are processed in parallel on a thread pool.
+
+    :param max_workers: the size of the thread pool, defaults to one thread per segment
+    """
+    if not panel_dataset.segments:
+        return pd.DataFrame()
+
+    train = panel_dataset["train"]
+    prediction_window = np.bincount(panel_sample_codes(train["y"])).max()
+
+    regression = fit_regression(train, prediction_window)
+
+    models = ["mean", "constant", "regression"]
 
+    def score_segment(segment: Segment) -> pd.DataFrame:
+        y = panel_to_ndarray(segment["y"][["temperature"]], prediction_window)[..., 0]
+        lags = panel_lags(segment["x"])
 
-def baseline_metrics(panel_dataset: SegmentDataset) -> pd.DataFrame:
-    prediction_window = panel_dataset["train"]["y"].groupby("sample").size().max()
+        y_hat = np.stack([
+            mean_forecast(lags, prediction_window),
+            constant_forecast(lags, prediction_window),
+            regression.predict(regression_design(segment["x"], prediction_window)),
+        ])
 
-    models = {
-        "mean": forecast_mean,
-        "constant": forecast_constant,
-        "regression": forecast_regression,
-    }
+        scores = score_forecasts(y, y_hat)
+        return pd.DataFrame(scores, index=models, columns=["ME", "MSE", "MAE", "R2"]).round(2)
 
-    models = {
-        name: fun(panel_dataset, prediction_window) for name, fun in models.items()
-    }
+    segment_names = list(panel_dataset.segments.keys())
+    with ThreadPoolExecutor(max_workers=max_workers or max(1, len(segment_names))) as executor:
+        scores_by_segment = list(executor.map(score_segment, panel_dataset.segments.values()))
 
-    return compare_datasets(panel_dataset, models)
+    return pd.concat(scores_by_segment, axis=1, keys=segment_names)
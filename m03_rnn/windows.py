@@ -0,0 +1,189 @@
+from typing import Iterable, Optional, Sequence, Text
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from collegium.m03_rnn.utils import Segment, panel_sample_codes, panel_sample_order
+
+
+class StreamingScaler:
+    """
+    Standardizes features like sklearn's StandardScaler,
+    but fits the mean and variance in a single streaming pass over chunks of rows.
+
+    The chunks are merged with the parallel variance algorithm of Chan et al.
+    https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Parallel_algorithm
+    """
+
+    def __init__(self):
+        self.n_samples_seen_ = 0
+        self.mean_ = None  # type: np.ndarray
+        self.m2_ = None  # type: np.ndarray
+
+    def partial_fit(self, x: np.ndarray) -> "StreamingScaler":
+        x = np.asarray(x, dtype=np.float64).reshape(len(x), -1)
+        n = len(x)
+        if n == 0:
+            return self
+
+        mean = x.mean(axis=0)
+        m2 = ((x - mean) ** 2).sum(axis=0)
+
+        if self.mean_ is None:
+            self.n_samples_seen_, self.mean_, self.m2_ = n, mean, m2
+            return self
+
+        total = self.n_samples_seen_ + n
+        delta = mean - self.mean_
+        self.mean_ = self.mean_ + delta * n / total
+        self.m2_ = self.m2_ + m2 + delta ** 2 * self.n_samples_seen_ * n / total
+        self.n_samples_seen_ = total
+        return self
+
+    def fit(self, chunks: Iterable[np.ndarray]) -> "StreamingScaler":
+        for chunk in chunks:
+            self.partial_fit(chunk)
+        return self
+
+    @property
+    def var_(self) -> np.ndarray:
+        return self.m2_ / self.n_samples_seen_
+
+    @property
+    def scale_(self) -> np.ndarray:
+        scale = np.sqrt(self.var_)
+        # Same as sklearn: constant features are left unscaled.
+        scale[scale == 0] = 1
+        return scale
+
+    def transform(self, x: np.ndarray) -> np.ndarray:
+        return (np.asarray(x) - self.mean_) / self.scale_
+
+
+class WindowGenerator:
+    """
+    Slices (lags, horizon) windows from long time series on the fly.
+
+    The panel is indexed by (sample, time), where each sample is one series.
+    Its values are kept once as tensors sorted by sample, which every dataset reuses,
+    and only the start of each window is materialized.
+    The windows are gathered batch by batch inside a tf.data pipeline.
+    """
+
+    def __init__(
+        self,
+        panel: pd.DataFrame,
+        lags: int,
+        horizon: int,
+        target_column: Text,
+        feature_columns: Optional[Sequence[Text]] = None,
+        stride: int = 1,
+        scaler: Optional[StreamingScaler] = None,
+    ):
+        """
+        :param panel: the long panel of shape (samples * time, columns)
+        :param lags: the number of time steps of the features in each window
+        :param horizon: the number of time steps of the target after the lags
+        :param target_column: the column to forecast
+        :param feature_columns: the columns of the features, defaults to all
+        :param stride: the number of time steps between consecutive windows of a series
+        :param scaler: a fitted scaler for the features, see StreamingScaler
+        """
+        self.lags = lags
+        self.horizon = horizon
+        self.stride = stride
+        self.scaler = scaler
+
+        if feature_columns is None:
+            feature_columns = list(panel.columns)
+
+        order = panel_sample_order(panel)
+        codes = panel_sample_codes(panel)
+        if order is not None:
+            panel = panel.iloc[order]
+            codes = codes[order]
+
+        # The tensors are built once, without keeping NumPy copies of the panel alongside.
+        with tf.device("/CPU:0"):
+            self.features = tf.constant(panel[list(feature_columns)].to_numpy(dtype=np.float32))
+            self.target = tf.constant(panel[target_column].to_numpy(dtype=np.float32))
+
+        lengths = np.bincount(codes)
+        lengths = lengths[lengths > 0]
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
+        self.starts = window_starts(self.offsets, lags + horizon, stride)
+
+    @classmethod
+    def from_segment(cls, segment: Segment, frame_name: Text = "x", **kwargs) -> "WindowGenerator":
+        return cls(segment[frame_name], **kwargs)
+
+    def fit_scaler(self, chunk_size: int = 2 ** 20) -> StreamingScaler:
+        """
+        Fits the feature scaler in a streaming pass over the panel.
+        """
+        self.scaler = StreamingScaler().fit(
+            self.features[start:start + chunk_size].numpy()
+            for start in range(0, len(self.features), chunk_size)
+        )
+        return self.scaler
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def dataset(
+        self,
+        batch_size: int = 256,
+        shuffle: bool = True,
+        seed: Optional[int] = None,
+    ) -> tf.data.Dataset:
+        """
+        Builds the dataset of (features, target) batches,
+        with features of shape (batch, lags, features) and target of shape (batch, horizon).
+        """
+        features, target = self.features, self.target
+
+        if self.scaler is not None:
+            mean = tf.constant(self.scaler.mean_, tf.float32)
+            scale = tf.constant(self.scaler.scale_, tf.float32)
+        else:
+            mean, scale = tf.constant(0.0), tf.constant(1.0)
+
+        lag_steps = tf.range(self.lags, dtype=tf.int64)
+        horizon_steps = tf.range(self.lags, self.lags + self.horizon, dtype=tf.int64)
+
+        def gather_windows(starts: tf.Tensor):
+            x = tf.gather(features, starts[:, None] + lag_steps[None, :])
+            y = tf.gather(target, starts[:, None] + horizon_steps[None, :])
+            return (x - mean) / scale, y
+
+        # The window starts are shuffled as a whole tensor on every iteration,
+        # which avoids a shuffle buffer with one element per window.
+        dataset = tf.data.Dataset.from_tensors(self.starts)
+        if shuffle:
+            dataset = dataset.map(lambda starts: tf.random.shuffle(starts, seed=seed))
+
+        dataset = dataset.flat_map(
+            lambda starts: tf.data.Dataset.from_tensor_slices(starts).batch(batch_size)
+        )
+        dataset = dataset.map(gather_windows, num_parallel_calls=tf.data.AUTOTUNE)
+        return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def window_starts(offsets: np.ndarray, window: int, stride: int = 1) -> np.ndarray:
+    """
+    Returns the starting rows of all the windows that fit within each series.
+
+    :param offsets: the first row of each series, followed by the total row count
+    :param window: the number of rows in a window
+    :param stride: the number of rows between consecutive windows of a series
+    """
+    lengths = np.diff(offsets)
+    counts = np.maximum(lengths - window, -1) // stride + 1
+
+    # Position of each window within its series, computed without a Python loop.
+    series = np.repeat(np.arange(len(counts)), counts)
+    first_window = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    within = np.arange(counts.sum()) - first_window[series]
+
+    return offsets[:-1][series] + within * stride
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+
+import gc
+import json
+import logging
+import os
+import resource
+import tempfile
+import threading
+import time
+from functools import partial
+from typing import Callable, Dict, List, Optional, Text, Union
+
+import clize
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from PIL import Image
+
+from collegium.m04_gan.fakenet_dataset import (
+    IMAGE_SHAPE,
+    build_dataset_labeled_paired,
+    build_dataset_labeled_single,
+    build_dataset_score_paired,
+    build_dataset_score_single,
+)
+from collegium.m04_gan.image_store import ImageStore
+
+
+def write_synthetic_dataset(dataset_dir: Text, n_pairs: int = 256, seed: int = 0) -> pd.DataFrame:
+    """
+    Writes a fakenet_dataset of random 224x224 PNGs, with the train and score metadata.csv.
+
+    :return: the train metadata
+    """
+    rng = np.random.default_rng(seed)
+
+    for split in ['train', 'score']:
+        os.makedirs(f'{dataset_dir}/{split}/images', exist_ok=True)
+        for i in range(2 * n_pairs):
+            pixels = rng.integers(0, 256, size=IMAGE_SHAPE, dtype=np.uint8)
+            Image.fromarray(pixels).save(f'{dataset_dir}/{split}/images/{i}.png')
+
+    names_a = [f'{2 * i}.png' for i in range(n_pairs)]
+    names_b = [f'{2 * i + 1}.png' for i in range(n_pairs)]
+
+    train = pd.DataFrame({'file_name_training': names_a, 'file_name_generated': names_b})
+    train.to_csv(f'{dataset_dir}/train/metadata.csv', index=False)
+    pd.DataFrame({'file_name_a': names_a, 'file_name_b': names_b}).to_csv(
+        f'{dataset_dir}/score/metadata.csv', index=False
+    )
+    return train
+
+
+class PeakRss:
+    """
+    Samples the resident set size of the process on a background thread, in MiB.
+
+    Unlike ru_maxrss, which is the peak since the process started,
+    this is the peak while the context is open.
+    The RSS of the process only grows across the runs of a benchmark,
+    so the runs are compared by delta_mb, the peak above the RSS on entry.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.start_mb = 0.0
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current_mb() -> float:
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+        except OSError:
+            # ru_maxrss is in KiB on Linux.
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, self.current_mb())
+            self._stop.wait(self.interval)
+
+    @property
+    def delta_mb(self) -> float:
+        return max(0.0, self.peak_mb - self.start_mb)
+
+    def __enter__(self) -> 'PeakRss':
+        self.start_mb = self.peak_mb = self.current_mb()
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, self.current_mb())
+
+
+def count_images(element) -> int:
+    """
+    Counts the images of a batch, in all its tensors of shape (batch, height, width, channels).
+    """
+    return sum(int(t.shape[0]) for t in tf.nest.flatten(element) if t.shape.rank == 4)
+
+
+def measure(
+    dataset: Union[tf.data.Dataset, Callable[[], tf.data.Dataset]],
+    epochs: int = 1,
+) -> Dict[Text, float]:
+    """
+    Iterates a batched dataset and measures the throughput,
+    the latency of each element, and the peak RSS above the RSS before the run.
+
+    :param dataset: the dataset, or a function that builds it,
+        so that the memory of building it, such as an in-memory ImageStore, is measured too
+    :param epochs: the number of passes, to include the epochs after the first for cached pipelines
+    """
+    latencies = []
+    n_images = 0
+
+    with PeakRss() as rss:
+        if callable(dataset):
+            dataset = dataset()
+
+        start = time.perf_counter()
+        for _ in range(epochs):
+            previous = time.perf_counter()
+            for element in dataset:
+                now = time.perf_counter()
+                latencies.append(now - previous)
+                n_images += count_images(element)
+                previous = now
+        seconds = time.perf_counter() - start
+
+    # An empty dataset has no latencies.
+    latencies_ms = np.array(latencies) * 1000
+    percentiles = np.percentile(latencies_ms, [50, 90, 99]) if len(latencies) > 0 else [np.nan] * 3
+
+    return {
+        'elements': len(latencies),
+        'images': n_images,
+        'seconds': seconds,
+        'images_per_second': n_images / seconds if seconds > 0 else 0.0,
+        'latency_p50_ms': float(percentiles[0]),
+        'latency_p90_ms': float(percentiles[1]),
+        'latency_p99_ms': float(percentiles[2]),
+        'peak_rss_mb': rss.peak_mb,
+        'peak_rss_delta_mb': rss.delta_mb,
+    }
+
+
+def benchmark_pipelines(
+    dataset_dir: Text,
+    metadata: pd.DataFrame,
+    store_dir: Text,
+    batch_size: int = 32,
+    epochs: int = 2,
+) -> List[Dict]:
+    """
+    Measures each fakenet builder when decoding the PNGs, when reading an ImageStore
+    through its memory map and when reading it in memory,
+    and the labeled paired builder with its in-memory cache.
+
+    Each pipeline opens its own stores when it is built inside measure,
+    and they are released before the next pipeline,
+    so that the memory of one mode does not count towards the others.
+
+    :param store_dir: the folder of the image stores
+    """
+    # Decodes the stores once, outside of the measurements.
+    for split in ['train', 'score']:
+        ImageStore.open(f'{dataset_dir}/{split}/images', f'{store_dir}/{split}', in_memory=False)
+
+    def open_store(split: Text, mode: Text) -> Optional[ImageStore]:
+        if mode == 'decode':
+            return None
+        return ImageStore.open(
+            f'{dataset_dir}/{split}/images', f'{store_dir}/{split}', in_memory=mode == 'memory'
+        )
+
+    pipelines: Dict[Text, Callable[[], tf.data.Dataset]] = {}
+    for mode in ['decode', 'store', 'memory']:
+        pipelines.update({
+            f'labeled_paired/{mode}': lambda mode=mode: build_dataset_labeled_paired(
+                metadata, dataset_dir, batch_size, seed=0, store=open_store('train', mode)),
+            f'labeled_single/{mode}': lambda mode=mode: build_dataset_labeled_single(
+                metadata, dataset_dir, batch_size, store=open_store('train', mode)),
+            f'score_single/{mode}': lambda mode=mode: build_dataset_score_single(
+                dataset_dir, batch_size, store=open_store('score', mode)),
+            f'score_paired/{mode}': lambda mode=mode: build_dataset_score_paired(
+                dataset_dir, batch_size, store=open_store('score', mode)),
+        })
+    pipelines['labeled_paired/cache'] = partial(
+        build_dataset_labeled_paired, metadata, dataset_dir, batch_size, seed=0, cache=True)
+
+    results = []
+    for name, build in pipelines.items():
+        result = {'pipeline': name, **measure(build, epochs)}
+        logging.info(f'{name}: {result["images_per_second"]:.0f} images/s, '
+                     f'p50 {result["latency_p50_ms"]:.1f}ms, peak RSS +{result["peak_rss_delta_mb"]:.0f}MiB')
+        results.append(result)
+        # Releases the dataset and its stores before the next pipeline.
+        gc.collect()
+
+    return results
+
+
+def run_benchmark(
+    output_path: Text = 'fakenet_benchmark.json',
+    *,
+    n_pairs: int = 256,
+    batch_size: int = 32,
+    epochs: int = 2,
+    dataset_dir: Text = '',
+) -> Dict:
+    """
+    Benchmarks the fakenet input pipelines on the CPU, over a synthetic dataset,
+    and writes the JSON report.
+
+    :param output_path: the path of the JSON report
+    :param n_pairs: the number of image pairs of each split
+    :param batch_size: the batch size of every pipeline
+    :param epochs: the number of passes over each pipeline
+    :param dataset_dir: an existing fakenet_dataset to use instead of a synthetic one, if not empty
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if not dataset_dir:
+            dataset_dir = f'{tmp_dir}/fakenet_dataset'
+            metadata = write_synthetic_dataset(dataset_dir, n_pairs)
+        else:
+            metadata = pd.read_csv(f'{dataset_dir}/train/metadata.csv')
+
+        results = benchmark_pipelines(dataset_dir, metadata, f'{tmp_dir}/stores', batch_size, epochs)
+
+    report = {
+        'config': {'n_pairs': len(metadata), 'batch_size': batch_size, 'epochs': epochs,
+                   'cpu_count': os.cpu_count()},
+        'results': results,
+    }
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    return report
+
+
+if __name__ == '__main__':
+    # The benchmark measures the input pipelines on the CPU only.
+    tf.config.set_visible_devices([], 'GPU')
+    logging.basicConfig(level=logging.INFO, force=True)
+    clize.run(run_benchmark)
@@ -0,0 +1,143 @@
+import ast
+import json
+import os
+import re
+from typing import List, Optional, Sequence, Text, Union
+
+import numpy as np
+from cachetools import LRUCache, cached
+
+from collegium.m02_cnn.utils.label_maps import LabelMap
+
+M04_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ClassesLike = Union[Sequence[int], Sequence[Text], np.ndarray]
+
+
+class ClassCatalogue:
+    """
+    The classes of a class-conditional generator, such as the 1000 ImageNet classes of BigGAN,
+    with batched lookups for building the conditioning inputs of many samples at once.
+
+    Classes can be given by id, by full name ("tench, Tinca tinca")
+    or by any of the synonyms in the name ("tench").
+    When a synonym is shared by several classes, such as "crane", it refers to the first one.
+    """
+
+    def __init__(self, ids: Sequence[int], names: Sequence[Text]):
+        self.label_map = LabelMap(ids, names)
+
+        # Every full name and every synonym points to the id of its class.
+        alias_ids, aliases = [], []
+        for class_id, name in zip(self.label_map.ids, self.label_map.names):
+            for alias in [name, *(synonym.strip() for synonym in name.split(','))]:
+                alias_ids.append(class_id)
+                aliases.append(alias)
+        self.alias_map = LabelMap(alias_ids, aliases)
+
+    def __len__(self) -> int:
+        return len(self.label_map)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self.label_map.ids
+
+    @property
+    def names(self) -> np.ndarray:
+        return self.label_map.names
+
+    def to_names(self, ids) -> np.ndarray:
+        return self.label_map.to_names(ids)
+
+    def to_ids(self, classes: ClassesLike) -> np.ndarray:
+        """
+        Converts an array of class ids, names or synonyms into an array of ids.
+        Raises KeyError for unknown classes.
+        """
+        classes = np.asarray(classes)
+        if np.issubdtype(classes.dtype, np.integer):
+            # Raises KeyError for unknown ids.
+            self.label_map.to_positions(classes)
+            return classes.astype(np.int64)
+        return self.alias_map.to_ids(classes)
+
+    def one_hot(self, classes: ClassesLike, dtype=np.float32) -> np.ndarray:
+        """
+        Builds the one-hot vectors of a batch of classes, of shape (batch, classes),
+        where the column of a class is its position in the catalogue.
+        """
+        positions = self.positions(classes)
+        vectors = np.zeros((len(positions), len(self)), dtype=dtype)
+        vectors[np.arange(len(positions)), positions] = 1
+        return vectors
+
+    def embed(self, classes: ClassesLike, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Looks up the class embeddings of a batch of classes,
+        which equals one_hot(classes) @ embeddings without building the one-hot vectors.
+
+        :param embeddings: the array of shape (classes, dim), one row per class of the catalogue
+        """
+        return np.asarray(embeddings)[self.positions(classes)]
+
+    def positions(self, classes: ClassesLike) -> np.ndarray:
+        return self.label_map.to_positions(self.to_ids(np.atleast_1d(classes)))
+
+
+@cached(cache=LRUCache(maxsize=4))
+def load_biggan_classes(path: Optional[Text] = None) -> ClassCatalogue:
+    """
+    Loads the classes of biggan_classes.json once per process.
+    Each entry of the file reads like "0) tench, Tinca tinca".
+    """
+    with open(path or os.path.join(M04_DIR, 'biggan_classes.json')) as f:
+        entries = json.load(f)
+
+    items = [re.match(r'\s*(\d+)\)\s*(.*)', entry).groups() for entry in entries]
+    return ClassCatalogue([int(i) for i, _ in items], [name.strip() for _, name in items])
+
+
+def find_prompts(source: Text) -> List[Text]:
+    """
+    Finds the prompts in Python code: the prompt= keyword arguments,
+    and the strings assigned to a variable named p or prompt.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return []
+
+    prompts = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.keyword) and node.arg == 'prompt':
+            value = node.value
+        elif isinstance(node, ast.Assign) and any(
+            isinstance(t, ast.Name) and t.id in ('p', 'prompt') for t in node.targets
+        ):
+            value = node.value
+        else:
+            continue
+
+        if isinstance(value, ast.Constant) and isinstance(value.value, str):
+            prompts.append(value.value)
+
+    return prompts
+
+
+@cached(cache=LRUCache(maxsize=4))
+def load_stable_diffusion_prompts(path: Optional[Text] = None) -> LabelMap:
+    """
+    Loads the prompts of the StableDiffusion.json notebook once per process,
+    as a LabelMap from the prompt's id, in the order of the notebook, to its text.
+    """
+    with open(path or os.path.join(M04_DIR, 'StableDiffusion.json')) as f:
+        notebook = json.load(f)
+
+    prompts = []
+    for cell in notebook['cells']:
+        if cell['cell_type'] == 'code':
+            for prompt in find_prompts(''.join(cell['source'])):
+                if prompt not in prompts:
+                    prompts.append(prompt)
+
+    return LabelMap(range(len(prompts)), prompts)
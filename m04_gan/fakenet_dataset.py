@@ -1,150 +1,200 @@
+from typing import Optional, Text, Union
+
 import numpy as np
-from PIL import Image
 import tensorflow as tf
 import pandas as pd
 
+from collegium.m04_gan.image_store import ImageStore
 
-# See Python Generator
-# https://peps.python.org/pep-0255/
-def generator_score_single():
-    metadata = pd.read_csv('fakenet_dataset/score/metadata.csv')
-    
-    for _, row in metadata.iterrows():
-        image_a_path = 'fakenet_dataset/score/images/' + row['file_name_a']
-        image_b_path = 'fakenet_dataset/score/images/' + row['file_name_b']
-
-        image_a_np = np.array(Image.open(image_a_path))
-        image_b_np = np.array(Image.open(image_b_path))
-
-        model_input = image_a_np
-        yield model_input
-
-        # Uncomment if you want to compare the two images after inference
-        # model_input = image_b_np
-        # yield model_input
+IMAGE_SHAPE = (224, 224, 3)
 
 
-# See Tensorflow Dataset
-# https://www.tensorflow.org/api_docs/python/tf/data/Dataset
-def build_dataset_score_single() -> tf.data.Dataset:
-    model_input = tf.TensorSpec(shape=(224, 224, 3), dtype=tf.float32)  # type: ignore
-
-    dataset_signature = model_input
+def decode_image(path: tf.Tensor) -> tf.Tensor:
+    """
+    Reads and decodes one PNG or JPEG image into float32 pixels in [0, 255].
+    """
+    image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    return tf.cast(tf.ensure_shape(image, IMAGE_SHAPE), tf.float32)
 
-    dataset = tf.data.Dataset.from_generator(
-        generator_score_single, 
-        output_signature=dataset_signature
-    )
 
-    return dataset
+def image_paths(metadata: pd.DataFrame, column: Text, images_dir: Text) -> np.ndarray:
+    return (images_dir + '/' + metadata[column].astype(str)).to_numpy()
 
 
-# See Python Generator
-# https://peps.python.org/pep-0255/
-def build_generator_labeled_paired(metadata: pd.DataFrame):
-    def generator():
-        for _, row in metadata.iterrows():
-            training_path = 'fakenet_dataset/train/images/' + row['file_name_training']
-            generated_path = 'fakenet_dataset/train/images/' + row['file_name_generated']
+def image_keys(
+    metadata: pd.DataFrame,
+    column: Text,
+    images_dir: Text,
+    store: Optional[ImageStore] = None,
+) -> np.ndarray:
+    """
+    Returns the paths of the images to decode, or their rows in the store when one is given.
+    """
+    if store is None:
+        return image_paths(metadata, column, images_dir)
+    return store.rows(metadata[column])
 
-            training_np = np.array(Image.open(training_path))
-            generated_np = np.array(Image.open(generated_path))
 
-            model_output = np.random.randint(low=0, high=2, size=1)
+def read_image(key: tf.Tensor, store: Optional[ImageStore] = None) -> tf.Tensor:
+    """
+    Decodes the image at a path, or reads the already decoded image of a row in the store.
+    """
+    if store is None:
+        return decode_image(key)
+    return store.read(key)
 
-            if model_output == 1:
-                model_input = (training_np, generated_np)
-            else:
-                model_input = (generated_np, training_np)
 
-            yield (model_input, model_output)
+def finish_dataset(dataset: tf.data.Dataset, batch_size: Optional[int]) -> tf.data.Dataset:
+    """
+    Batches the decoded examples when batch_size is given,
+    and prefetches so that decoding overlaps with training.
+    """
+    if batch_size is not None:
+        dataset = dataset.batch(batch_size, num_parallel_calls=tf.data.AUTOTUNE)
 
-    return generator
+    return dataset.prefetch(tf.data.AUTOTUNE)
 
 
+# The builders below turn the metadata into tensors of paths once,
+# and decode the images with parallel map calls on all the cores.
 # See Tensorflow Dataset
-# https://www.tensorflow.org/api_docs/python/tf/data/Dataset
-def build_dataset_labeled_paired(metadata: pd.DataFrame):
-    image_signature = tf.TensorSpec(shape=(224, 224, 3), dtype=tf.float32)  # type: ignore
-
-    model_input = (image_signature, image_signature)
-    model_output = tf.TensorSpec(shape=(1,), dtype=tf.int32)  # type: ignore
-
-    dataset_signature = (model_input, model_output)
-
-    dataset = tf.data.Dataset.from_generator(
-        build_generator_labeled_paired(metadata), 
-        output_signature=dataset_signature
+# https://www.tensorflow.org/guide/data_performance#parallelizing_data_transformation
+def build_dataset_score_single(
+    dataset_dir: Text = 'fakenet_dataset',
+    batch_size: Optional[int] = None,
+    store: Optional[ImageStore] = None,
+) -> tf.data.Dataset:
+    """
+    Yields image A of each scoring pair, in the order of the metadata.
+
+    :param store: the ImageStore of score/images, to read the images without decoding
+    """
+    metadata = pd.read_csv(f'{dataset_dir}/score/metadata.csv')
+    keys = image_keys(metadata, 'file_name_a', f'{dataset_dir}/score/images', store)
+
+    # Use file_name_b instead if you want to compare the two images after inference.
+    dataset = tf.data.Dataset.from_tensor_slices(keys)
+    dataset = dataset.map(lambda key: read_image(key, store), num_parallel_calls=tf.data.AUTOTUNE)
+
+    return finish_dataset(dataset, batch_size)
+
+
+def pair_labels(n_rows: int, seed: Optional[int] = None, reshuffle_each_epoch: bool = True) -> tf.data.Dataset:
+    """
+    Yields one label of shape (1,) per training pair, 1 to keep the pair order and 0 to swap it.
+
+    All the labels of an epoch are drawn at once from a seed.
+    By default, like the per-pair random labels of the baseline, each epoch draws new labels:
+    a new seed is drawn from the given seed at the start of each epoch,
+    so the sequence of epochs is reproducible when a seed is given.
+    Without reshuffle_each_epoch, the same labels are repeated in every epoch.
+    """
+    epoch_seeds = tf.data.Dataset.random(seed=seed, rerandomize_each_iteration=reshuffle_each_epoch)
+
+    def draw_labels(epoch_seed):
+        return tf.random.stateless_uniform(
+            (n_rows, 1), seed=tf.stack([epoch_seed, 0]), minval=0, maxval=2, dtype=tf.int32
+        )
+
+    return epoch_seeds.take(1).map(draw_labels).flat_map(tf.data.Dataset.from_tensor_slices)
+
+
+def build_dataset_labeled_paired(
+    metadata: pd.DataFrame,
+    dataset_dir: Text = 'fakenet_dataset',
+    batch_size: Optional[int] = None,
+    seed: Optional[int] = None,
+    reshuffle_each_epoch: bool = True,
+    cache: Union[bool, Text] = False,
+    store: Optional[ImageStore] = None,
+) -> tf.data.Dataset:
+    """
+    Yields ((image_a, image_b), label) for each training pair,
+    where label 1 means image A is the training image, and 0 means it is the generated image.
+
+    The images are decoded in the order (training, generated), and can be cached in that order,
+    so that the epochs after the first only apply the swaps without decoding.
+
+    :param seed: makes the labels reproducible, see pair_labels
+    :param reshuffle_each_epoch: draws new labels for each epoch, otherwise repeats the labels of the first
+    :param cache: True to cache the decoded pairs in memory, or the path prefix of a cache on disk
+    :param store: the ImageStore of train/images, to read the images without decoding
+    """
+    images_dir = f'{dataset_dir}/train/images'
+    training_keys = image_keys(metadata, 'file_name_training', images_dir, store)
+    generated_keys = image_keys(metadata, 'file_name_generated', images_dir, store)
+
+    pairs = tf.data.Dataset.from_tensor_slices((training_keys, generated_keys))
+    pairs = pairs.map(
+        lambda training_key, generated_key: (read_image(training_key, store), read_image(generated_key, store)),
+        num_parallel_calls=tf.data.AUTOTUNE,
     )
-
-    return dataset
-
-
-# See Python Generator
-# https://peps.python.org/pep-0255/
-def build_generator_labeled_single(metadata: pd.DataFrame):
-    def generator():
-        for _, row in metadata.iterrows():
-            training_path = 'fakenet_dataset/train/images/' + row['file_name_training']
-            generated_path = 'fakenet_dataset/train/images/' + row['file_name_generated']
-
-            training_np = np.array(Image.open(training_path)).astype(np.float32)
-            generated_np = np.array(Image.open(generated_path)).astype(np.float32)
-
-            model_input = training_np
-            model_output = (1,)
-            yield (model_input, model_output)
-
-            model_input = generated_np
-            model_output = (0,)
-            yield (model_input, model_output)
-    return generator
-
-
-# See Tensorflow Dataset
-# https://www.tensorflow.org/api_docs/python/tf/data/Dataset
-def build_dataset_labeled_single(metadata: pd.DataFrame) -> tf.data.Dataset:
-    model_input = tf.TensorSpec(shape=(224, 224, 3), dtype=tf.float32)  # type: ignore
-    model_output = tf.TensorSpec(shape=(1,), dtype=tf.int32)  # type: ignore
-
-    dataset_signature = (model_input, model_output)
-
-    dataset = tf.data.Dataset.from_generator(
-        build_generator_labeled_single(metadata), 
-        output_signature=dataset_signature
+    if cache is not False:
+        pairs = pairs.cache('' if cache is True else cache)
+
+    def order_pair(pair, model_output):
+        training, generated = pair
+        keep = model_output[0] == 1
+        model_input = (tf.where(keep, training, generated), tf.where(keep, generated, training))
+        return model_input, model_output
+
+    labels = pair_labels(len(metadata), seed, reshuffle_each_epoch)
+    dataset = tf.data.Dataset.zip((pairs, labels))
+    dataset = dataset.map(order_pair, num_parallel_calls=tf.data.AUTOTUNE)
+
+    return finish_dataset(dataset, batch_size)
+
+
+def build_dataset_labeled_single(
+    metadata: pd.DataFrame,
+    dataset_dir: Text = 'fakenet_dataset',
+    batch_size: Optional[int] = None,
+    store: Optional[ImageStore] = None,
+) -> tf.data.Dataset:
+    """
+    Yields (image, label) for each image of the training pairs,
+    the training image with label 1 followed by the generated image with label 0.
+
+    :param store: the ImageStore of train/images, to read the images without decoding
+    """
+    images_dir = f'{dataset_dir}/train/images'
+    training_keys = image_keys(metadata, 'file_name_training', images_dir, store)
+    generated_keys = image_keys(metadata, 'file_name_generated', images_dir, store)
+
+    # Interleaves the two images of each row: training, generated, training, ...
+    keys = np.stack([training_keys, generated_keys], axis=1).ravel()
+    labels = np.tile(np.array([[1], [0]], dtype=np.int32), (len(metadata), 1))
+
+    dataset = tf.data.Dataset.from_tensor_slices((keys, labels))
+    dataset = dataset.map(
+        lambda key, label: (read_image(key, store), label),
+        num_parallel_calls=tf.data.AUTOTUNE,
     )
 
-    return dataset
-
-
-# See Python Generator
-# https://peps.python.org/pep-0255/
-def generator_score_paired():
-    metadata = pd.read_csv('fakenet_dataset/score/metadata.csv')
-
-    for _, row in metadata.iterrows():
-        image_a_path = 'fakenet_dataset/score/images/' + row['file_name_a']
-        image_b_path = 'fakenet_dataset/score/images/' + row['file_name_b']
-
-        image_a_np = np.array(Image.open(image_a_path))
-        image_b_np = np.array(Image.open(image_b_path))
-
-        model_input = (image_a_np, image_b_np)
-        yield (model_input,)
-
-
-# See Tensorflow Dataset
-# https://www.tensorflow.org/api_docs/python/tf/data/Dataset
-def build_dataset_score_paired():
-    image_signature = tf.TensorSpec(shape=(224, 224, 3), dtype=tf.float32)  # type: ignore
-
-    model_input = (image_signature, image_signature)
-
-    dataset_signature = (model_input,)
-
-    dataset = tf.data.Dataset.from_generator(
-        generator_score_paired, 
-        output_signature=dataset_signature
+    return finish_dataset(dataset, batch_size)
+
+
+def build_dataset_score_paired(
+    dataset_dir: Text = 'fakenet_dataset',
+    batch_size: Optional[int] = None,
+    store: Optional[ImageStore] = None,
+    decode_workers: Optional[int] = None,
+) -> tf.data.Dataset:
+    """
+    Yields ((image_a, image_b),) for each scoring pair, in the order of the metadata.
+
+    :param store: the ImageStore of score/images, to read the images without decoding
+    :param decode_workers: the number of pairs decoded in parallel, defaults to AUTOTUNE
+    """
+    metadata = pd.read_csv(f'{dataset_dir}/score/metadata.csv')
+    images_dir = f'{dataset_dir}/score/images'
+    keys_a = image_keys(metadata, 'file_name_a', images_dir, store)
+    keys_b = image_keys(metadata, 'file_name_b', images_dir, store)
+
+    dataset = tf.data.Dataset.from_tensor_slices((keys_a, keys_b))
+    dataset = dataset.map(
+        lambda key_a, key_b: ((read_image(key_a, store), read_image(key_b, store)),),
+        num_parallel_calls=decode_workers or tf.data.AUTOTUNE,
     )
 
-    return dataset
\ No newline at end of file
+    return finish_dataset(dataset, batch_size)
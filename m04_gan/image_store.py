@@ -0,0 +1,177 @@
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Sequence, Text, Tuple
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from numpy.lib.format import open_memmap
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp')
+
+
+def make_tmp_path(store_dir: Text, suffix: Text) -> Text:
+    """
+    Creates an empty file with a unique name in the store, to be written and then renamed.
+    """
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix='.tmp-', dir=store_dir)
+    os.close(fd)
+    return path
+
+
+class ImageStore:
+    """
+    Keeps the decoded pixels of all the images of a folder in one uint8 .npy file,
+    so that the dataset builders read them through a memory map instead of decoding PNGs.
+
+    The manifest lists the file name and modification time of the image behind each row.
+    Opening the store decodes only the images that are new or changed since the last time,
+    and every process and builder that opens it shares the same pages of the file.
+
+    The dataset builders read the rows in one of two ways.
+    Through tf.gather over a tensor of the whole store, which tf.data slices natively
+    in parallel, at the cost of one copy of the store in memory.
+    This is the default for the stores of at most max_in_memory_bytes.
+    Or through the memory map, which is not zero-copy: each image is copied
+    in a numpy_function that holds the GIL, but the resident memory stays
+    to the pages in use, so stores of any size can be read.
+    m04_gan/benchmark.py measures both as the memory and store pipelines.
+    """
+
+    # The rows copied at once from the previous store, to bound the memory when updating.
+    copy_chunk_rows = 256
+    # The largest store read from memory by default.
+    max_in_memory_bytes = 2 ** 30
+
+    def __init__(
+        self,
+        store_dir: Text,
+        images: np.ndarray,
+        manifest: pd.DataFrame,
+        in_memory: Optional[bool] = None,
+    ):
+        """
+        :param in_memory: copies the images into a tensor once, for read to slice with tf.gather,
+            defaults to True for the stores of at most max_in_memory_bytes
+        """
+        self.store_dir = store_dir
+        self.images = images
+        self.manifest = manifest
+        self.row_by_name = pd.Series(np.arange(len(manifest)), index=manifest['file_name'])
+
+        if in_memory is None:
+            in_memory = images.nbytes <= self.max_in_memory_bytes
+
+        self.pixels = None
+        if in_memory:
+            with tf.device('/CPU:0'):
+                self.pixels = tf.constant(images)
+
+    @classmethod
+    def open(
+        cls,
+        images_dir: Text,
+        store_dir: Optional[Text] = None,
+        image_shape: Tuple[int, int, int] = (224, 224, 3),
+        max_workers: Optional[int] = None,
+        in_memory: Optional[bool] = None,
+    ) -> 'ImageStore':
+        """
+        Opens the store of a folder of images, such as fakenet_dataset/train/images,
+        and brings it up to date with the folder.
+
+        The files are written under unique temporary names and then renamed,
+        so that processes updating the same store at once do not write into each other's files.
+
+        :param store_dir: the folder of the store, defaults to images_dir + '.decoded'
+        :param image_shape: the shape all the images are decoded to
+        :param max_workers: the number of decoding threads
+        :param in_memory: see ImageStore
+        """
+        if store_dir is None:
+            store_dir = images_dir.rstrip('/') + '.decoded'
+        os.makedirs(store_dir, exist_ok=True)
+
+        images_path = f'{store_dir}/images.npy'
+        manifest_path = f'{store_dir}/manifest.csv'
+
+        with os.scandir(images_dir) as entries:
+            current = pd.DataFrame(
+                [
+                    (e.name, e.stat().st_mtime_ns) for e in entries
+                    if e.is_file() and e.name.lower().endswith(IMAGE_EXTENSIONS)
+                ],
+                columns=['file_name', 'mtime_ns'],
+            )
+        current = current.sort_values('file_name', ignore_index=True)
+
+        previous = None
+        if os.path.exists(manifest_path) and os.path.exists(images_path):
+            previous = pd.read_csv(manifest_path)
+            if current.equals(previous):
+                return cls(store_dir, np.load(images_path, mmap_mode='r'), current, in_memory)
+
+        # Rows of the previous store that are still valid, -1 for the images to decode.
+        reused = np.full(len(current), -1)
+        if previous is not None:
+            previous_rows = pd.Series(np.arange(len(previous)), index=pd.MultiIndex.from_frame(previous))
+            reused = previous_rows.reindex(pd.MultiIndex.from_frame(current)).fillna(-1).to_numpy(int)
+
+        tmp_path = make_tmp_path(store_dir, '.npy')
+        images = open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=(len(current), *image_shape))
+
+        try:
+            kept = np.flatnonzero(reused >= 0)
+            if len(kept) > 0:
+                previous_images = np.load(images_path, mmap_mode='r')
+                for start in range(0, len(kept), cls.copy_chunk_rows):
+                    chunk = kept[start:start + cls.copy_chunk_rows]
+                    images[chunk] = previous_images[reused[chunk]]
+                del previous_images
+
+            def decode(row: int):
+                with Image.open(f"{images_dir}/{current['file_name'][row]}") as image:
+                    images[row] = np.asarray(image.convert('RGB')).reshape(image_shape)
+
+            stale = np.flatnonzero(reused < 0)
+            with ThreadPoolExecutor(max_workers) as executor:
+                list(executor.map(decode, stale))
+
+            logging.info(f'Decoded {len(stale)} images into {store_dir}, reused {len(kept)}')
+            images.flush()
+        except BaseException:
+            # A failed update leaves no partial file behind.
+            os.remove(tmp_path)
+            raise
+
+        del images
+        os.replace(tmp_path, images_path)
+
+        tmp_manifest_path = make_tmp_path(store_dir, '.csv')
+        current.to_csv(tmp_manifest_path, index=False)
+        os.replace(tmp_manifest_path, manifest_path)
+
+        return cls(store_dir, np.load(images_path, mmap_mode='r'), current, in_memory)
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    def rows(self, file_names: Sequence[Text]) -> np.ndarray:
+        """
+        Maps file names to the rows of the store. Raises KeyError for unknown names.
+        """
+        return self.row_by_name.loc[list(file_names)].to_numpy()
+
+    def read(self, row: tf.Tensor) -> tf.Tensor:
+        """
+        Reads one image inside a tf.data map, as float32 pixels in [0, 255].
+        """
+        if self.pixels is not None:
+            return tf.cast(tf.gather(self.pixels, row), tf.float32)
+
+        image = tf.numpy_function(lambda r: np.asarray(self.images[r]), [row], tf.uint8, stateful=False)
+        image = tf.ensure_shape(image, self.images.shape[1:])
+        return tf.cast(image, tf.float32)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import logging
+import os
+import time
+from typing import Dict, Text
+
+import clize
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from collegium.m04_gan.fakenet_dataset import build_dataset_score_paired
+
+
+def load_paired_model(model_path: Text) -> tf.keras.Model:
+    """
+    Loads a saved model, either a .keras file,
+    or the folder of the assignment with keras_model.json and keras_parameters.weights.h5.
+    """
+    if not os.path.isdir(model_path):
+        return tf.keras.models.load_model(model_path, compile=False)
+
+    with open(f'{model_path}/keras_model.json') as f:
+        model = tf.keras.models.model_from_json(f.read())
+    model.load_weights(f'{model_path}/keras_parameters.weights.h5')
+    return model
+
+
+def score_paired(
+    model_path: Text,
+    output_path: Text = 'fakenet_model/score_y_hat.parquet',
+    *,
+    dataset_dir: Text = 'fakenet_dataset',
+    batch_size: int = 64,
+    decode_workers: int = 0,
+) -> Dict[Text, float]:
+    """
+    Scores the pairs of the score segment with a saved paired model.
+
+    The pairs are decoded in parallel and prefetched by tf.data,
+    so decoding the next batches overlaps with the prediction of the current one.
+    The probabilities are written in the order of the score metadata,
+    with the 'probability' column expected by the assignment.
+
+    :param model_path: a .keras file, or a folder with keras_model.json and keras_parameters.weights.h5
+    :param output_path: a .parquet or .csv file
+    :param dataset_dir: the folder with score/metadata.csv and score/images
+    :param batch_size: the number of pairs per prediction
+    :param decode_workers: the number of pairs decoded in parallel, 0 for AUTOTUNE
+    :return: the number of pairs, the seconds, and the images per second
+    """
+    model = load_paired_model(model_path)
+    dataset = build_dataset_score_paired(
+        dataset_dir, batch_size=batch_size, decode_workers=decode_workers or None
+    )
+
+    start = time.perf_counter()
+    batches = []
+    for (model_input,) in dataset:
+        batches.append(np.asarray(model.predict_on_batch(model_input), dtype=np.float32))
+    seconds = time.perf_counter() - start
+
+    probabilities = np.concatenate(batches).reshape(-1)
+    score_y_hat = pd.DataFrame({'probability': probabilities})
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    if output_path.endswith('.csv'):
+        score_y_hat.to_csv(output_path, index=False)
+    else:
+        score_y_hat.to_parquet(output_path)
+
+    # Each pair is two images.
+    report = {
+        'pairs': len(score_y_hat),
+        'seconds': seconds,
+        'images_per_second': 2 * len(score_y_hat) / seconds,
+    }
+    logging.info(f'Scored {report["pairs"]} pairs in {seconds:.1f}s, '
+                 f'{report["images_per_second"]:.1f} images/s, to {output_path}')
+    return report
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, force=True)
+    clize.run(score_paired)
@@ -1,10 +1,10 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from PIL import Image
-import os
 import tensorflow as tf
 import pandas as pd
 
+from collegium.foundation.mosaic import plot_mosaic
+from collegium.foundation.video import make_run_folder, open_writer
+
 try:
     get_ipython().run_line_magic('config', 'InlineBackend.figure_format = "retina"')
 except:
@@ -23,40 +23,21 @@ def plot_strided_grid(images, ncols=5, nrows=5):
     idxs = np.linspace(0, n_images-1, n_cells)
     idxs = idxs.round().astype(int)
 
-    fig = plt.figure(figsize=[2*ncols, 2*nrows])
-    fig.subplots_adjust(hspace=0, wspace=0)
-
-    for cell_id, image_id in enumerate(idxs):
-        plt.subplot(nrows, ncols, cell_id+1)
-        plt.title(image_id)
-        plt.imshow(images[image_id])
-        plt.xticks([])
-        plt.yticks([])
-
-    plt.tight_layout()
+    plot_mosaic(np.asarray(images)[idxs], labels=idxs, ncols=ncols, padding=0)
     
 
-def save_images(images, prefix):
+def save_images(images, prefix, file_name='output.gif', fps=10):
     """
-    Saves the images to a local folder.
-    Use gif.sh script to animate the images.
+    Saves the images as an animation to a new numbered folder, such as {prefix}0/output.gif.
+    The format follows the file name: .gif, .webp or .mp4.
+
+    The frames are encoded on a background thread as they are passed,
+    so images can also be a generator of frames.
     """
-    
-    previous_folders = [
-        int(n.split(prefix)[1]) for n in os.listdir('.') 
-        if n.startswith(prefix)
-    ]
-
-    if len(previous_folders) > 0:
-        next_id = max(previous_folders) + 1
-    else:
-        next_id = 0
-
-    folder = f'{prefix}{next_id}'
-    os.system(f'mkdir -p {folder}')
-    
-    for idx, image in enumerate(images):
-        Image.fromarray(image.astype('uint8')).save(f'{folder}/{idx}.png')
+    folder = make_run_folder(prefix)
+
+    with open_writer(f'{folder}/{file_name}', fps) as writer:
+        writer.write_all(np.asarray(image).astype('uint8') for image in images)
 
-    print(f'Images are saved to {folder}')
-    return folder
\ No newline at end of file
+    print(f'Images are saved to {folder}/{file_name}')
+    return folder
@@ -0,0 +1,62 @@
+from unittest import TestCase
+import threading
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from collegium.foundation.callbacks import SampleGridCallback
+from collegium.foundation.video import FrameEncoder
+
+
+class ListEncoder(FrameEncoder):
+    def __init__(self):
+        super().__init__("frames")
+        self.frames = []
+
+    def write(self, frame):
+        self.frames.append(frame)
+
+    def close(self):
+        pass
+
+
+class SampleGridCallbackTest(TestCase):
+    def test_samples_every_n_steps(self):
+        generator = tf.keras.Sequential([
+            tf.keras.Input((2,)),
+            tf.keras.layers.Dense(4 * 4, activation="tanh"),
+            tf.keras.layers.Reshape((4, 4, 1)),
+        ])
+        latent = np.random.default_rng(0).normal(size=(6, 2)).astype(np.float32)
+
+        # Any model trains the generator here, the callback only samples it.
+        model = tf.keras.Sequential([tf.keras.Input((2,)), tf.keras.layers.Dense(1)])
+        model.compile(optimizer="sgd", loss="mse")
+
+        encoder = ListEncoder()
+        callback = SampleGridCallback(generator, latent, every_n_steps=3, encoder=encoder,
+                                      value_range=(-1, 1), ncols=3)
+        model.fit(np.zeros((10, 2)), np.zeros((10, 1)), batch_size=1, epochs=1, verbose=0,
+                  callbacks=[callback])
+
+        self.assertEqual(3, len(encoder.frames))
+        # 2 rows and 3 columns of 4x4 tiles with 1 pixel of padding, as RGB.
+        self.assertEqual((11, 16, 3), encoder.frames[0].shape)
+        self.assertEqual(np.uint8, encoder.frames[0].dtype)
+
+        expected = np.clip((generator.predict_on_batch(latent) + 1) / 2 * 255, 0, 255).astype(np.uint8)
+        self.assertTrue(np.array_equal(expected[1, :, :, 0], encoder.frames[-1][1:5, 6:10, 0]))
+
+        # The writer thread is shut down after each fit, and started again by the next.
+        self.assertIsNone(callback.executor)
+        threads = threading.active_count()
+        model.fit(np.zeros((6, 2)), np.zeros((6, 1)), batch_size=1, epochs=1, verbose=0,
+                  callbacks=[callback])
+        self.assertEqual(5, len(encoder.frames))
+        self.assertIsNone(callback.executor)
+        self.assertLessEqual(threading.active_count(), threads)
+
+
+if __name__ == "__main__":
+    unittest.main()
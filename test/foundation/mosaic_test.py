@@ -0,0 +1,29 @@
+from unittest import TestCase
+import unittest
+
+import numpy as np
+
+from collegium.foundation.mosaic import tile_mosaic, rescale_sigmoid
+
+
+class MosaicTest(TestCase):
+    def test_tile_mosaic(self):
+        tiles = np.arange(3 * 2 * 2, dtype=np.uint8).reshape(3, 2, 2)
+        actual = tile_mosaic(tiles, ncols=2, padding=1)
+
+        self.assertEqual((7, 7), actual.shape)
+        self.assertTrue((tiles[0] == actual[1:3, 1:3]).all())
+        self.assertTrue((tiles[1] == actual[1:3, 4:6]).all())
+        self.assertTrue((tiles[2] == actual[4:6, 1:3]).all())
+        self.assertTrue((actual[4:6, 4:6] == 255).all())
+
+    def test_rescale_sigmoid(self):
+        x = np.stack([np.zeros((2, 2)), np.array([[-1, 1], [-1, 1]])])
+        actual = rescale_sigmoid(x, axis=(1, 2))
+
+        self.assertTrue(np.allclose(actual[0], 0.5))
+        self.assertTrue(np.allclose(actual[1], 1 / (1 + np.exp(-x[1]))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+from unittest import TestCase
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from collegium.foundation.video import BackgroundEncoder, FrameEncoder, make_run_folder, open_writer
+
+
+class FailingEncoder(FrameEncoder):
+    def write(self, frame):
+        raise ValueError("broken")
+
+    def close(self):
+        pass
+
+
+class VideoTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_encoders_implement_write_and_close(self):
+        with self.assertRaises(TypeError):
+            FrameEncoder("frames.gif")
+
+    def test_open_writer_gif(self):
+        path = f"{self.tmp.name}/frames.gif"
+        frame = np.zeros((8, 10, 3), dtype=np.uint8)
+
+        with open_writer(path, fps=5, max_queue=2) as writer:
+            for i in range(5):
+                # The writer copies the frame, so the buffer can be reused.
+                frame[:] = i * 50
+                writer.write(frame)
+
+        with Image.open(path) as gif:
+            self.assertEqual(5, gif.n_frames)
+            self.assertEqual((10, 8), gif.size)
+            gif.seek(4)
+            self.assertEqual((200, 200, 200), gif.convert("RGB").getpixel((0, 0)))
+
+    def test_errors_are_raised(self):
+        # The error is raised by a later write or by close, whichever comes first.
+        with self.assertRaises(RuntimeError):
+            with BackgroundEncoder(FailingEncoder("failing.gif"), max_queue=1) as writer:
+                writer.write_all(np.zeros((3, 4, 4, 3)))
+
+    def test_make_run_folder(self):
+        os.makedirs(f"{self.tmp.name}/run3")
+        os.makedirs(f"{self.tmp.name}/run3_old")
+
+        self.assertEqual(f"{self.tmp.name}/run4", make_run_folder("run", self.tmp.name))
+        self.assertEqual(f"{self.tmp.name}/run5", make_run_folder("run", self.tmp.name))
+        self.assertTrue(os.path.isdir(f"{self.tmp.name}/run5"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+from unittest import TestCase
+import tempfile
+import unittest
+
+import numpy as np
+
+from collegium.m02_cnn.utils.ann_index import IVFIndex, benchmark, exact_search
+from collegium.m02_cnn.utils.clip_embeddings import normalize
+
+
+class IVFIndexTest(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x = normalize(rng.normal(size=(500, 16)))
+        self.queries = normalize(rng.normal(size=(20, 16)))
+
+    def test_all_lists_is_exact(self):
+        index = IVFIndex.build(self.x, n_lists=8, seed=0, dtype=np.float32)
+        self.assertEqual(500, len(index))
+        self.assertEqual(list(range(500)), sorted(index.ids.tolist()))
+
+        actual, actual_scores = index.search(self.queries, k=5, nprobe=8)
+        expected, expected_scores = exact_search(self.x, self.queries, k=5)
+
+        self.assertEqual(expected.tolist(), actual.tolist())
+        self.assertTrue(np.allclose(expected_scores, actual_scores, atol=1e-5))
+
+    def test_few_vectors(self):
+        # The default of 4 * sqrt(10) lists is more than the 10 vectors.
+        index = IVFIndex.build(self.x[:10], seed=0, dtype=np.float32)
+        self.assertEqual(10, len(index.centroids))
+
+        actual, _ = index.search(self.queries, k=3, nprobe=10)
+        expected, _ = exact_search(self.x[:10], self.queries, k=3)
+        self.assertEqual(expected.tolist(), actual.tolist())
+
+        with self.assertRaises(ValueError):
+            IVFIndex.build(self.x[:10], n_lists=11)
+
+    def test_save_load(self):
+        index = IVFIndex.build(self.x, n_lists=8, seed=0)
+        with tempfile.TemporaryDirectory() as workdir:
+            index.save(workdir)
+            loaded = IVFIndex.load(workdir)
+
+            self.assertIsInstance(loaded.vectors, np.memmap)
+            self.assertEqual(index.search(self.queries, 3, 2)[0].tolist(), loaded.search(self.queries, 3, 2)[0].tolist())
+
+    def test_benchmark(self):
+        index = IVFIndex.build(self.x, n_lists=8, seed=0)
+        report = benchmark(index, self.x, self.queries, k=5, nprobes=[1, 8])
+
+        self.assertEqual(["exact", 1, 8], report.index.tolist())
+        self.assertLessEqual(report.loc[1, "recall"], report.loc[8, "recall"])
+        self.assertGreater(report.loc[8, "recall"], 0.9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+from unittest import TestCase
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from collegium.m02_cnn.utils.clip_embeddings import EmbeddingStore, image_hash, top_k
+
+
+class TinyEncoder:
+    """
+    Stands in for CLIP with random weights, and counts the encoded images.
+    """
+
+    def __init__(self, dim: int = 8):
+        self.image_model = tf.keras.Sequential([
+            tf.keras.Input((4, 4, 3)),
+            tf.keras.layers.Flatten(),
+            tf.keras.layers.Dense(dim),
+        ])
+        self.text_embedding = tf.keras.layers.Embedding(100, dim)
+        self.encoded_count = 0
+
+    def encode_images(self, images):
+        self.encoded_count += len(images)
+        return self.image_model.predict_on_batch(np.asarray(images, dtype=np.float32))
+
+    def encode_texts(self, captions):
+        ids = np.array([sum(map(ord, caption)) % 100 for caption in captions])
+        return self.text_embedding(ids).numpy()
+
+
+class EmbeddingStoreTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.images = np.random.default_rng(0).integers(0, 256, size=(10, 4, 4, 3), dtype=np.uint8)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_top_k(self):
+        scores = np.array([[0.1, 0.9, 0.3, 0.7], [5, 4, 3, 2]])
+        idxs, top_scores = top_k(scores, 2)
+        self.assertEqual([[1, 3], [0, 1]], idxs.tolist())
+        self.assertEqual([[0.9, 0.7], [5, 4]], top_scores.tolist())
+
+    def test_images_are_encoded_once(self):
+        encoder = TinyEncoder()
+        store = EmbeddingStore(self.tmp.name)
+
+        rows = store.add(self.images[:6], encoder, batch_size=4)
+        self.assertEqual(list(range(6)), rows.tolist())
+
+        # Reopened from disk, with duplicates and new images.
+        store = EmbeddingStore(self.tmp.name)
+        rows = store.add(np.concatenate([self.images[4:], self.images[:2]]), encoder, batch_size=4)
+
+        self.assertEqual([4, 5, 6, 7, 8, 9, 0, 1], rows.tolist())
+        self.assertEqual(10, encoder.encoded_count)
+        self.assertEqual(np.float16, store.embeddings.dtype)
+        self.assertTrue(np.allclose(1, np.linalg.norm(store.embeddings.astype(np.float32), axis=1), atol=1e-3))
+        self.assertEqual(store.rows([image_hash(self.images[3])]).tolist(), [3])
+
+    def test_images_stream_in_batches(self):
+        encoder = TinyEncoder()
+        store = EmbeddingStore(self.tmp.name)
+        consumed = []
+
+        def stream():
+            # Duplicates across the batches are encoded once.
+            for i in [0, 1, 2, 0, 3, 1, 4]:
+                consumed.append(i)
+                yield self.images[i]
+
+        encode_images = encoder.encode_images
+        consumed_at_encode = []
+        encoder.encode_images = lambda images: consumed_at_encode.append(len(consumed)) or encode_images(images)
+
+        rows = store.add(stream(), encoder, batch_size=3)
+
+        self.assertEqual([0, 1, 2, 0, 3, 1, 4], rows.tolist())
+        self.assertEqual(5, encoder.encoded_count)
+        self.assertEqual([3, 6, 7], consumed_at_encode)
+
+    def test_search_matches_brute_force(self):
+        encoder = TinyEncoder()
+        store = EmbeddingStore(self.tmp.name)
+        store.add(self.images, encoder)
+
+        texts = encoder.encode_texts(["a person", "a horse", "an airplane"])
+        idxs, scores = store.search(texts, k=3)
+
+        image_embeddings = store.embeddings.astype(np.float32)
+        text_embeddings = texts / np.linalg.norm(texts, axis=1, keepdims=True)
+        expected = np.argsort(-(text_embeddings @ image_embeddings.T), axis=1)[:, :3]
+        self.assertEqual(expected.tolist(), idxs.tolist())
+
+        probs = store.classify(texts)
+        self.assertEqual((10, 3), probs.shape)
+        self.assertTrue(np.allclose(1, probs.sum(axis=1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
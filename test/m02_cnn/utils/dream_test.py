@@ -0,0 +1,72 @@
+from unittest import TestCase
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from collegium.foundation.video import FrameEncoder
+from collegium.m02_cnn.utils.dream import DeepDream
+
+
+class ListEncoder(FrameEncoder):
+    def __init__(self):
+        super().__init__("frames")
+        self.frames = []
+
+    def write(self, frame):
+        self.frames.append(frame)
+        self.frame_count += 1
+
+    def close(self):
+        pass
+
+
+class DeepDreamTest(TestCase):
+    def setUp(self):
+        model = tf.keras.Sequential([
+            tf.keras.Input((None, None, 3)),
+            tf.keras.layers.Conv2D(4, 3, padding="same", activation="relu", name="conv"),
+        ])
+        self.deep_dream = DeepDream(model, ["conv"], preprocess=lambda x: x / 255, tile_size=8)
+        self.image = np.random.default_rng(0).integers(0, 256, size=(12, 10, 3)).astype(np.uint8)
+
+    def test_dream(self):
+        dreamed = self.deep_dream.dream(self.image, steps_per_octave=2, octaves=(-1, 0), seed=0)
+
+        self.assertEqual(self.image.shape, dreamed.shape)
+        self.assertEqual(np.uint8, dreamed.dtype)
+        self.assertFalse(np.array_equal(self.image, dreamed))
+
+    def test_dream_zoom(self):
+        encoder = ListEncoder()
+        frames = list(self.deep_dream.dream_zoom(
+            self.image, n_frames=3, encoder=encoder, steps_per_octave=1, octaves=(0,), seed=0
+        ))
+
+        self.assertEqual(3, len(frames))
+        self.assertEqual(3, encoder.frame_count)
+        for frame, written in zip(frames, encoder.frames):
+            self.assertEqual(self.image.shape, frame.shape)
+            self.assertTrue(np.array_equal(frame, written))
+
+    def test_dream_zoom_shifts_differ_between_frames(self):
+        shifts = []
+        step = self.deep_dream._step
+
+        def record_step(image, shift, step_size):
+            shifts.append(shift.numpy().tolist())
+            return step(image, shift, step_size)
+
+        self.deep_dream._step = record_step
+        list(self.deep_dream.dream_zoom(self.image, n_frames=2, steps_per_octave=3, octaves=(0,), seed=0))
+        self.assertNotEqual(shifts[:3], shifts[3:])
+
+        # The same seed dreams the same frames again.
+        first = shifts
+        shifts = []
+        list(self.deep_dream.dream_zoom(self.image, n_frames=2, steps_per_octave=3, octaves=(0,), seed=0))
+        self.assertEqual(first, shifts)
+
+
+if __name__ == "__main__":
+    unittest.main()
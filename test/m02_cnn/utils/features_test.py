@@ -0,0 +1,61 @@
+from unittest import TestCase
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from collegium.m02_cnn.utils.features import FeatureExtractor, load_features
+
+
+class FeatureExtractorTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+        inputs = tf.keras.Input((6, 6, 3))
+        conv = tf.keras.layers.Conv2D(4, 3, padding="same", activation="tanh", name="conv")(inputs)
+        pooled = tf.keras.layers.GlobalAveragePooling2D(name="pool")(conv)
+        outputs = tf.keras.layers.Dense(5, name="logits")(pooled)
+        self.model = tf.keras.Model(inputs, outputs)
+
+        # 5 images in batches of 2, so the last batch is partial.
+        self.images = np.random.default_rng(0).uniform(-1, 1, size=(5, 6, 6, 3)).astype(np.float32)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_run(self):
+        extractor = FeatureExtractor(self.model, ["conv", "pool"])
+        features = extractor.run(self.images, self.tmp.name, batch_size=2)
+
+        self.assertEqual({"conv", "pool"}, set(features))
+        self.assertEqual((5, 6, 6, 4), features["conv"].shape)
+        self.assertEqual((5, 4), features["pool"].shape)
+        self.assertEqual(np.float16, features["conv"].dtype)
+
+        pool = tf.keras.Model(self.model.inputs[0], self.model.get_layer("pool").output)
+        expected = pool(self.images).numpy()
+        loaded = load_features(self.tmp.name)
+        self.assertEqual(["conv", "pool"], sorted(loaded))
+        self.assertTrue(np.array_equal(features["pool"], loaded["pool"]))
+        self.assertTrue(np.allclose(expected, loaded["pool"], atol=1e-3))
+
+    def test_gradients(self):
+        extractor = FeatureExtractor(self.model, ["conv"], gradients=True)
+        features = extractor.run(self.images, self.tmp.name, batch_size=2, dtype="float32")
+
+        self.assertEqual({"conv", "conv_grad", "input_grad"}, set(features))
+        self.assertEqual(self.images.shape, features["input_grad"].shape)
+        self.assertEqual(np.float32, features["input_grad"].dtype)
+
+        for name in ["conv_grad", "input_grad"]:
+            grads = np.asarray(features[name])
+            # Every image, including the partial last batch, has a gradient.
+            self.assertTrue((np.abs(grads).reshape(5, -1).max(axis=1) > 0).all())
+
+        loaded = load_features(self.tmp.name, ["input_grad"])
+        self.assertTrue(np.array_equal(features["input_grad"], loaded["input_grad"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+from unittest import TestCase
+import unittest
+
+import numpy as np
+
+from collegium.m02_cnn.utils.label_maps import LabelMap, load_label_map
+
+
+class LabelMapTest(TestCase):
+    def test_round_trip(self):
+        label_map = LabelMap([3, 1, 7], ["cat", "dog", "bird"])
+
+        names = label_map.to_names(np.array([[7, 3], [1, 1]]))
+        self.assertEqual([["bird", "cat"], ["dog", "dog"]], names.tolist())
+        self.assertEqual([[7, 3], [1, 1]], label_map.to_ids(names).tolist())
+
+    def test_unknown(self):
+        label_map = LabelMap([3, 1, 7], ["cat", "dog", "bird"])
+
+        with self.assertRaises(KeyError):
+            label_map.to_names([2])
+        with self.assertRaises(KeyError):
+            label_map.to_names([100])
+        with self.assertRaises(KeyError):
+            label_map.to_ids(["fish"])
+
+    def test_duplicate_names_map_to_the_first(self):
+        label_map = LabelMap([5, 2, 9, 4], ["crane", "heron", "crane", "stork"])
+        self.assertEqual([5, 2, 5, 4], label_map.to_ids(["crane", "heron", "crane", "stork"]).tolist())
+
+        # The names of both ids still round-trip from the ids.
+        self.assertEqual(["crane", "crane"], label_map.to_names([5, 9]).tolist())
+
+        # ImageNet has two classes named "crane", the bird and the machine.
+        imagenet = load_label_map("imagenet")
+        self.assertEqual(["crane", "crane"], imagenet.to_names([134, 517]).tolist())
+        self.assertEqual([134], imagenet.to_ids(["crane"]).tolist())
+
+    def test_load_label_map(self):
+        self.assertEqual(1000, len(load_label_map("imagenet")))
+        self.assertEqual(80, len(load_label_map("mscoco")))
+        self.assertEqual(["person"], load_label_map("mscoco").to_names([1]).tolist())
+        self.assertIs(load_label_map("pascalvoc"), load_label_map("pascalvoc"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+from unittest import TestCase
+import unittest
+
+import numpy as np
+
+from collegium.m02_cnn.utils.plot import draw_boxes, draw_boxes_batch
+
+
+class DrawBoxesTest(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.images = rng.integers(0, 256, size=(3, 64, 80, 3), dtype=np.uint8)
+        # A different number of boxes per image, as [xmin, ymin, width, height] in pixels.
+        self.boxes = [
+            np.array([[4, 30, 20, 20]]),
+            np.array([[10, 30, 30, 20], [40, 35, 30, 25]]),
+            np.zeros((0, 4)),
+        ]
+        self.class_names = [["cat"], ["dog", "person"], []]
+        self.scores = [[0.9], [0.05, 0.8], []]
+
+    def test_low_scores_are_not_drawn(self):
+        actual = draw_boxes(self.images[1], self.boxes[1], self.class_names[1], [0.05, 0.09], min_score=0.1)
+        self.assertTrue(np.array_equal(self.images[1], actual))
+
+        actual = draw_boxes(self.images[1], self.boxes[1], self.class_names[1], self.scores[1], min_score=0.1)
+        self.assertEqual(self.images[1].shape, actual.shape)
+        self.assertFalse(np.array_equal(self.images[1], actual))
+
+    def test_batch_equals_single(self):
+        actual = draw_boxes_batch(self.images, self.boxes, self.class_names, self.scores, max_workers=2)
+
+        self.assertEqual(self.images.shape, actual.shape)
+        for i in range(len(self.images)):
+            expected = draw_boxes(self.images[i], self.boxes[i], self.class_names[i], self.scores[i])
+            self.assertTrue(np.array_equal(expected, actual[i]))
+
+        # No boxes at all.
+        self.assertTrue(np.array_equal(self.images[2], actual[2]))
+
+
+if __name__ == "__main__":
+    unittest.main()
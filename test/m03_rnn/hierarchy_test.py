@@ -0,0 +1,35 @@
+from unittest import TestCase
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from collegium.m03_rnn.hierarchy import Hierarchy
+
+
+class HierarchyTest(TestCase):
+    def setUp(self):
+        ids = pd.DataFrame({"store_id": ["A", "A", "B"], "item_id": ["x", "y", "x"]})
+        self.hierarchy = Hierarchy(ids, levels=[[], ["store_id"], ["store_id", "item_id"]])
+
+    def test_aggregate(self):
+        bottom = np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]])
+        actual = self.hierarchy.aggregate(bottom)
+
+        expected = np.array([[9, 12], [4, 6], [5, 6], [1, 2], [3, 4], [5, 6]])
+        self.assertTrue((expected == actual).all())
+        self.assertEqual((2, "A"), self.hierarchy.index[1])
+
+    def test_wrmsse(self):
+        train = np.array([[0.0, 1.0, 3.0], [1.0, 1.0, 2.0], [2.0, 4.0, 2.0]])
+        actual = np.array([[3.0], [2.0], [2.0]])
+
+        scores = self.hierarchy.wrmsse(train, actual, actual)
+        self.assertTrue(np.allclose(0, scores))
+
+        weights = self.hierarchy.weights(np.array([1.0, 1.0, 2.0]))
+        self.assertTrue(np.allclose([1, 0.5, 0.5, 0.25, 0.25, 0.5], weights))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+from unittest import TestCase
+import glob
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from collegium.m03_rnn.ingest import ingest_m4, ingest_m5, to_int16
+
+
+class IngestTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dataset_dir = f"{self.tmp.name}/m5"
+        self.workdir = f"{self.tmp.name}/workdir"
+
+        os.makedirs(self.dataset_dir)
+
+        pd.DataFrame({
+            "date": ["2011-01-29", "2011-01-30", "2011-01-31"],
+            "wm_yr_wk": [11101, 11101, 11101],
+            "d": ["d_1", "d_2", "d_3"],
+        }).to_csv(f"{self.dataset_dir}/calendar.csv", index=False)
+
+        # Three series, so chunks of 2 write two parts.
+        pd.DataFrame({
+            "id": ["FOODS_1_CA_1", "FOODS_2_CA_1", "HOBBIES_1_TX_1"],
+            "item_id": ["FOODS_1", "FOODS_2", "HOBBIES_1"],
+            "dept_id": ["FOODS_1", "FOODS_2", "HOBBIES_1"],
+            "cat_id": ["FOODS", "FOODS", "HOBBIES"],
+            "store_id": ["CA_1", "CA_1", "TX_1"],
+            "state_id": ["CA", "CA", "TX"],
+            "d_1": [0, 1, 2],
+            "d_2": [3, 4, 5],
+            "d_3": [6, 7, 300],
+        }).to_csv(f"{self.dataset_dir}/sales_train_evaluation.csv", index=False)
+
+        # Series of lengths 3, 1 and 2, padded with empty values.
+        with open(f"{self.tmp.name}/Daily-train.csv", "w") as f:
+            f.write('"V1","V2","V3","V4"\n"D1",1.5,2.5,3.5\n"D2",4.5,,\n"D3",5.5,6.5,\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_ingest_m5(self):
+        segment = ingest_m5(self.dataset_dir, self.workdir, chunksize=2)
+        parts = sorted(glob.glob(f"{self.workdir}/m5_y.parquet/part-*.parquet"))
+        self.assertEqual(2, len(parts))
+
+        # The parts share the dictionary of the ids.
+        first, second = [pd.read_parquet(part) for part in parts]
+        self.assertEqual(first["cat_id"].cat.categories.tolist(), second["cat_id"].cat.categories.tolist())
+        self.assertEqual(["FOODS", "HOBBIES"], first["cat_id"].cat.categories.tolist())
+        self.assertEqual(np.int16, first["sales"].dtype)
+
+        y = segment["y"]
+        self.assertEqual(["sample", "time"], list(y.index.names))
+        self.assertEqual(9, len(y))
+        self.assertEqual(np.int16, y["sales"].dtype)
+        self.assertEqual(300, y.loc[("HOBBIES_1_TX_1", pd.Timestamp("2011-01-31")), "sales"])
+        self.assertEqual(
+            pd.to_datetime(["2011-01-29", "2011-01-30", "2011-01-31"]).tolist(),
+            y.loc["FOODS_2_CA_1"].index.tolist(),
+        )
+        self.assertEqual([1, 4, 7], y.loc["FOODS_2_CA_1", "sales"].tolist())
+
+    def test_ingest_m5_overflow(self):
+        sales_path = f"{self.dataset_dir}/sales_train_evaluation.csv"
+        sales = pd.read_csv(sales_path)
+        sales.loc[0, "d_2"] = 40000
+        sales.to_csv(sales_path, index=False)
+
+        with self.assertRaises(ValueError):
+            ingest_m5(self.dataset_dir, self.workdir, chunksize=2)
+
+    def test_to_int16(self):
+        self.assertEqual(np.int16, to_int16(np.array([-32768, 32767])).dtype)
+        with self.assertRaises(ValueError):
+            to_int16(np.array([32768]))
+
+    def test_ingest_m4(self):
+        segment = ingest_m4(f"{self.tmp.name}/Daily-train.csv", self.workdir, "daily", chunksize=2)
+        self.assertEqual(2, len(glob.glob(f"{self.workdir}/daily_y.parquet/part-*.parquet")))
+
+        y = segment["y"]
+        self.assertEqual(["sample", "time"], list(y.index.names))
+        # The padding is dropped.
+        self.assertEqual(6, len(y))
+        self.assertFalse(y["value"].isna().any())
+        self.assertEqual([0, 1], y.loc["D3"].index.tolist())
+        self.assertEqual([5.5, 6.5], y.loc["D3", "value"].tolist())
+        self.assertEqual([4.5], y.loc["D2", "value"].tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
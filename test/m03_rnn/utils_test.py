@@ -0,0 +1,418 @@
+from unittest import TestCase
+import re
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import matplotlib
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import sklearn.metrics
+
+from collegium.m03_rnn import utils
+from collegium.m03_rnn.utils import (
+    to_regression_shape,
+    to_panel_shape,
+    panel_to_ndarray,
+    LeastSquares,
+    evaluate_forecast,
+    evaluate_forecasts,
+    R2Score,
+    MeanError,
+    ForecastMetrics,
+    RegressionSegment,
+    Segment,
+    SegmentDataset,
+    baseline_metrics,
+    compare_datasets,
+    forecast_constant,
+    forecast_mean,
+    forecast_regression,
+    fit_regression,
+    predict_constant,
+    predict_mean,
+    SeriesSlicer,
+    page_forecasts,
+)
+
+matplotlib.use("Agg")
+
+
+def build_panel(samples, sequence_length: int) -> pd.DataFrame:
+    index = pd.MultiIndex.from_product(
+        [samples, pd.date_range("2020-01-01", periods=sequence_length, freq="h")],
+        names=["sample", "time"],
+    )
+    values = np.arange(len(index) * 2, dtype="float64").reshape(-1, 2)
+    return pd.DataFrame(values, index=index, columns=["temperature", "humidity"])
+
+
+class ReshapeTest(TestCase):
+    def test_to_regression_shape(self):
+        panel = build_panel(["b", "a"], 3)
+        actual = to_regression_shape(panel, 3)
+
+        self.assertEqual(["a", "b"], actual.index.tolist())
+        self.assertEqual(("temperature", 0), actual.columns[0])
+        self.assertEqual([6, 8, 10, 7, 9, 11], actual.loc["a"].tolist())
+
+    def test_round_trip(self):
+        panel = build_panel(["a", "b", "c"], 4)
+        actual = to_panel_shape(to_regression_shape(panel, 4))
+
+        self.assertTrue((panel.to_numpy() == actual.to_numpy()).all())
+        self.assertEqual(["sample", "time"], list(actual.index.names))
+
+    def test_panel_to_ndarray_view(self):
+        panel = build_panel(["a", "b"], 3)[["temperature"]]
+        actual = panel_to_ndarray(panel, 3)
+
+        self.assertEqual((2, 3, 1), actual.shape)
+        self.assertTrue(np.shares_memory(actual, panel.to_numpy()))
+
+
+class SegmentTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.workdir = self.tmp.name
+        self.x = build_panel(["a", "b", "c"], 4)
+        self.y = build_panel(["a", "b", "c"], 2) * 10
+
+        dataset = SegmentDataset()
+        for name in ["train", "val"]:
+            dataset[name] = RegressionSegment(name)
+            dataset[name]["x"] = self.x
+            dataset[name]["y"] = self.y
+        dataset.to_pq_workdir(self.workdir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lazy(self):
+        segment = Segment.from_pq_workdir(self.workdir, "train", ["x", "y"])
+        self.assertEqual({}, segment.frames)
+        self.assertEqual(["x", "y"], segment.frame_names())
+
+        # Nothing was read yet, so the frame is read from the file as it is on first access.
+        (self.x + 1).to_parquet(f"{self.workdir}/train_x.parquet")
+        self.assertTrue((self.x + 1).equals(segment["x"]))
+        self.assertEqual(["y"], list(segment.sources))
+
+    def test_concurrent_access_reads_once(self):
+        segment = Segment.from_pq_workdir(self.workdir, "train", ["x"])
+        source = mock.Mock(wraps=segment.sources["x"])
+        segment.sources["x"] = source
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            frames = list(executor.map(lambda _: segment["x"], range(16)))
+
+        self.assertEqual(1, source.call_count)
+        self.assertTrue(all(frame is frames[0] for frame in frames))
+
+    def test_different_frames_are_read_concurrently(self):
+        segment = Segment.from_pq_workdir(self.workdir, "train", ["x", "y"])
+        # Each read waits for the other, which only returns when they run at the same time.
+        barrier = threading.Barrier(2, timeout=10)
+        for name in ["x", "y"]:
+            source = segment.sources[name]
+            segment.sources[name] = lambda source=source: barrier.wait() is not None and source()
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            x, y = executor.map(lambda name: segment[name], ["x", "y"])
+
+        self.assertTrue(self.x.equals(x))
+        self.assertTrue(self.y.equals(y))
+
+    def test_failed_read_can_be_retried(self):
+        segment = Segment.from_pq_workdir(self.workdir, "train", ["x"])
+        source = segment.sources["x"]
+        segment.sources["x"] = mock.Mock(side_effect=[OSError("unavailable"), source()])
+
+        with self.assertRaises(OSError):
+            segment["x"]
+        self.assertTrue(self.x.equals(segment["x"]))
+
+    def test_columns(self):
+        segment = Segment.from_pq_workdir(self.workdir, "train", ["x"], columns=["temperature"])
+
+        self.assertEqual(["temperature"], segment["x"].columns.tolist())
+        self.assertEqual(["sample", "time"], list(segment["x"].index.names))
+        self.assertTrue(self.x[["temperature"]].equals(segment["x"]))
+
+    def test_filters(self):
+        segment = Segment.from_pq_workdir(
+            self.workdir, "train", ["x"], filters=[("sample", "in", ["a", "c"])]
+        )
+        self.assertEqual(["a", "c"], segment["x"].index.unique("sample").tolist())
+        self.assertTrue(self.x.loc[["a", "c"]].equals(segment["x"]))
+
+    def test_eager(self):
+        segment = Segment.from_pq_workdir(self.workdir, "train", ["x", "y"], lazy=False)
+        self.assertEqual({}, segment.sources)
+        self.assertTrue(self.y.equals(segment.frames["y"]))
+
+    def test_dataset_load(self):
+        dataset = SegmentDataset.from_pq_workdir(self.workdir, ["train", "val"], ["x", "y"])
+        self.assertEqual(["x", "y"], list(dataset["val"].sources))
+
+        dataset = SegmentDataset.from_pq_workdir(self.workdir, ["train", "val"], ["x", "y"], lazy=False)
+        for name in ["train", "val"]:
+            self.assertEqual({}, dataset[name].sources)
+            self.assertTrue(self.x.equals(dataset[name].frames["x"]))
+            self.assertTrue(self.y.equals(dataset[name].frames["y"]))
+
+
+class BaselinesTest(TestCase):
+    def build_dataset(self, samples) -> SegmentDataset:
+        rng = np.random.default_rng(0)
+        dataset = SegmentDataset()
+        for name in ["train", "val"]:
+            x = build_panel(samples, 4)
+            x[:] = rng.standard_normal(x.shape)
+            y = build_panel(samples, 4)[["temperature"]]
+            y[:] = rng.standard_normal(y.shape)
+
+            dataset[name] = RegressionSegment(name)
+            dataset[name]["x"] = x
+            dataset[name]["y"] = y
+        return dataset
+
+    def assert_baselines_match(self, dataset: SegmentDataset):
+        expected = compare_datasets(dataset, {
+            "mean": forecast_mean(dataset, 4),
+            "constant": forecast_constant(dataset, 4),
+            "regression": forecast_regression(dataset, 4),
+        })
+        actual = baseline_metrics(dataset)
+
+        self.assertTrue(np.allclose(expected.to_numpy(), actual[expected.columns].to_numpy()))
+
+    def test_no_segments(self):
+        self.assertTrue(baseline_metrics(SegmentDataset()).empty)
+
+    def test_predict_series(self):
+        lags = build_panel(["b", "a"], 3)["temperature"]
+
+        mean = predict_mean(lags, 2)
+        self.assertEqual(["b", "b", "a", "a"], mean.index.tolist())
+        self.assertEqual([2.0, 2.0, 8.0, 8.0], mean.tolist())
+
+        constant = predict_constant(lags)
+        self.assertEqual(["b"] * 3 + ["a"] * 3, constant.index.tolist())
+        self.assertEqual(lags.tolist(), constant.tolist())
+
+    def test_fit_regression_in_batches(self):
+        dataset = self.build_dataset([f"s{i:02d}" for i in range(20)])
+        full = fit_regression(dataset["train"], 4, ridge=1.0)
+
+        with mock.patch("collegium.m03_rnn.utils.ndarray_design", wraps=utils.ndarray_design) as design:
+            batched = fit_regression(dataset["train"], 4, ridge=1.0, batch_size=6)
+
+        self.assertTrue(np.allclose(full.coef, batched.coef))
+        # The design is built batch by batch.
+        self.assertEqual([6, 6, 6, 2], [call.args[0].shape[0] for call in design.call_args_list])
+
+    def test_sorted_panel(self):
+        self.assert_baselines_match(self.build_dataset([f"s{i:02d}" for i in range(20)]))
+
+    def test_unsorted_panel(self):
+        samples = [f"s{i:02d}" for i in np.random.default_rng(1).permutation(20)]
+        dataset = self.build_dataset(samples)
+        self.assert_baselines_match(dataset)
+
+        # The forecasts follow the rows of the target panel.
+        mean_hat = forecast_mean(dataset, 4)["val"]["y"]
+        self.assertTrue(mean_hat.index.equals(dataset["val"]["y"].index))
+        expected = dataset["val"]["x"]["temperature"].groupby("sample").mean()
+        self.assertAlmostEqual(expected[samples[0]], mean_hat["temperature"].iloc[0])
+
+        constant_hat = forecast_constant(dataset, 4)["val"]["y"]
+        self.assertTrue(np.array_equal(
+            dataset["val"]["x"]["temperature"].to_numpy(), constant_hat["temperature"].to_numpy()
+        ))
+
+
+class PlotForecastsTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        # Unsorted samples.
+        samples = ["e", "b", "d", "a", "c"]
+        self.past = build_panel(samples, 6)["temperature"]
+        future = build_panel(samples, 8)["temperature"]
+        self.future = future[future.index.get_level_values(1) >= "2020-01-01 06:00"]
+        self.forecast = self.future + 1
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_series_slicer(self):
+        slicer = SeriesSlicer(self.past)
+        self.assertTrue(slicer.is_date)
+        self.assertEqual(["a", "b", "c", "d", "e"], slicer.labels.tolist())
+
+        for sample in ["d", "a"]:
+            (xy,) = slicer[[sample]]
+            expected = self.past.loc[sample]
+            self.assertEqual(mdates.date2num(expected.index).tolist(), xy[:, 0].tolist())
+            self.assertEqual(expected.tolist(), xy[:, 1].tolist())
+
+        with self.assertRaises(KeyError):
+            slicer[["z"]]
+
+    def test_page_forecasts_pdf(self):
+        path = f"{self.tmp.name}/forecasts.pdf"
+        # 5 samples on pages of 2 x 1.
+        n_pages = page_forecasts(self.past, self.future, self.forecast, path, cols=2, rows=1, side_inches=1)
+        self.assertEqual(3, n_pages)
+
+        with open(path, "rb") as f:
+            content = f.read()
+        self.assertEqual(3, len(re.findall(rb"/Type\s*/Page\b", content)))
+
+    def test_page_forecasts_png(self):
+        path = f"{self.tmp.name}/forecasts.png"
+        n_pages = page_forecasts(
+            self.past, self.future, self.forecast, path, samples=["a", "c", "e"],
+            cols=1, rows=2, side_inches=1, dpi=50,
+        )
+        self.assertEqual(2, n_pages)
+
+        # Each page is rows * side_inches * dpi pixels high.
+        sprite = plt.imread(path)
+        self.assertEqual((2 * 2 * 50, 1 * 50), sprite.shape[:2])
+
+
+class LeastSquaresTest(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x = np.hstack([rng.standard_normal((200, 5)), np.ones((200, 1))])
+        self.coef = rng.standard_normal((6, 3))
+        self.y = self.x @ self.coef
+
+    def test_fit(self):
+        model = LeastSquares().fit(self.x, self.y)
+        self.assertTrue(np.allclose(self.coef, model.coef))
+        self.assertTrue(np.allclose(self.y, model.predict(self.x)))
+
+    def test_update(self):
+        model = LeastSquares()
+        for start in range(0, 200, 64):
+            model.update(self.x[start:start + 64], self.y[start:start + 64])
+        model.solve()
+        self.assertTrue(np.allclose(self.coef, model.coef))
+
+    def test_ridge(self):
+        model = LeastSquares(ridge=1e6).fit(self.x, self.y)
+        self.assertTrue(np.allclose(0, model.coef[:-1], atol=1e-2))
+        self.assertTrue(np.isclose(self.y.mean(axis=0), model.coef[-1], atol=1e-2).all())
+
+
+class EvaluateForecastsTest(TestCase):
+    def test_evaluate_forecasts(self):
+        rng = np.random.default_rng(0)
+        index = pd.MultiIndex.from_product([["a", "b", "c"], range(5)], names=["sample", "time"])
+        future = pd.Series(rng.standard_normal(len(index)), index=index)
+        forecasts = pd.Series(rng.standard_normal(len(index)), index=index)
+
+        actual = evaluate_forecasts(future, forecasts)
+
+        for sample in ["a", "b", "c"]:
+            expected = evaluate_forecast(future.loc[sample], forecasts.loc[sample], sample)
+            self.assertTrue(np.allclose(expected.loc[sample], actual.loc[sample, expected.columns]))
+
+    def test_constant_series(self):
+        # A large mean and no variance, where y^2 - (sum y)^2 / n cancels to noise.
+        index = pd.MultiIndex.from_product([["a", "b"], range(28)], names=["sample", "time"])
+        future = pd.Series(280.3, index=index)
+        forecasts = pd.Series(np.where(index.get_level_values(0) == "a", 280.31, 280.3), index=index)
+
+        # Fed in chunks that split the samples.
+        metrics = ForecastMetrics()
+        for chunk in np.array_split(np.arange(len(index)), 5):
+            metrics.update(future.iloc[chunk], forecasts.iloc[chunk])
+        actual = metrics.result()
+
+        # Same as sklearn on an exactly constant target: 0 unless predicted exactly.
+        self.assertEqual(0.0, actual.loc["a", "R2"])
+        self.assertEqual(1.0, actual.loc["b", "R2"])
+
+    def test_chunks_match_single_update(self):
+        rng = np.random.default_rng(1)
+        index = pd.MultiIndex.from_product([["a", "b", "c"], range(20)], names=["sample", "time"])
+        future = pd.Series(rng.standard_normal(len(index)) + 1e4, index=index)
+        forecasts = pd.Series(rng.standard_normal(len(index)) + 1e4, index=index)
+
+        metrics = ForecastMetrics()
+        for chunk in np.array_split(rng.permutation(len(index)), 4):
+            metrics.update(future.iloc[chunk], forecasts.iloc[chunk])
+
+        self.assertTrue(np.allclose(evaluate_forecasts(future, forecasts), metrics.result()))
+
+    def test_mase(self):
+        index = pd.MultiIndex.from_product([["a"], range(4)], names=["sample", "time"])
+        past = pd.Series([1.0, 2.0, 4.0, 7.0], index=index)
+        future = pd.Series([8.0, 9.0], index=index[:2])
+        forecasts = pd.Series([7.0, 7.0], index=index[:2])
+
+        actual = evaluate_forecasts(future, forecasts, past=past)
+
+        # MAE = 1.5, mean absolute naive error = (1 + 2 + 3) / 3 = 2
+        self.assertAlmostEqual(0.75, actual.loc["a", "MASE"])
+
+
+class StreamingMetricsTest(TestCase):
+    def test_batches(self):
+        rng = np.random.default_rng(0)
+        y_true = rng.standard_normal((100, 4)) + 20
+        y_hat = y_true + rng.standard_normal((100, 4))
+
+        r2, me = R2Score(), MeanError()
+        for batch in np.array_split(np.arange(100), 7):
+            r2.update_state(y_true[batch], y_hat[batch])
+            me.update_state(y_true[batch], y_hat[batch])
+
+        expected_r2 = sklearn.metrics.r2_score(y_true.ravel(), y_hat.ravel())
+        self.assertAlmostEqual(expected_r2, float(r2.result()), places=5)
+        self.assertAlmostEqual((y_hat - y_true).mean(), float(me.result()), places=5)
+
+        r2.reset_state()
+        r2.update_state(y_true, y_true)
+        self.assertAlmostEqual(1, float(r2.result()), places=5)
+
+    def test_large_mean(self):
+        rng = np.random.default_rng(2)
+        y_true = rng.standard_normal((100, 4)) * 1e-3 + 1e6
+        y_hat = y_true + rng.standard_normal((100, 4)) * 1e-4
+
+        r2 = R2Score()
+        for batch in np.array_split(np.arange(100), 7):
+            r2.update_state(y_true[batch], y_hat[batch])
+
+        expected_r2 = sklearn.metrics.r2_score(y_true.ravel(), y_hat.ravel())
+        self.assertAlmostEqual(expected_r2, float(r2.result()), places=4)
+
+    def test_sample_weight(self):
+        rng = np.random.default_rng(1)
+        y_true = rng.standard_normal((100, 4)) + 20
+        y_hat = y_true + rng.standard_normal((100, 4)) + 0.5
+        # One weight per sample, shared by its horizons.
+        weights = rng.uniform(0, 2, size=100)
+
+        r2, me = R2Score(), MeanError()
+        for batch in np.array_split(np.arange(100), 7):
+            r2.update_state(y_true[batch], y_hat[batch], sample_weight=weights[batch])
+            me.update_state(y_true[batch], y_hat[batch], sample_weight=weights[batch])
+
+        flat_weights = np.repeat(weights, 4)
+        expected_r2 = sklearn.metrics.r2_score(y_true.ravel(), y_hat.ravel(), sample_weight=flat_weights)
+        self.assertAlmostEqual(expected_r2, float(r2.result()), places=5)
+        expected_me = np.average((y_hat - y_true).ravel(), weights=flat_weights)
+        self.assertAlmostEqual(expected_me, float(me.result()), places=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+from unittest import TestCase
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from collegium.m03_rnn.windows import StreamingScaler, WindowGenerator, window_starts
+
+
+class WindowsTest(TestCase):
+    def test_window_starts(self):
+        # Series of lengths 5, 1 and 8.
+        actual = window_starts(np.array([0, 5, 6, 14]), window=3, stride=2)
+        self.assertEqual([0, 2, 6, 8, 10], actual.tolist())
+
+    def test_streaming_scaler(self):
+        x = np.random.default_rng(0).standard_normal((1000, 3)) * [1, 2, 0] + [0, 5, 7]
+        scaler = StreamingScaler().fit(np.array_split(x, 7))
+
+        self.assertTrue(np.allclose(x.mean(axis=0), scaler.mean_))
+        self.assertTrue(np.allclose(x.var(axis=0), scaler.var_))
+        self.assertEqual(1, scaler.scale_[2])
+
+    def test_dataset(self):
+        index = pd.MultiIndex.from_product([["b", "a"], range(6)], names=["sample", "time"])
+        panel = pd.DataFrame({"sales": np.arange(12, dtype="float32")}, index=index)
+
+        generator = WindowGenerator(panel, lags=3, horizon=2, target_column="sales")
+        x, y = next(iter(generator.dataset(batch_size=10, shuffle=False)))
+
+        self.assertEqual(4, len(generator))
+        self.assertEqual((4, 3, 1), tuple(x.shape))
+        # Series "a" comes first, and its values start at 6.
+        self.assertEqual([7, 8, 9], x[1, :, 0].numpy().tolist())
+        self.assertEqual([10, 11], y[1].numpy().tolist())
+
+    def test_scaled_dataset(self):
+        index = pd.MultiIndex.from_product([["a", "b"], range(6)], names=["sample", "time"])
+        panel = pd.DataFrame({"sales": np.arange(12, dtype="float32")}, index=index)
+
+        generator = WindowGenerator(panel, lags=3, horizon=2, target_column="sales")
+        self.assertTrue(np.allclose(panel.to_numpy().mean(), generator.fit_scaler(chunk_size=5).mean_))
+
+        x, y = next(iter(generator.dataset(batch_size=10, shuffle=False)))
+        self.assertTrue(np.allclose(generator.scaler.transform(panel.to_numpy()[:3]).ravel(), x[0, :, 0]))
+        # The target is not scaled.
+        self.assertEqual([3, 4], y[0].numpy().tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
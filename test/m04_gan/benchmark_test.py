@@ -0,0 +1,52 @@
+from unittest import TestCase
+import json
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from collegium.m04_gan.benchmark import count_images, measure, run_benchmark
+
+
+class BenchmarkTest(TestCase):
+    def test_measure(self):
+        images = np.zeros((5, 224, 224, 3), dtype=np.float32)
+        dataset = tf.data.Dataset.from_tensor_slices(((images, images), np.zeros((5, 1)))).batch(2)
+
+        self.assertEqual(4, count_images(next(iter(dataset))))
+
+        result = measure(dataset, epochs=2)
+        self.assertEqual(6, result['elements'])
+        self.assertEqual(20, result['images'])
+        self.assertLessEqual(result['latency_p50_ms'], result['latency_p99_ms'])
+        self.assertGreater(result['peak_rss_mb'], 0)
+        self.assertGreaterEqual(result['peak_rss_delta_mb'], 0)
+        self.assertLessEqual(result['peak_rss_delta_mb'], result['peak_rss_mb'])
+
+    def test_measure_empty(self):
+        dataset = tf.data.Dataset.from_tensor_slices(np.zeros((0, 224, 224, 3), dtype=np.float32)).batch(2)
+
+        result = measure(lambda: dataset)
+        self.assertEqual(0, result['elements'])
+        self.assertEqual(0, result['images'])
+        self.assertTrue(np.isnan(result['latency_p50_ms']))
+
+    def test_run_benchmark(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = f'{tmp_dir}/report.json'
+            run_benchmark(output_path, n_pairs=4, batch_size=2, epochs=1)
+
+            with open(output_path) as f:
+                report = json.load(f)
+
+        pipelines = {r['pipeline']: r for r in report['results']}
+        self.assertIn('labeled_paired/decode', pipelines)
+        self.assertIn('score_single/store', pipelines)
+        self.assertEqual(8, pipelines['score_paired/memory']['images'])
+        self.assertEqual(8, pipelines['labeled_paired/cache']['images'])
+        self.assertEqual(4, pipelines['score_single/decode']['images'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+from unittest import TestCase
+import unittest
+
+import numpy as np
+
+from collegium.m04_gan.catalogue import find_prompts, load_biggan_classes, load_stable_diffusion_prompts
+
+
+class CatalogueTest(TestCase):
+    def test_biggan_classes(self):
+        classes = load_biggan_classes()
+        self.assertIs(classes, load_biggan_classes())
+
+        self.assertEqual(1000, len(classes))
+        self.assertEqual("tench, Tinca tinca", classes.to_names([0])[0])
+        actual = classes.to_ids(["tench", "goldfish", "tench, Tinca tinca", "toilet paper"])
+        self.assertEqual([0, 1, 0, 999], actual.tolist())
+        self.assertEqual([3, 7], classes.to_ids(np.array([3, 7])).tolist())
+
+        with self.assertRaises(KeyError):
+            classes.to_ids(["not a class"])
+        with self.assertRaises(KeyError):
+            classes.to_ids([1000])
+
+    def test_one_hot_and_embed(self):
+        classes = load_biggan_classes()
+        one_hot = classes.one_hot(["goldfish", "stingray"])
+
+        self.assertEqual((2, 1000), one_hot.shape)
+        self.assertEqual([1, 6], np.argmax(one_hot, axis=1).tolist())
+        self.assertEqual(2, one_hot.sum())
+
+        embeddings = np.random.default_rng(0).normal(size=(1000, 4))
+        self.assertTrue(np.allclose(one_hot @ embeddings, classes.embed(["goldfish", "stingray"], embeddings)))
+
+    def test_prompts(self):
+        self.assertEqual(
+            ["a", "b"],
+            find_prompts("p = 'a'\nmodel.text_to_image(prompt=\"b\", seed=1)\nq = 'c'"),
+        )
+
+        prompts = load_stable_diffusion_prompts()
+        self.assertIn("pine forest, brown bear, illustration, oil painting", prompts.names.tolist())
+        self.assertEqual([0], prompts.to_ids(["A beautiful horse running through a field"]).tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+from unittest import TestCase
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from collegium.m04_gan.fakenet_dataset import (
+    build_dataset_labeled_paired,
+    build_dataset_labeled_single,
+    build_dataset_score_paired,
+    pair_labels,
+)
+from collegium.m04_gan.image_store import ImageStore
+
+
+def write_fakenet_dir(dataset_dir, n_rows=3):
+    """
+    Writes a tiny fakenet_dataset where the pixels of each image equal its number.
+    """
+    for split in ['train', 'score']:
+        os.makedirs(f'{dataset_dir}/{split}/images')
+
+    for i in range(2 * n_rows):
+        image = np.full((224, 224, 3), i, dtype=np.uint8)
+        for split in ['train', 'score']:
+            Image.fromarray(image).save(f'{dataset_dir}/{split}/images/{i}.png')
+
+    train = pd.DataFrame({
+        'file_name_training': [f'{2 * i}.png' for i in range(n_rows)],
+        'file_name_generated': [f'{2 * i + 1}.png' for i in range(n_rows)],
+    })
+    score = pd.DataFrame({
+        'file_name_a': [f'{2 * i}.png' for i in range(n_rows)],
+        'file_name_b': [f'{2 * i + 1}.png' for i in range(n_rows)],
+    })
+    train.to_csv(f'{dataset_dir}/train/metadata.csv', index=False)
+    score.to_csv(f'{dataset_dir}/score/metadata.csv', index=False)
+    return train
+
+
+class FakenetDatasetTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dataset_dir = self.tmp.name
+        self.metadata = write_fakenet_dir(self.dataset_dir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_labeled_paired(self):
+        dataset = build_dataset_labeled_paired(self.metadata, self.dataset_dir, batch_size=2)
+        (a, b), y = next(iter(dataset))
+
+        self.assertEqual((2, 224, 224, 3), tuple(a.shape))
+        self.assertEqual((2, 1), tuple(y.shape))
+
+        # The label is 1 when image A is the training image, which has the even number.
+        a_is_training = a.numpy()[:, 0, 0, 0] % 2 == 0
+        self.assertEqual(a_is_training.astype(int).tolist(), y.numpy()[:, 0].tolist())
+        pairs = np.sort(np.stack([a.numpy()[:, 0, 0, 0], b.numpy()[:, 0, 0, 0]], axis=1), axis=1)
+        self.assertEqual([[0, 1], [2, 3]], pairs.tolist())
+
+    def test_pair_labels_are_seeded(self):
+        def epochs(dataset):
+            return [[int(y[0]) for y in dataset] for _ in range(2)]
+
+        fixed = epochs(pair_labels(64, seed=1, reshuffle_each_epoch=False))
+        self.assertEqual(fixed[0], fixed[1])
+        self.assertEqual(fixed, epochs(pair_labels(64, seed=1, reshuffle_each_epoch=False)))
+
+        reshuffled = epochs(pair_labels(64, seed=1))
+        self.assertNotEqual(reshuffled[0], reshuffled[1])
+        self.assertEqual(reshuffled, epochs(pair_labels(64, seed=1)))
+
+        # Without a seed, each epoch draws new labels, like the baseline.
+        unseeded = epochs(pair_labels(64))
+        self.assertNotEqual(unseeded[0], unseeded[1])
+
+    def test_labeled_paired_cache(self):
+        dataset = build_dataset_labeled_paired(self.metadata, self.dataset_dir, seed=0, cache=True)
+        first = [(a.numpy(), int(y[0])) for (a, _), y in dataset]
+
+        # The second epoch reads the decoded pairs from the cache.
+        for file_name in os.listdir(f'{self.dataset_dir}/train/images'):
+            os.remove(f'{self.dataset_dir}/train/images/{file_name}')
+        second = [(a.numpy(), int(y[0])) for (a, _), y in dataset]
+
+        # The labels are drawn again, and still match the cached pairs:
+        # 1 when image A is the training image, which has the even number.
+        for epoch in [first, second]:
+            self.assertEqual([int(a[0, 0, 0] % 2 == 0) for a, _ in epoch], [y for _, y in epoch])
+
+    def test_labeled_single(self):
+        examples = list(build_dataset_labeled_single(self.metadata, self.dataset_dir))
+
+        pixels = [int(x[0, 0, 0]) for x, _ in examples]
+        labels = [int(y[0]) for _, y in examples]
+        self.assertEqual(list(range(6)), pixels)
+        self.assertEqual([1, 0, 1, 0, 1, 0], labels)
+
+    def test_score_paired_keeps_metadata_order(self):
+        examples = list(build_dataset_score_paired(self.dataset_dir))
+        pixels = [(int(a[0, 0, 0]), int(b[0, 0, 0])) for ((a, b),) in examples]
+        self.assertEqual([(0, 1), (2, 3), (4, 5)], pixels)
+
+    def test_builders_read_the_store(self):
+        store = ImageStore.open(f'{self.dataset_dir}/train/images')
+        decoded = list(build_dataset_labeled_single(self.metadata, self.dataset_dir))
+        stored = list(build_dataset_labeled_single(self.metadata, self.dataset_dir, store=store))
+
+        for (x, y), (x_stored, y_stored) in zip(decoded, stored):
+            self.assertTrue(np.array_equal(x.numpy(), x_stored.numpy()))
+            self.assertEqual(int(y[0]), int(y_stored[0]))
+
+        score_store = ImageStore.open(f'{self.dataset_dir}/score/images')
+        ((a, b),) = next(iter(build_dataset_score_paired(self.dataset_dir, batch_size=3, store=score_store)))
+        self.assertEqual((3, 224, 224, 3), tuple(a.shape))
+        self.assertEqual([1, 3, 5], b.numpy()[:, 0, 0, 0].astype(int).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
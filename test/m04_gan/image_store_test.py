@@ -0,0 +1,96 @@
+from unittest import TestCase
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+from collegium.m04_gan.image_store import ImageStore
+
+
+class ImageStoreTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.images_dir = f'{self.tmp.name}/images'
+        os.makedirs(self.images_dir)
+
+        # The pixels of each image equal its number.
+        for i in range(6):
+            Image.fromarray(np.full((224, 224, 3), i, dtype=np.uint8)).save(f'{self.images_dir}/{i}.png')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_open_decodes_only_changed_images(self):
+        store = ImageStore.open(self.images_dir)
+        self.assertEqual(6, len(store))
+        self.assertEqual([2, 2, 2], store.images[store.rows(['2.png'])][0, 0, 0].tolist())
+
+        # Nothing changed, so the store is not written again.
+        images_path = f'{store.store_dir}/images.npy'
+        written = os.stat(images_path).st_mtime_ns
+        ImageStore.open(self.images_dir)
+        self.assertEqual(written, os.stat(images_path).st_mtime_ns)
+
+        Image.fromarray(np.full((224, 224, 3), 9, dtype=np.uint8)).save(f'{self.images_dir}/2.png')
+        os.utime(f'{self.images_dir}/2.png', ns=(0, 0))
+
+        store = ImageStore.open(self.images_dir)
+        self.assertEqual(9, store.images[store.rows(['2.png'])[0], 0, 0, 0])
+        self.assertEqual(3, store.images[store.rows(['3.png'])[0], 0, 0, 0])
+
+    def test_open_skips_other_files(self):
+        with open(f'{self.images_dir}/.DS_Store', 'wb') as f:
+            f.write(b'\0' * 16)
+        os.makedirs(f'{self.images_dir}/thumbnails')
+
+        store = ImageStore.open(self.images_dir)
+        self.assertEqual(6, len(store))
+        self.assertNotIn('.DS_Store', store.manifest['file_name'].tolist())
+
+    def test_open_copies_the_previous_store_in_chunks(self):
+        ImageStore.open(self.images_dir)
+        Image.fromarray(np.full((224, 224, 3), 7, dtype=np.uint8)).save(f'{self.images_dir}/7.png')
+
+        with mock.patch.object(ImageStore, 'copy_chunk_rows', 4):
+            store = ImageStore.open(self.images_dir)
+
+        numbers = [0, 1, 2, 3, 4, 5, 7]
+        self.assertEqual(numbers, store.images[store.rows([f'{i}.png' for i in numbers]), 0, 0, 0].tolist())
+
+    def test_read_in_memory(self):
+        mapped = ImageStore.open(self.images_dir, in_memory=False)
+        in_memory = ImageStore.open(self.images_dir, in_memory=True)
+        self.assertIsNone(mapped.pixels)
+
+        rows = tf.data.Dataset.from_tensor_slices(mapped.rows(['4.png', '1.png']))
+        for store in [mapped, in_memory]:
+            images = [image.numpy() for image in rows.map(store.read, num_parallel_calls=2)]
+            self.assertEqual(tf.float32, store.read(tf.constant(0)).dtype)
+            self.assertEqual([4.0, 1.0], [image[0, 0, 0] for image in images])
+            self.assertEqual((224, 224, 3), images[0].shape)
+
+    def test_in_memory_by_default_when_small(self):
+        self.assertIsNotNone(ImageStore.open(self.images_dir).pixels)
+
+        with mock.patch.object(ImageStore, 'max_in_memory_bytes', 224 * 224 * 3):
+            self.assertIsNone(ImageStore.open(self.images_dir).pixels)
+
+    def test_concurrent_updates(self):
+        store_dir = f'{self.tmp.name}/store'
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            stores = list(executor.map(lambda _: ImageStore.open(self.images_dir, store_dir), range(4)))
+
+        # Every update wrote its own temporary files, and renamed them.
+        self.assertEqual(['images.npy', 'manifest.csv'], sorted(os.listdir(store_dir)))
+        rows = [f'{i}.png' for i in range(6)]
+        for store in stores:
+            self.assertEqual(list(range(6)), store.images[store.rows(rows), 0, 0, 0].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+from unittest import TestCase
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from PIL import Image
+
+from collegium.m04_gan.score import score_paired
+
+
+def build_paired_model() -> tf.keras.Model:
+    inputs = [tf.keras.layers.Input((224, 224, 3)), tf.keras.layers.Input((224, 224, 3))]
+    outputs = tf.keras.layers.Concatenate(axis=-1)(inputs)
+    outputs = tf.keras.layers.GlobalAveragePooling2D()(outputs)
+    outputs = tf.keras.layers.Dense(1, activation='sigmoid')(outputs)
+    return tf.keras.models.Model(inputs=inputs, outputs=outputs)
+
+
+class ScoreTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dataset_dir = f'{self.tmp.name}/fakenet_dataset'
+        os.makedirs(f'{self.dataset_dir}/score/images')
+
+        rng = np.random.default_rng(0)
+        self.images = rng.integers(0, 256, size=(10, 224, 224, 3), dtype=np.uint8)
+        for i, image in enumerate(self.images):
+            Image.fromarray(image).save(f'{self.dataset_dir}/score/images/{i}.png')
+
+        pd.DataFrame({
+            'file_name_a': [f'{i}.png' for i in range(0, 10, 2)],
+            'file_name_b': [f'{i}.png' for i in range(1, 10, 2)],
+        }).to_csv(f'{self.dataset_dir}/score/metadata.csv', index=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_score_paired(self):
+        model = build_paired_model()
+        model_dir = f'{self.tmp.name}/fakenet_model'
+        os.makedirs(model_dir)
+        with open(f'{model_dir}/keras_model.json', 'w') as f:
+            f.write(model.to_json())
+        model.save_weights(f'{model_dir}/keras_parameters.weights.h5')
+
+        output_path = f'{self.tmp.name}/score_y_hat.csv'
+        report = score_paired(model_dir, output_path, dataset_dir=self.dataset_dir, batch_size=2,
+                              decode_workers=2)
+
+        expected = model.predict_on_batch(
+            [self.images[0::2].astype(np.float32), self.images[1::2].astype(np.float32)]
+        )[:, 0]
+        score_y_hat = pd.read_csv(output_path)
+
+        self.assertEqual(['probability'], score_y_hat.columns.tolist())
+        self.assertTrue(np.allclose(expected, score_y_hat['probability'], atol=1e-6))
+        self.assertEqual(5, report['pairs'])
+        self.assertGreater(report['images_per_second'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()